@@ -7,11 +7,18 @@ import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D
 import torch
 import numpy as np
-from sim import Env, ReplayMemory
+from sim import Env, get_replay_memory, RolloutWorkers, train_from_workers, Evaluator, get_trace, get_trace_store
+from sim.render import BoardRenderer
+from sim.checkpoint import CheckpointManager, get_checkpoint, restore_checkpoint
 from sim.agents.multiagents import AgentMADDPG
-from utils import Config, Metrics, compute_discounted_return, train, test, make_gif
+from sim.agents.policy import BatchedPolicy
+from sim.agents.learner import MultiAgentMADDPGLearner
+from utils import Config, Metrics, compute_discounted_return, train, test, make_gif, get_learning_scheduler
 
 config = Config('config/')
+resume = config.learning.resume
+if resume:  # Goes on with the build with its own config
+    config = Config(os.path.join(resume, "config"))
 
 if not config.save_build:
     plt.ion()
@@ -22,22 +29,28 @@ else:
 device_type = "cuda" if torch.cuda.is_available() and config.learning.cuda else "cpu"
 device = torch.device(device_type)
 
+assert config.save_build or not resume, "Only a saved build can be resumed."
 if config.save_build:
-    name = datetime.today().strftime('%Y-%m-%d %H:%M:%S') if not config.build_name else config.build_name
-    root_path = os.path.abspath(config.learning.save_folder + '/' + name)
+    if resume:  # From its last checkpoint
+        root_path = os.path.abspath(resume)
+    else:
+        name = datetime.today().strftime('%Y-%m-%d %H:%M:%S') if not config.build_name else config.build_name
+        root_path = os.path.abspath(config.learning.save_folder + '/' + name)
     model_path = os.path.join(root_path, "models")
     path_figure = os.path.join(root_path, "figs")
-    os.makedirs(model_path)
-    os.makedirs(path_figure)
-    shutil.copytree(os.path.abspath('config/'), os.path.join(root_path, 'config'))
+    path_traces = os.path.join(root_path, "traces")
+    if not resume:
+        os.makedirs(model_path)
+        os.makedirs(path_figure)
+        shutil.copytree(os.path.abspath('config/'), os.path.join(root_path, 'config'))
 
 print("Using", device_type)
 
 number_agents = config.agents.number_predators + config.agents.number_preys
 # Definition of the agents
-agents = [AgentMADDPG("predator", "predator-{}".format(k), device, config.agents)
+agents = [AgentMADDPG("predator", "predator-{}".format(k), device, config.agents, config)
           for k in range(config.agents.number_predators)]
-agents += [AgentMADDPG("prey", "prey-{}".format(k), device, config.agents)
+agents += [AgentMADDPG("prey", "prey-{}".format(k), device, config.agents, config)
            for k in range(config.agents.number_preys)]
 
 metrics = []
@@ -54,60 +67,98 @@ for agent in agents:
         agent.load(path)
 
 env = Env(config.env, config)
-shared_memory = ReplayMemory(config.replay_memory.size)
 # Add agents to the environment
 for k in range(len(agents)):
     env.add_agent(agents[k], position=None)
     agents[k].add_agents(agents, k)
 
+replay_path = os.path.join(root_path, "replay") if config.save_build else None
+shared_memory = get_replay_memory(config.replay_memory, replay_path, env.encoder)
+# Draws the actions of all the agents at once
+policy = BatchedPolicy(agents)
+# Computes the target actions once per batch and trains all the agents in one step
+learner = None
+if config.learning.fused_learner:
+    learner = MultiAgentMADDPGLearner(agents)
+    learner_path = os.path.abspath(os.path.join(config.learning.model_path, "learner.pth"))
+    if config.learning.use_model and os.path.exists(learner_path):
+        learner.load(learner_path)
+# When the agents learn
+scheduler = get_learning_scheduler(config.learning)
+# Episodes of the run, rendered offline by render.py
+trace_store = get_trace_store(env, path_traces) if config.save_build else None
+# Writes the state of the training in the background
+checkpoints = None
+if config.save_build:
+    checkpoints = CheckpointManager(os.path.join(root_path, "checkpoints"), config.learning.checkpoint_every,
+                                    config.learning.keep_checkpoints, config.learning.async_checkpoints)
+start_episode = 0
+if resume:
+    checkpoint = checkpoints.load()
+    if checkpoint is not None:
+        start_episode = restore_checkpoint(checkpoint, agents, learner, shared_memory, scheduler, metrics,
+                                           collision_metric, trace_store)
+        print("Resuming at episode", start_episode)
+# Processes playing the training episodes
+workers = None
+if config.learning.n_workers:
+    workers = RolloutWorkers(agents, config, config.learning.n_workers, agents_type="maddpg",
+                             compact=shared_memory.encoder is not None)
+    workers.start()
+# Plays the test episodes
+evaluator = Evaluator(agents, config, config.learning.n_episode_in_test, config.learning.n_eval_processes,
+                      config.learning.async_evaluation)
+
 fig_board = plt.figure(0, figsize=(10, 10))
 if config.env.world_3D:
     ax_board = fig_board.gca(projection="3d")
 else:
     ax_board = fig_board.gca()
 
+# Only the agents and the switch are redrawn at each frame
+board_renderer = BoardRenderer(env, ax_board)
+
 fig_losses_returns, ((ax_losses, ax_losses_actor), (ax_returns, ax_collisions)) = plt.subplots(2, 2, figsize=(20, 10))
 
 plt.show()
 
 action_dim = 7 if config.env.world_3D else 5
 start = time.time()
-path_figure_episode = None
 progress_bar = None
-for episode in range(config.learning.n_episodes):
-    if not episode % config.learning.plot_episodes_every:
+for episode in range(start_episode, config.learning.n_episodes):
+    if progress_bar is None or not episode % config.learning.plot_episodes_every:
         if progress_bar is not None:
             progress_bar.close()
         progress_bar = tqdm(total=config.learning.plot_episodes_every)
 
     # Test step
+    evaluator.collect(metrics, collision_metric)
     if not episode % config.learning.test_every:
-        for test_episode in range(config.learning.n_episode_in_test):
-            test(env, agents, collision_metric, metrics, config)
+        evaluator.run(metrics, collision_metric)
 
     # Plot step
     if not episode % config.learning.plot_episodes_every or not episode % config.learning.save_episodes_every:
-        all_states, all_rewards, all_types = test(env, agents, collision_metric, metrics, config)
-
-        # Make path for episode images
+        # Only record the test episode, the saved traces are rendered offline by render.py
+        trace = get_trace(env)
+        test(env, agents, collision_metric, metrics, config, policy=policy, trace=trace)
         if not episode % config.learning.save_episodes_every and config.save_build:
-            path_figure_episode = os.path.join(path_figure, "episode-{}".format(episode))
-            os.mkdir(path_figure_episode)
+            trace_store.add_episode(trace, episode)
 
         # Plot last test episode
-        for k, (states, rewards, types) in enumerate(zip(all_states, all_rewards, all_types)):
-            # Plot environment
-            ax_board.cla()
-            env.plot(states, types, rewards, ax_board)
-            plt.draw()
-            if not episode % config.learning.save_episodes_every and config.save_build:
-                fig_board.savefig(os.path.join(path_figure_episode, "frame-{}.jpg".format(k)))
-                fig_losses_returns.savefig(os.path.join(path_figure, "losses.eps"), dpi=1000, format="eps")
-            if not episode % config.learning.plot_episodes_every:
-                plt.pause(0.001)
-
-    all_states, all_next_states, all_rewards, all_actions, _ = train(env, agents, shared_memory,
-                                                                     metrics, action_dim, config, agents_type="maddpg")
+        if not episode % config.learning.plot_episodes_every and not config.save_build:
+            for k in range(len(trace)):
+                board_renderer.draw_trace_frame(trace, k)
+                fig_board.canvas.start_event_loop(0.001)
+
+    if workers is not None:
+        train_from_workers(workers, agents, shared_memory, metrics, config, scheduler, agents_type="maddpg",
+                           learner=learner)
+    else:
+        trace = get_trace(env) if trace_store is not None and config.learning.save_training_traces else None
+        train(env, agents, shared_memory, metrics, action_dim, config, agents_type="maddpg", policy=policy,
+              learner=learner, scheduler=scheduler, trace=trace)
+        if trace is not None:
+            trace_store.add_episode(trace, episode, test=False)
 
     # Plot learning curves
     if not episode % config.learning.plot_curves_every:
@@ -132,15 +183,34 @@ for episode in range(config.learning.n_episodes):
         collision_metric.compute_averages()
         collision_metric.plot_collision_counts(episode, ax_collisions)
         ax_collisions.set_title("Number of collisions")
+        if config.save_build:
+            fig_losses_returns.savefig(os.path.join(path_figure, "losses.eps"), dpi=1000, format="eps")
 
         plt.draw()
         plt.pause(0.0001)
 
-    # Save models
+    # Checkpoint
     if config.save_build:
-        for agent in agents:
-            path = os.path.join(model_path, agent.id + ".pth")
-            agent.save(path)
-
+        # The last episode is always saved, to resume or continue the run from its end
+        if checkpoints.should_save(episode) or episode == config.learning.n_episodes - 1:
+            shared_memory.flush()
+            trace_store.flush()
+            checkpoints.save(get_checkpoint(episode, agents, learner, shared_memory, scheduler, metrics,
+                                            collision_metric, trace_store))
+
+    env_steps_per_second, updates_per_second = scheduler.get_rates()
+    progress_bar.set_postfix(env_steps_per_s="{:.0f}".format(env_steps_per_second),
+                             updates_per_s="{:.1f}".format(updates_per_second))
     progress_bar.update(1)
 progress_bar.close()
+evaluator.close()
+if config.save_build:
+    # Final models
+    for agent in agents:
+        agent.save(os.path.join(model_path, agent.id + ".pth"))
+    if learner is not None:
+        learner.save(os.path.join(model_path, "learner.pth"))
+    checkpoints.close()
+    trace_store.close()
+if workers is not None:
+    workers.close()
@@ -1,22 +1,32 @@
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
-from utils.config import Config
+from utils.config import get_default_config
 
-config = Config('./config')
+
+def get_dimensions(config):
+    """
+    Returns: (state_dim, action_dim, n_agents) for the board of the config
+    """
+    action_dim = 7 if config.env.world_3D else 5
+    n_agents = config.agents.number_preys + config.agents.number_predators
+    n_obstacles = 2 * len(config.env.obstacles)
+    state_dim = n_agents * 3 + n_obstacles + int(config.env.magic_switch) * (2 + n_agents)
+    return state_dim, action_dim, n_agents
 
 
 class DQNUnit(nn.Module):
 
-    def __init__(self):
+    def __init__(self, config=None):
+        """
+        Args:
+            config: configuration of the board. Defaults to the one in ./config
+        """
         super(DQNUnit, self).__init__()
 
-        n_actions = 7 if config.env.world_3D else 5
-        self.n_agents = config.agents.number_preys + config.agents.number_predators
-        n_obstacles = 2 * len(config.env.obstacles)
-        n_magic_switch = int(config.env.magic_switch) * (2 + self.n_agents)
+        state_dim, n_actions, self.n_agents = get_dimensions(get_default_config() if config is None else config)
         self.fc = nn.Sequential(
-            nn.Linear(self.n_agents * 3 + n_obstacles + n_magic_switch, 512),
+            nn.Linear(state_dim, 512),
             nn.ReLU(),
             nn.Linear(512, 64),
             nn.ReLU(),
@@ -32,13 +42,14 @@ class DQNUnit(nn.Module):
 
 
 class DQNCritic(nn.Module):
-    def __init__(self):
+    def __init__(self, config=None):
+        """
+        Args:
+            config: configuration of the board. Defaults to the one in ./config
+        """
         super(DQNCritic, self).__init__()
 
-        action_dim = 7 if config.env.world_3D else 5
-        n_agents = config.agents.number_preys + config.agents.number_predators
-        n_obstacles = 2 * len(config.env.obstacles)
-        state_dim = n_agents * 3 + n_obstacles + int(config.env.magic_switch) * (2 + n_agents)
+        state_dim, action_dim, n_agents = get_dimensions(get_default_config() if config is None else config)
         self.fc = nn.Sequential(
             nn.Linear(state_dim + n_agents * action_dim, 1024),
             nn.ReLU(),
@@ -61,13 +72,16 @@ class DQNCritic(nn.Module):
 
 
 class DQNActor(nn.Module):
-    def __init__(self):
+    def __init__(self, config=None):
+        """
+        Args:
+            config: configuration of the board and of the gumbel softmax. Defaults to the one in ./config
+        """
         super(DQNActor, self).__init__()
 
-        action_dim = 7 if config.env.world_3D else 5
-        n_agents = config.agents.number_preys + config.agents.number_predators
-        n_obstacles = 2 * len(config.env.obstacles)
-        state_dim = n_agents * 3 + n_obstacles + int(config.env.magic_switch) * (2 + n_agents)
+        config = get_default_config() if config is None else config
+        state_dim, action_dim, n_agents = get_dimensions(config)
+        self.gumbel_softmax_tau = config.learning.gumbel_softmax_tau
         self.fc = nn.Sequential(
             nn.Linear(state_dim, 512),
             nn.ReLU(),
@@ -79,4 +93,4 @@ class DQNActor(nn.Module):
         )
 
     def forward(self, x):
-        return F.gumbel_softmax(self.fc(x), tau=config.learning.gumbel_softmax_tau)
+        return F.gumbel_softmax(self.fc(x), tau=self.gumbel_softmax_tau)
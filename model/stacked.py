@@ -0,0 +1,74 @@
+import copy
+
+import torch
+from torch.func import functional_call, vmap
+
+
+class StackedModules:
+    """
+    Stacks the parameters of modules with the same architecture to evaluate all of them in one vmapped forward.
+    The parameters of the modules become views of the stacked tensors: in-place updates of the modules
+    (optimizer steps, load_state_dict, target updates) are seen by the stack without any copy, and in-place
+    updates of the stack are seen by the modules.
+    Stacking modules which are already stacked together reuses the same storage.
+    """
+
+    def __init__(self, modules):
+        self.modules = modules
+        self.base = copy.deepcopy(modules[0])
+        self.params = {}
+        for name, _ in modules[0].named_parameters():
+            module_params = [module.get_parameter(name) for module in modules]
+            stacked = get_stacked_view(module_params)
+            if stacked is None:
+                stacked = torch.stack([param.detach() for param in module_params])
+                for k, param in enumerate(module_params):
+                    param.data = stacked[k]
+            self.params[name] = stacked
+
+    def __len__(self):
+        return len(self.modules)
+
+    def forward(self, x, params=None):
+        """
+        Args:
+            x: inputs of size (n_modules, batch_size, ...), x[k] is given to the k-th module.
+                A tuple for modules with several inputs (the tensors can be nested in lists).
+            params: stacked parameters to use instead of the ones of the modules.
+        Returns: outputs of size (n_modules, batch_size, ...)
+        """
+        params = self.params if params is None else params
+        x = x if isinstance(x, tuple) else (x,)
+
+        def call(module_params, module_x):
+            return functional_call(self.base, module_params, module_x)
+
+        return vmap(call, randomness="different")(params, x)
+
+    def __call__(self, x, params=None):
+        return self.forward(x, params)
+
+
+def get_stacked_view(params):
+    """
+    Returns: a tensor of size (len(params), *param_shape) on the storage of params if they are
+        consecutive in the same storage (i.e. already stacked), else None.
+    """
+    first = params[0].detach()
+    if not first.is_contiguous():
+        return None
+    storage = first.untyped_storage()
+    for k, param in enumerate(params):
+        param = param.detach()
+        if (param.untyped_storage().data_ptr() != storage.data_ptr() or not param.is_contiguous() or
+                param.data_ptr() != first.data_ptr() + k * first.numel() * first.element_size()):
+            return None
+    stacked = torch.empty(0, dtype=first.dtype, device=first.device)
+    return stacked.set_(storage, first.storage_offset(), (len(params),) + tuple(first.shape))
+
+
+def get_architecture(module):
+    """
+    Returns: a key which is the same for modules which can be stacked together
+    """
+    return type(module), tuple((name, tuple(param.shape)) for name, param in module.named_parameters())
@@ -0,0 +1,38 @@
+import argparse
+import glob
+import os
+
+import matplotlib.pyplot as plt
+
+from sim.render import render_traces
+from sim.trace import TraceStore
+from utils import Config
+
+plt.switch_backend('agg')
+
+parser = argparse.ArgumentParser(description="Renders the episode traces saved in a build.")
+parser.add_argument("build", help="folder of the build")
+parser.add_argument("--processes", type=int, default=None, help="number of processes. Defaults to the number of cores")
+parser.add_argument("--format", choices=["jpg", "gif", "mp4"], default="jpg",
+                    help="jpg frames in a folder per episode, or a video per episode (mp4 needs imageio-ffmpeg)")
+parser.add_argument("--fps", type=int, default=12, help="frames per second of the videos")
+parser.add_argument("--training", action="store_true", help="also renders the saved training episodes")
+parser.add_argument("--raster", action="store_true", help="draws the frames with NumPy (faster, without labels)")
+args = parser.parse_args()
+
+config = Config(os.path.join(args.build, "config"))
+path_traces = os.path.join(args.build, "traces")
+if os.path.exists(os.path.join(path_traces, "metadata.json")):
+    store = TraceStore(path_traces)
+    episodes = [k for k in range(len(store)) if store.test[k] or args.training]
+    paths = [path_traces] * len(episodes)
+    names = ["{}-{}".format("episode" if store.test[k] else "training-episode", store.episodes[k]) for k in episodes]
+else:  # Builds with a .npz file per episode
+    paths = sorted(glob.glob(os.path.join(path_traces, "*.npz")))
+    episodes = None
+    names = [os.path.splitext(os.path.basename(path))[0] for path in paths]
+if args.format != "jpg":
+    names = [name + "." + args.format for name in names]
+output_paths = [os.path.join(args.build, "figs", name) for name in names]
+render_traces(paths, output_paths, config, args.processes, args.raster, args.fps, episodes)
+print("Rendered", len(paths), "episodes")
@@ -1,4 +1,21 @@
-from sim.env import *
-from sim.agents import *
-from sim.memory import *
-from sim.rewards import *
+"""
+The names of the submodules are imported on first access: `from sim import Env` only imports the environment
+(NumPy), torch is imported with the agents and the training modules.
+"""
+import importlib
+
+# Searched in this order, the modules which only need NumPy first
+_modules = ["sim.state", "sim.grid", "sim.collisions", "sim.rewards", "sim.env", "sim.vec_env", "sim.memory",
+            "sim.trace", "sim.agents", "sim.workers", "sim.evaluation", "sim.sweep",
+            "sim.checkpoint"]
+
+
+def __getattr__(name):
+    if not name.startswith("_"):
+        for module_name in _modules:
+            module = importlib.import_module(module_name)
+            if hasattr(module, name):
+                value = getattr(module, name)
+                globals()[name] = value
+                return value
+    raise AttributeError("module {} has no attribute {}".format(__name__, name))
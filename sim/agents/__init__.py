@@ -1,3 +1,4 @@
 from sim.agents.agents import *
 from sim.agents.multiagents import *
-
+from sim.agents.policy import *
+from sim.agents.learner import *
@@ -1,18 +1,19 @@
 import math
 import random
-from typing import Union
+from typing import TYPE_CHECKING, Union
 
 import numpy as np
-from matplotlib import pyplot as plt
-from mpl_toolkits.mplot3d import Axes3D
 import torch
 from torch.nn import functional as F
 from torch.optim import Adam
 
 from model.dqn import DQNUnit
-from utils.config import Config
+from sim.checkpoint import to_cpu
+from utils.config import get_default_config
 
-config = Config('./config')
+if TYPE_CHECKING:  # matplotlib is only imported to plot
+    from matplotlib import pyplot as plt
+    from mpl_toolkits.mplot3d import Axes3D
 
 
 def hard_update(target, policy):
@@ -23,7 +24,12 @@ def hard_update(target, policy):
         target_param.data.copy_(param.data)
 
 
-def soft_update(target, policy, tau=config.learning.tau):
+def soft_update(target, policy, tau=None):
+    """
+    Args:
+        tau: Defaults to learning.tau of the config.
+    """
+    tau = get_default_config().learning.tau if tau is None else tau
     for target_param, param in zip(target.parameters(), policy.parameters()):
         target_param.data.copy_(target_param.data * tau + param.data * (1. - tau))
 
@@ -38,12 +44,24 @@ class Agent:
     update_frequency = 0.1
     update_type = "hard"
 
-    def __init__(self, type, agent_id, device, agent_config):
+    def __init__(self, type, agent_id, device, agent_config, config=None):
+        """
+        Args:
+            type: prey or predator
+            agent_id:
+            device:
+            agent_config: agents section of the config
+            config: whole config (board, learning). Defaults to the one in ./config
+        """
         assert type in ["prey", "predator"], "Agent type is not correct."
         self.type = type
+        # The type changes with the magic switch, the test episodes start with the initial one
+        self.initial_type = type
         self.id = agent_id
+        self.config = get_default_config() if config is None else config
         self.memory = None
-        self.number_actions = 7 if config.env.world_3D else 5
+        self.steps_done = 0
+        self.number_actions = 7 if self.config.env.world_3D else 5
 
         # For RL
         self.gamma = agent_config.gamma
@@ -56,19 +74,35 @@ class Agent:
         self.update_type = agent_config.update_type
 
         self.colors = {"prey": "#a1beed", "predator": "#ffd2a0"}
+        # Absolute TD errors of the last batch given to learn (priorities of the prioritized replay memory)
+        self.td_errors = None
 
         self.device = device
 
     def draw_action(self, observation, no_exploration=False):
         raise NotImplementedError
 
+    def get_eps_threshold(self):
+        """
+        Returns: probability of exploration at the current step
+        """
+        return self.EPS_END + (self.EPS_START - self.EPS_END) * math.exp(-1. * self.steps_done / self.EPS_DECAY)
+
+    def get_policy_network(self):
+        """
+        Returns: the network used to draw the actions (its argmax is the action)
+        """
+        raise NotImplementedError
+
     def update(self, *params):
         if self.update_type == "hard":
             hard_update(*params)
         elif self.update_type == "soft":
-            soft_update(*params)
+            soft_update(*params, tau=self.config.learning.tau)
+
+    def plot(self, position, agent_type, reward, radius, ax: Union["plt.Axes", "Axes3D"]):
+        from matplotlib import pyplot as plt
 
-    def plot(self, position, agent_type, reward, radius, ax: Union[plt.Axes, Axes3D]):
         if len(position) == 2:
             x, y = position
             circle = plt.Circle((x, y), radius=radius, color=self.colors[agent_type])
@@ -83,7 +117,16 @@ class Agent:
             ax.set_ylim3d(0, 1)
             ax.set_xlim3d(0, 1)
 
-    def learn(self, batch, *params):
+    def learn(self, batch, weights=None):
+        raise NotImplementedError
+
+    def state_dict(self):
+        """
+        Returns: the networks and the optimizer states of the agent (see `sim.checkpoint`)
+        """
+        raise NotImplementedError
+
+    def load_state_dict(self, state_dict):
         raise NotImplementedError
 
     def save(self, name):
@@ -94,12 +137,12 @@ class Agent:
 
 
 class AgentDQN(Agent):
-    def __init__(self, type, agent_id, device, agent_config):
-        super(AgentDQN, self).__init__(type, agent_id, device, agent_config)
+    def __init__(self, type, agent_id, device, agent_config, config=None):
+        super(AgentDQN, self).__init__(type, agent_id, device, agent_config, config)
 
-        self.policy_net = DQNUnit().to(self.device)
-        self.target_net = DQNUnit().to(self.device)
-        self.policy_optimizer = Adam(self.policy_net.parameters(), lr=config.agents.lr)
+        self.policy_net = DQNUnit(self.config).to(self.device)
+        self.target_net = DQNUnit(self.config).to(self.device)
+        self.policy_optimizer = Adam(self.policy_net.parameters(), lr=self.config.agents.lr)
         self.update(self.target_net, self.policy_net)
         self.target_net.eval()
 
@@ -112,8 +155,7 @@ class AgentDQN(Agent):
             state:
             no_exploration: If True, use only exploitation policy
         """
-        eps_threshold = self.EPS_END + (self.EPS_START - self.EPS_END) * \
-                        math.exp(-1. * self.steps_done / self.EPS_DECAY)
+        eps_threshold = self.get_eps_threshold()
         self.steps_done += 1
         with torch.no_grad():
             p = np.random.random()
@@ -125,16 +167,33 @@ class AgentDQN(Agent):
                 action = random.randrange(self.number_actions)
             return action
 
+    def get_policy_network(self):
+        return self.policy_net
+
     def load(self, name):
         """
         load models
         :param name: adress of saved models
         :return: models init
         """
-        params = torch.load(name)
-        self.policy_net.load_state_dict(params['policy'])
-        self.target_net.load_state_dict(params['target_policy'])
-        self.policy_optimizer.load_state_dict(params['policy_optimizer'])
+        self.load_state_dict(torch.load(name))
+
+    def state_dict(self):
+        """
+        The tensors share the storage of the networks, like `torch.nn.Module.state_dict`.
+        The optimizer is left out when a learner trains the agent (see `sim.agents.learner`).
+        """
+        state_dict = {'policy': self.policy_net.state_dict(),
+                      'target_policy': self.target_net.state_dict()}
+        if self.policy_optimizer is not None:
+            state_dict['policy_optimizer'] = self.policy_optimizer.state_dict()
+        return state_dict
+
+    def load_state_dict(self, state_dict):
+        self.policy_net.load_state_dict(state_dict['policy'])
+        self.target_net.load_state_dict(state_dict['target_policy'])
+        if self.policy_optimizer is not None and 'policy_optimizer' in state_dict:
+            self.policy_optimizer.load_state_dict(state_dict['policy_optimizer'])
 
     def save(self, name):
         """
@@ -143,16 +202,16 @@ class AgentDQN(Agent):
         :return: models saved
         :return:
         """
-        save_dict = {'policy': self.policy_net.state_dict(),
-                     'target_policy': self.target_net.state_dict(),
-                     'policy_optimizer': self.policy_optimizer.state_dict()}
-        torch.save(save_dict, name)
+        # Copies with their own storage: the parameters can be views of the stacks of a learner
+        # (see `model.stacked.StackedModules`) and torch.save would write the whole stacks
+        torch.save(to_cpu(self.state_dict()), name)
 
-    def learn(self, batch):
+    def learn(self, batch, weights=None):
         """
 
         :param batch: for 1 agent, learn
-        :return: loss
+        :param weights: importance-sampling weights of the samples (prioritized replay memory)
+        :return: loss. The absolute TD errors of the samples are kept in self.td_errors
         """
         state_batch, next_state_batch, action_batch, reward_batch = batch
         state_batch = torch.FloatTensor(state_batch).to(self.device)
@@ -166,7 +225,7 @@ class AgentDQN(Agent):
         policy_output = self.policy_net(state_batch)
         action_by_policy = policy_output.gather(1, action_batch)
 
-        if config.learning.DDQN:
+        if self.config.learning.DDQN:
             actions_next = self.policy_net(next_state_batch).detach().max(1)[1].unsqueeze(1)
             Qsa_prime_targets = self.target_net(next_state_batch).gather(1, actions_next)
 
@@ -175,7 +234,12 @@ class AgentDQN(Agent):
 
         actions_by_cal = reward_batch + (self.gamma * Qsa_prime_targets)
 
-        loss = F.mse_loss(action_by_policy, actions_by_cal)
+        if weights is not None:
+            weights = torch.FloatTensor(weights).to(self.device).reshape(-1, 1)
+            loss = (weights * (action_by_policy - actions_by_cal) ** 2).mean()
+        else:
+            loss = F.mse_loss(action_by_policy, actions_by_cal)
+        self.td_errors = (actions_by_cal - action_by_policy).detach().abs().cpu().numpy().flatten()
         self.policy_optimizer.zero_grad()
         loss.backward()
         for param in self.policy_net.parameters():
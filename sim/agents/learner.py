@@ -0,0 +1,232 @@
+import numpy as np
+import torch
+from torch.nn import functional as F
+from torch.optim import Adam
+
+from model.stacked import StackedModules
+from utils.config import get_default_config
+
+
+def update_stacked(target_params, policy_params, update_type="soft", tau=None):
+    """
+    Hard or soft update of all the stacked target parameters at once (see `sim.agents.agents.soft_update`)
+    Args:
+        tau: Defaults to learning.tau of the config.
+    """
+    tau = get_default_config().learning.tau if tau is None else tau
+    with torch.no_grad():
+        if update_type == "hard":
+            torch._foreach_copy_(target_params, policy_params)
+        else:
+            torch._foreach_mul_(target_params, tau)
+            torch._foreach_add_(target_params, policy_params, alpha=1. - tau)
+
+
+class MultiAgentDQNLearner:
+    """
+    Trains all the `AgentDQN` at once: the policy and target networks of the agents are stacked
+    (see `model.stacked.StackedModules`), the (DDQN) losses of all the agents are computed in one vmapped
+    forward/backward and one Adam step updates all the agents.
+    The networks of the agents share the storage of the stacks, so the agents can still draw actions,
+    save and load their networks. Their own optimizers are dropped: the learner owns their parameters.
+    """
+
+    def __init__(self, agents, lr=None):
+        self.agents = agents
+        self.device = agents[0].device
+        self.gamma = agents[0].gamma
+        self.update_frequency = agents[0].update_frequency
+        self.update_type = agents[0].update_type
+        # The agents are trained with their config
+        self.config = agents[0].config
+        self.tau = self.config.learning.tau
+
+        self.policy = StackedModules([agent.policy_net for agent in agents])
+        self.target = StackedModules([agent.target_net for agent in agents])
+        self.policy_params = list(self.policy.params.values())
+        self.target_params = list(self.target.params.values())
+        for param in self.policy_params:
+            param.requires_grad_(True)
+        self.optimizer = Adam(self.policy_params, lr=self.config.agents.lr if lr is None else lr, foreach=True)
+        for agent in agents:
+            agent.policy_optimizer = None
+
+        self.n_iter = 0
+        self.td_errors = None
+
+    def _to_tensor(self, array, dtype=torch.float32):
+        """
+        Returns: tensor with the agents as first dimension, from an array with the agents as second dimension
+        """
+        return torch.as_tensor(np.asarray(array), dtype=dtype).to(self.device).transpose(0, 1)
+
+    def update_targets(self):
+        update_stacked(self.target_params, self.policy_params, self.update_type, self.tau)
+
+    def learn(self, batch, weights=None):
+        """
+        :param batch: (state_batch, next_state_batch, action_batch, reward_batch) of size batch_size x n_agents x ...
+        :param weights: importance-sampling weights of the samples (prioritized replay memory)
+        :return: loss of each agent. The absolute TD errors (n_agents x batch_size) are kept in self.td_errors
+        """
+        state_batch, next_state_batch, action_batch, reward_batch = batch
+        state_batch = self._to_tensor(state_batch)  # n_agents x batch x dim
+        next_state_batch = self._to_tensor(next_state_batch)
+        action_batch = self._to_tensor(action_batch, torch.long).unsqueeze(2)  # n_agents x batch x 1
+        reward_batch = self._to_tensor(reward_batch).unsqueeze(2)  # n_agents x batch x 1
+
+        action_by_policy = self.policy(state_batch, self.policy.params).gather(2, action_batch)
+
+        with torch.no_grad():
+            if self.config.learning.DDQN:
+                actions_next = self.policy(next_state_batch).max(2, keepdim=True)[1]
+                Qsa_prime_targets = self.target(next_state_batch).gather(2, actions_next)
+            else:
+                Qsa_prime_targets = self.target(next_state_batch).max(2, keepdim=True)[0]
+            actions_by_cal = reward_batch + self.gamma * Qsa_prime_targets
+
+        squared_errors = (action_by_policy - actions_by_cal) ** 2
+        if weights is not None:
+            squared_errors = torch.as_tensor(weights, dtype=torch.float32).to(self.device).reshape(1, -1, 1) * \
+                             squared_errors
+        # The agents do not share parameters: the gradient of the sum is the gradient of each loss
+        losses = squared_errors.mean(dim=(1, 2))
+        self.optimizer.zero_grad()
+        losses.sum().backward()
+        grads = [param.grad for param in self.policy_params]
+        torch._foreach_clamp_min_(grads, -1)
+        torch._foreach_clamp_max_(grads, 1)
+        self.optimizer.step()
+
+        if not self.n_iter % self.update_frequency:
+            self.update_targets()
+        self.n_iter += 1
+
+        self.td_errors = (actions_by_cal - action_by_policy).detach().abs().squeeze(2).cpu().numpy()
+        for k, agent in enumerate(self.agents):
+            agent.n_iter = self.n_iter
+            agent.td_errors = self.td_errors[k]
+        return losses.detach().cpu().numpy()
+
+    def state_dict(self):
+        return {"optimizer": self.optimizer.state_dict(), "n_iter": self.n_iter}
+
+    def load_state_dict(self, state_dict):
+        self.optimizer.load_state_dict(state_dict["optimizer"])
+        self.n_iter = state_dict["n_iter"]
+
+    def save(self, name):
+        torch.save(self.state_dict(), name)
+
+    def load(self, name):
+        self.load_state_dict(torch.load(name))
+
+
+class MultiAgentMADDPGLearner:
+    """
+    Centralized trainer of the `AgentMADDPG`. For each batch, the target actions of all the agents are computed
+    once by the stacked target actors and the policy actions once by the stacked policy actors, then shared by
+    all the critics. The critics, then the actors, of all the agents are updated in one vmapped step.
+    """
+
+    def __init__(self, agents):
+        self.agents = agents
+        self.device = agents[0].device
+        self.gamma = agents[0].gamma
+        self.config = agents[0].config
+        self.tau = self.config.learning.tau
+
+        self.policy_critic = StackedModules([agent.policy_critic for agent in agents])
+        self.target_critic = StackedModules([agent.target_critic for agent in agents])
+        self.policy_actor = StackedModules([agent.policy_actor for agent in agents])
+        self.target_actor = StackedModules([agent.target_actor for agent in agents])
+        self.critic_params = list(self.policy_critic.params.values())
+        self.actor_params = list(self.policy_actor.params.values())
+        for param in self.critic_params + self.actor_params:
+            param.requires_grad_(True)
+        self.critic_optimizer = Adam(self.critic_params, lr=self.config.agents.lr, foreach=True)
+        self.actor_optimizer = Adam(self.actor_params, lr=self.config.agents.lr_actor, foreach=True)
+        for agent in agents:  # The learner owns their parameters
+            agent.critic_optimizer = agent.actor_optimizer = None
+
+        self.n_iter = 0
+        self.td_errors = None
+
+    def _to_tensor(self, array):
+        return torch.as_tensor(np.asarray(array), dtype=torch.float32).to(self.device).transpose(0, 1)
+
+    def learn(self, batch, weights=None):
+        """
+        :param batch: (state_batch, next_state_batch, action_batch, reward_batch) of size batch_size x n_agents x ...
+            with one-hot actions
+        :param weights: importance-sampling weights of the samples (prioritized replay memory)
+        :return: (critic losses, actor losses) of each agent.
+            The absolute TD errors of the critics (n_agents x batch_size) are kept in self.td_errors
+        """
+        state_batch, next_state_batch, action_batch, reward_batch = batch
+        state_batch = self._to_tensor(state_batch)  # n_agents x batch x dim
+        next_state_batch = self._to_tensor(next_state_batch)
+        action_batch = self._to_tensor(action_batch)  # n_agents x batch x action_dim
+        reward_batch = self._to_tensor(reward_batch).unsqueeze(2)  # n_agents x batch x 1
+        n_agents = len(self.agents)
+
+        if self.config.learning.gumbel_softmax:
+            action_batch = F.gumbel_softmax(action_batch, tau=self.config.learning.gumbel_softmax_tau)
+        # Every critic is given the actions of all the agents
+        policy_actions = [action.expand(n_agents, -1, -1) for action in action_batch]
+
+        # Learn critics
+        with torch.no_grad():
+            target_actions = self.target_actor(next_state_batch)  # computed once for all the critics
+            target_actions = [action.expand(n_agents, -1, -1) for action in target_actions]
+            target_q = reward_batch + self.gamma * self.target_critic((next_state_batch, target_actions))
+        predicted_q = self.policy_critic((state_batch, policy_actions), self.policy_critic.params)
+
+        squared_errors = (predicted_q - target_q) ** 2
+        if weights is not None:
+            squared_errors = torch.as_tensor(weights, dtype=torch.float32).to(self.device).reshape(1, -1, 1) * \
+                             squared_errors
+        critic_losses = squared_errors.mean(dim=(1, 2))
+        self.critic_optimizer.zero_grad()
+        critic_losses.sum().backward()
+        self.critic_optimizer.step()
+        self.n_iter += 1
+
+        if not self.n_iter % self.config.agents.soft_update_frequency:
+            update_stacked(list(self.target_critic.params.values()), self.critic_params, tau=self.tau)
+
+        # Learn actors: the critic of the k-th agent is given the action of the k-th actor
+        predicted_actions = self.policy_actor(state_batch, self.policy_actor.params)  # n_agents x batch x action_dim
+        own_action = torch.eye(n_agents, dtype=torch.bool, device=self.device)[:, :, None, None]
+        actions = [torch.where(own_action[:, a], predicted_actions, action_batch[a]) for a in range(n_agents)]
+        critic_params = {name: param.detach() for name, param in self.policy_critic.params.items()}
+        actor_losses = -self.policy_critic((state_batch, actions), critic_params).mean(dim=(1, 2))
+        self.actor_optimizer.zero_grad()
+        actor_losses.sum().backward()
+        self.actor_optimizer.step()
+
+        if not self.n_iter % self.config.agents.soft_update_frequency:
+            update_stacked(list(self.target_actor.params.values()), self.actor_params, tau=self.tau)
+        self.n_iter += 1
+
+        self.td_errors = (target_q - predicted_q).detach().abs().squeeze(2).cpu().numpy()
+        for k, agent in enumerate(self.agents):
+            agent.n_iter = self.n_iter
+            agent.td_errors = self.td_errors[k]
+        return critic_losses.detach().cpu().numpy(), actor_losses.detach().cpu().numpy()
+
+    def state_dict(self):
+        return {"critic_optimizer": self.critic_optimizer.state_dict(),
+                "actor_optimizer": self.actor_optimizer.state_dict(),
+                "n_iter": self.n_iter}
+
+    def load_state_dict(self, state_dict):
+        self.critic_optimizer.load_state_dict(state_dict["critic_optimizer"])
+        self.actor_optimizer.load_state_dict(state_dict["actor_optimizer"])
+        self.n_iter = state_dict["n_iter"]
+
+    def save(self, name):
+        torch.save(self.state_dict(), name)
+
+    def load(self, name):
+        self.load_state_dict(torch.load(name))
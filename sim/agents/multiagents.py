@@ -1,4 +1,3 @@
-import math
 import random
 
 import numpy as np
@@ -8,23 +7,21 @@ from torch.optim import Adam
 
 from model.dqn import DQNCritic, DQNActor
 from sim.agents.agents import Agent, soft_update
-from utils import Config
-
-config = Config('./config')
+from sim.checkpoint import to_cpu
 
 
 class AgentMADDPG(Agent):
-    def __init__(self, type, agent_id, device, agent_config):
-        super(AgentMADDPG, self).__init__(type, agent_id, device, agent_config)
+    def __init__(self, type, agent_id, device, agent_config, config=None):
+        super(AgentMADDPG, self).__init__(type, agent_id, device, agent_config, config)
 
-        self.policy_critic = DQNCritic().to(self.device)  # Q'
-        self.target_critic = DQNCritic().to(self.device)  # Q
+        self.policy_critic = DQNCritic(self.config).to(self.device)  # Q'
+        self.target_critic = DQNCritic(self.config).to(self.device)  # Q
 
-        self.policy_actor = DQNActor().to(self.device)  # mu'
-        self.target_actor = DQNActor().to(self.device)  # mu
+        self.policy_actor = DQNActor(self.config).to(self.device)  # mu'
+        self.target_actor = DQNActor(self.config).to(self.device)  # mu
 
-        self.critic_optimizer = Adam(self.policy_critic.parameters(), lr=config.agents.lr)
-        self.actor_optimizer = Adam(self.policy_actor.parameters(), lr=config.agents.lr_actor)
+        self.critic_optimizer = Adam(self.policy_critic.parameters(), lr=self.config.agents.lr)
+        self.actor_optimizer = Adam(self.policy_actor.parameters(), lr=self.config.agents.lr_actor)
 
         self.update(self.target_critic, self.policy_critic)
         self.update(self.target_actor, self.policy_actor)
@@ -48,8 +45,7 @@ class AgentMADDPG(Agent):
             #    predicted = self.policy_actor(state).detach().cpu().numpy()[0]
             #    action = np.random.choice(self.number_actions, p=predicted)
             #else:
-            eps_threshold = self.EPS_END + (self.EPS_START - self.EPS_END) * math.exp(
-                -1. * self.steps_done / self.EPS_DECAY)
+            eps_threshold = self.get_eps_threshold()
             p = np.random.random()
             if no_exploration or p > eps_threshold:
                 action_probs = self.policy_actor(state).detach().cpu().numpy()
@@ -59,10 +55,14 @@ class AgentMADDPG(Agent):
         self.steps_done += 1
         return action
 
-    def learn(self, batch):
+    def get_policy_network(self):
+        return self.policy_actor
+
+    def learn(self, batch, weights=None):
         """
         :param batch:
-        :return:
+        :param weights: importance-sampling weights of the samples (prioritized replay memory)
+        :return: (critic loss, actor loss). The absolute TD errors of the critic are kept in self.td_errors
         """
         state_batch, next_state_batch, action_batch, reward_batch = batch
 
@@ -78,8 +78,8 @@ class AgentMADDPG(Agent):
         for a in range(len(self.agents)):
             target_action = self.agents[a].target_actor(next_state_batch)
             target_actions.append(target_action)
-            if config.learning.gumbel_softmax:
-                action = F.gumbel_softmax(action_batch[:, a], tau=config.learning.gumbel_softmax_tau)
+            if self.config.learning.gumbel_softmax:
+                action = F.gumbel_softmax(action_batch[:, a], tau=self.config.learning.gumbel_softmax_tau)
             else:
                 action = action_batch[:, a]
             policy_actions.append(action)
@@ -88,7 +88,12 @@ class AgentMADDPG(Agent):
         target = self.target_critic(next_state_batch, target_actions)
         target_q = reward_batch + self.gamma * target
 
-        loss = F.mse_loss(predicted_q, target_q)
+        if weights is not None:
+            weights = torch.FloatTensor(weights).to(self.device).reshape(-1, 1)
+            loss = (weights * (predicted_q - target_q) ** 2).mean()
+        else:
+            loss = F.mse_loss(predicted_q, target_q)
+        self.td_errors = (target_q - predicted_q).detach().abs().cpu().numpy().flatten()
 
         loss.backward()
 
@@ -97,8 +102,8 @@ class AgentMADDPG(Agent):
         self.critic_optimizer.step()
         self.n_iter += 1
 
-        if not self.n_iter % config.agents.soft_update_frequency:
-            soft_update(self.target_critic, self.policy_critic)
+        if not self.n_iter % self.config.agents.soft_update_frequency:
+            soft_update(self.target_critic, self.policy_critic, self.config.learning.tau)
 
         # Learn actor
         self.policy_critic.eval()
@@ -111,8 +116,8 @@ class AgentMADDPG(Agent):
             if a == self.current_agent_idx:
                 policy_actions.append(predicted_action)
             else:
-                if config.learning.gumbel_softmax:
-                    action = F.gumbel_softmax(action_batch[:, a], tau=config.learning.gumbel_softmax_tau)
+                if self.config.learning.gumbel_softmax:
+                    action = F.gumbel_softmax(action_batch[:, a], tau=self.config.learning.gumbel_softmax_tau)
                 else:
                     action = action_batch[:, a]
                 policy_actions.append(action)
@@ -127,8 +132,8 @@ class AgentMADDPG(Agent):
 
         self.policy_critic.train()
 
-        if not self.n_iter % config.agents.soft_update_frequency:
-            soft_update(self.target_actor, self.policy_actor)
+        if not self.n_iter % self.config.agents.soft_update_frequency:
+            soft_update(self.target_actor, self.policy_actor, self.config.learning.tau)
 
         self.n_iter += 1
 
@@ -141,16 +146,9 @@ class AgentMADDPG(Agent):
         :return: models saved
         :return:
         """
-        save_dict = {
-            'policy_critic': self.policy_critic.state_dict(),
-            'target_critic': self.target_critic.state_dict(),
-            'policy_actor': self.policy_actor.state_dict(),
-            'target_actor': self.target_actor.state_dict(),
-            'critic_optimizer': self.critic_optimizer.state_dict(),
-            'actor_optimizer': self.actor_optimizer.state_dict()
-        }
-
-        torch.save(save_dict, name)
+        # Copies with their own storage: the parameters can be views of the stacks of a learner
+        # (see `model.stacked.StackedModules`) and torch.save would write the whole stacks
+        torch.save(to_cpu(self.state_dict()), name)
 
     def load(self, name):
         """
@@ -158,10 +156,29 @@ class AgentMADDPG(Agent):
         :param name: adress of saved models
         :return: models init
         """
-        params = torch.load(name)
-        self.policy_critic.load_state_dict(params['policy_critic'])
-        self.target_critic.load_state_dict(params['target_critic'])
-        self.policy_actor.load_state_dict(params['policy_actor'])
-        self.target_actor.load_state_dict(params['target_actor'])
-        self.critic_optimizer.load_state_dict(params['critic_optimizer'])
-        self.actor_optimizer.load_state_dict(params['actor_optimizer'])
+        self.load_state_dict(torch.load(name))
+
+    def state_dict(self):
+        """
+        The tensors share the storage of the networks, like `torch.nn.Module.state_dict`.
+        The optimizers are left out when a learner trains the agent (see `sim.agents.learner`).
+        """
+        state_dict = {
+            'policy_critic': self.policy_critic.state_dict(),
+            'target_critic': self.target_critic.state_dict(),
+            'policy_actor': self.policy_actor.state_dict(),
+            'target_actor': self.target_actor.state_dict()
+        }
+        if self.critic_optimizer is not None:
+            state_dict['critic_optimizer'] = self.critic_optimizer.state_dict()
+            state_dict['actor_optimizer'] = self.actor_optimizer.state_dict()
+        return state_dict
+
+    def load_state_dict(self, state_dict):
+        self.policy_critic.load_state_dict(state_dict['policy_critic'])
+        self.target_critic.load_state_dict(state_dict['target_critic'])
+        self.policy_actor.load_state_dict(state_dict['policy_actor'])
+        self.target_actor.load_state_dict(state_dict['target_actor'])
+        if self.critic_optimizer is not None and 'critic_optimizer' in state_dict:
+            self.critic_optimizer.load_state_dict(state_dict['critic_optimizer'])
+            self.actor_optimizer.load_state_dict(state_dict['actor_optimizer'])
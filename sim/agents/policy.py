@@ -0,0 +1,57 @@
+from collections import OrderedDict
+
+import numpy as np
+import torch
+
+from model.stacked import StackedModules, get_architecture
+
+
+class BatchedPolicy:
+    """
+    Draws the actions of all the agents, for one or several boards, with one forward per network architecture.
+    The policy networks of the agents with the same architecture are stacked (see `model.stacked.StackedModules`),
+    so the policy is always up to date with the agents' weights.
+    """
+
+    def __init__(self, agents):
+        self.agents = agents
+        self.device = agents[0].device
+        self.number_actions = agents[0].number_actions
+        # Indices of the agents for each architecture
+        groups = OrderedDict()
+        for k, agent in enumerate(agents):
+            groups.setdefault(get_architecture(agent.get_policy_network()), []).append(k)
+        self.groups = [(indices, StackedModules([agents[k].get_policy_network() for k in indices]))
+                       for indices in groups.values()]
+
+    def draw_actions(self, states, no_exploration=False):
+        """
+        Epsilon-greedy actions of all the agents.
+        Args:
+            states: (n_agents, state_dim) or (n_envs, n_agents, state_dim)
+            no_exploration: If True, use only exploitation policy
+        Returns: actions of size (n_agents,) or (n_envs, n_agents)
+        """
+        states = np.asarray(states, dtype=np.float32)
+        batched = states.ndim == 3
+        if not batched:
+            states = states[None]
+        n_envs, n_agents, _ = states.shape
+        states = torch.from_numpy(states).to(self.device).transpose(0, 1)  # n_agents x n_envs x state_dim
+
+        greedy_actions = np.zeros((n_envs, n_agents), dtype=np.int64)
+        with torch.no_grad():
+            for indices, networks in self.groups:
+                action_values = networks(states[indices])  # len(indices) x n_envs x n_actions
+                greedy_actions[:, indices] = action_values.argmax(dim=-1).t().cpu().numpy()
+
+        eps_thresholds = np.array([agent.get_eps_threshold() for agent in self.agents])
+        for agent in self.agents:
+            agent.steps_done += n_envs
+        if no_exploration:
+            actions = greedy_actions
+        else:
+            explore = np.random.random((n_envs, n_agents)) < eps_thresholds
+            actions = np.where(explore, np.random.randint(self.number_actions, size=(n_envs, n_agents)),
+                               greedy_actions)
+        return actions if batched else actions[0]
@@ -0,0 +1,248 @@
+import os
+import queue
+import random
+import re
+import threading
+
+import numpy as np
+import torch
+
+
+def to_cpu(value):
+    """
+    Returns: a copy of value where the tensors are moved to the CPU and the arrays are copied, so that the training
+        can go on while the copy is written
+    """
+    if isinstance(value, torch.Tensor):
+        return value.detach().to("cpu", copy=True)
+    if isinstance(value, np.ndarray):
+        return value.copy()
+    if isinstance(value, dict):
+        return {key: to_cpu(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(to_cpu(item) for item in value)
+    return value
+
+
+def get_rng_states():
+    """
+    Returns: the states of the random generators of python, numpy and torch
+    """
+    states = {"python": random.getstate(), "numpy": np.random.get_state(), "torch": torch.get_rng_state()}
+    if torch.cuda.is_available():
+        states["cuda"] = torch.cuda.get_rng_state_all()
+    return states
+
+
+def set_rng_states(states):
+    random.setstate(states["python"])
+    np.random.set_state(states["numpy"])
+    torch.set_rng_state(states["torch"])
+    if "cuda" in states and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(states["cuda"])
+
+
+def get_checkpoint(episode, agents, learner=None, memory=None, scheduler=None, metrics=None, collision_metric=None,
+                   trace_store=None):
+    """
+    Gathers the state of a training in one dict. The tensors and arrays share the storage of the training:
+    `CheckpointManager.save` copies them.
+    Args:
+        episode: last episode of the training
+        learner: `sim.agents.MultiAgentDQNLearner` or `sim.agents.MultiAgentMADDPGLearner` of the agents
+        memory: replay memory (see `sim.memory.ReplayMemory.state_dict`). The memmap memories only save their
+            position: their content is saved by their flush.
+        scheduler: `utils.LearningScheduler` of the training
+        metrics: `utils.Metrics` of each agent
+        collision_metric: `utils.Metrics` of the collisions
+        trace_store: `sim.trace.TraceStore` of the run. Only its number of episodes is saved.
+    Returns: {episode, agents, learner, replay, scheduler, metrics, collision_metric, trace_store, rng}
+    """
+    return {
+        "episode": episode,
+        "agents": {agent.id: {"state": agent.state_dict(), "steps_done": agent.steps_done,
+                              "n_iter": getattr(agent, "n_iter", 0)} for agent in agents},
+        "learner": learner.state_dict() if learner is not None else None,
+        "replay": memory.state_dict() if memory is not None else None,
+        "scheduler": ({"env_steps": scheduler.env_steps, "updates": scheduler.updates}
+                      if scheduler is not None else None),
+        "metrics": [metric.state_dict() for metric in metrics] if metrics is not None else None,
+        "collision_metric": collision_metric.state_dict() if collision_metric is not None else None,
+        "trace_store": trace_store.state_dict() if trace_store is not None else None,
+        "rng": get_rng_states(),
+    }
+
+
+def restore_checkpoint(checkpoint, agents, learner=None, memory=None, scheduler=None, metrics=None,
+                       collision_metric=None, trace_store=None):
+    """
+    Puts the training back in the state of the checkpoint (see `get_checkpoint`): networks and optimizers,
+    exploration (steps_done) and number of updates of the agents, replay memory, scheduler, metrics and random
+    generators. The episodes of the trace store played after the checkpoint are dropped.
+    The objects which are None, or missing from the checkpoint, are not restored.
+    Returns: the episode from which the training goes on
+    """
+    for agent in agents:
+        agent_state = checkpoint["agents"][agent.id]
+        agent.load_state_dict(agent_state["state"])
+        agent.steps_done = agent_state["steps_done"]
+        if hasattr(agent, "n_iter"):
+            agent.n_iter = agent_state["n_iter"]
+    if learner is not None and checkpoint.get("learner") is not None:
+        learner.load_state_dict(checkpoint["learner"])
+    if memory is not None and checkpoint.get("replay") is not None:
+        memory.load_state_dict(checkpoint["replay"])
+    if scheduler is not None and checkpoint.get("scheduler") is not None:
+        scheduler.env_steps = checkpoint["scheduler"]["env_steps"]
+        scheduler.updates = checkpoint["scheduler"]["updates"]
+    if metrics is not None and checkpoint.get("metrics") is not None:
+        for metric, state in zip(metrics, checkpoint["metrics"]):
+            metric.load_state_dict(state)
+    if collision_metric is not None and checkpoint.get("collision_metric") is not None:
+        collision_metric.load_state_dict(checkpoint["collision_metric"])
+    if trace_store is not None and checkpoint.get("trace_store") is not None:
+        trace_store.load_state_dict(checkpoint["trace_store"])
+    set_rng_states(checkpoint["rng"])
+    return checkpoint["episode"] + 1
+
+
+class CheckpointManager:
+    """
+    Writes the checkpoints of a training (see `get_checkpoint`) in a folder, as checkpoint-<episode>.pth.
+    The arrays of the replay memory are written next to it as raw binary arrays, in checkpoint-<episode>.replay.npz,
+    rather than pickled with the checkpoint.
+    The checkpoint is copied to the CPU when `save` is called and written by a background thread, so the training
+    only waits for the copy. The file is written under a temporary name then renamed: a checkpoint on the disk is
+    always complete. Only the last keep_last checkpoints are kept.
+    """
+
+    def __init__(self, path, every=1, keep_last=3, asynchronous=True):
+        """
+        Args:
+            path: folder of the checkpoints
+            every: number of episodes between two checkpoints (see `should_save`)
+            keep_last: number of checkpoints kept on the disk. If 0, all are kept.
+            asynchronous: If False, `save` writes the checkpoint before returning.
+        """
+        self.path = path
+        self.every = every
+        self.keep_last = keep_last
+        self.asynchronous = asynchronous
+        os.makedirs(path, exist_ok=True)
+        # At most one checkpoint waits to be written while another one is written
+        self._checkpoints = queue.Queue(maxsize=1)
+        self._error = None
+        self._thread = None
+        if asynchronous:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def should_save(self, episode):
+        return not episode % self.every
+
+    def get_paths(self):
+        """
+        Returns: the paths of the checkpoints in the folder, from the oldest to the newest episode
+        """
+        episodes = []
+        for name in os.listdir(self.path):
+            match = re.fullmatch(r"checkpoint-(\d+)\.pth", name)
+            if match is not None:
+                episodes.append(int(match.group(1)))
+        return [os.path.join(self.path, "checkpoint-{}.pth".format(episode)) for episode in sorted(episodes)]
+
+    def get_latest(self):
+        """
+        Returns: the path of the newest checkpoint. None if there is none.
+        """
+        paths = self.get_paths()
+        return paths[-1] if paths else None
+
+    @staticmethod
+    def _write_file(path, write):
+        with open(path + ".tmp", "wb") as file:
+            write(file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(path + ".tmp", path)
+
+    def _write(self, checkpoint):
+        path = os.path.join(self.path, "checkpoint-{}.pth".format(checkpoint["episode"]))
+        replay = checkpoint.get("replay")
+        if replay is not None and replay.get("arrays") is not None:
+            # Written before the checkpoint: a checkpoint on the disk always has its arrays
+            arrays = replay["arrays"]
+            self._write_file(path[:-len(".pth")] + ".replay.npz", lambda file: np.savez(file, **arrays))
+            checkpoint = dict(checkpoint, replay=dict(replay, arrays=list(arrays.keys())))
+        self._write_file(path, lambda file: torch.save(checkpoint, file))
+        if self.keep_last:
+            for old_path in self.get_paths()[:-self.keep_last]:
+                os.remove(old_path)
+                replay_path = old_path[:-len(".pth")] + ".replay.npz"
+                if os.path.exists(replay_path):
+                    os.remove(replay_path)
+
+    def _run(self):
+        while True:
+            checkpoint = self._checkpoints.get()
+            try:
+                if checkpoint is not None:
+                    self._write(checkpoint)
+            except Exception as error:
+                self._error = error
+            finally:
+                self._checkpoints.task_done()
+            if checkpoint is None:
+                return
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RuntimeError("A checkpoint could not be written.") from error
+
+    def save(self, checkpoint):
+        """
+        Copies the checkpoint to the CPU and writes it. One checkpoint can wait while another one is written:
+        waits if a checkpoint is already waiting.
+        Args:
+            checkpoint: see `get_checkpoint`
+        """
+        self._raise_error()
+        checkpoint = to_cpu(checkpoint)
+        if self.asynchronous:
+            self._checkpoints.put(checkpoint)
+        else:
+            self._write(checkpoint)
+
+    def wait(self):
+        """
+        Waits until the checkpoints given to `save` are written.
+        """
+        if self.asynchronous:
+            self._checkpoints.join()
+        self._raise_error()
+
+    def load(self, path=None):
+        """
+        Args:
+            path: checkpoint to load. Defaults to the newest one.
+        Returns: the checkpoint (see `get_checkpoint`), with the tensors on the CPU. None if there is none.
+        """
+        path = self.get_latest() if path is None else path
+        if path is None:
+            return None
+        checkpoint = torch.load(path, map_location="cpu", weights_only=False)
+        replay = checkpoint.get("replay")
+        if replay is not None and replay.get("arrays") is not None:
+            with np.load(path[:-len(".pth")] + ".replay.npz") as arrays:
+                replay["arrays"] = {name: arrays[name] for name in replay["arrays"]}
+        return checkpoint
+
+    def close(self):
+        """
+        Writes the last checkpoints and stops the background thread.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            self._checkpoints.put(None)
+            self._thread.join()
+        self._raise_error()
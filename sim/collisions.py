@@ -0,0 +1,73 @@
+import numpy as np
+
+# Under this number of agents, the dense pairwise comparison is faster than hashing.
+DENSE_MAX_AGENTS = 16
+
+
+def get_collisions(positions, is_predator, board_size):
+    """
+    Two agents of different types collide when they are closer than one cell, i.e. when they are on the same cell.
+    Args:
+        positions: cell indices of the agents, size (n_agents, 3) or (n_envs, n_agents, 3)
+        is_predator: size (n_agents,) or (n_envs, n_agents)
+        board_size:
+    Returns: (n_collisions, pairs)
+        n_collisions: number of colliding pairs (one per board if batched)
+        pairs: indices (i, j) with i < j of the colliding agents, size (n_collisions, 2).
+            If batched, size (total_collisions, 3) with (env, i, j).
+    """
+    positions = np.asarray(positions)
+    is_predator = np.asarray(is_predator)
+    batched = positions.ndim == 3
+    if not batched:
+        positions, is_predator = positions[None], is_predator[None]
+    if positions.shape[1] <= DENSE_MAX_AGENTS:
+        pairs = _get_dense_collisions(positions, is_predator)
+    else:
+        pairs = _get_hashed_collisions(positions, is_predator, board_size)
+    n_collisions = np.bincount(pairs[:, 0], minlength=len(positions))
+    if not batched:
+        return int(n_collisions[0]), pairs[:, 1:]
+    return n_collisions, pairs
+
+
+def _get_dense_collisions(positions, is_predator):
+    """
+    Compares all the pairs at once, O(n_agents^2) memory.
+    Returns: (env, i, j) of the colliding pairs
+    """
+    same_cell = (positions[:, :, None] == positions[:, None]).all(axis=-1)
+    enemies = is_predator[:, :, None] != is_predator[:, None]
+    return np.argwhere(np.triu(same_cell & enemies, k=1))
+
+
+def _get_hashed_collisions(positions, is_predator, board_size):
+    """
+    Buckets the agents by cell and only compares the agents in the same bucket. As the collision distance
+    is smaller than one cell, the neighbouring buckets never contain a colliding agent.
+    Returns: (env, i, j) of the colliding pairs
+    """
+    n_envs, n_agents, _ = positions.shape
+    keys = ((positions[..., 0] * board_size + positions[..., 1]) * board_size + positions[..., 2])
+    keys = (keys + np.arange(n_envs)[:, None] * board_size ** 3).flatten()
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    types = is_predator.flatten()
+
+    pairs = []
+    offset = 1
+    # Agents of the same bucket are contiguous once sorted: compare each agent with the next ones in its bucket
+    same_bucket = sorted_keys[offset:] == sorted_keys[:-offset]
+    while same_bucket.any():
+        first, second = order[:-offset][same_bucket], order[offset:][same_bucket]
+        enemies = types[first] != types[second]
+        pairs.append(np.stack([first[enemies], second[enemies]], axis=1))
+        offset += 1
+        same_bucket = sorted_keys[offset:] == sorted_keys[:-offset]
+    if not pairs:
+        return np.zeros((0, 3), dtype=np.int64)
+    pairs = np.concatenate(pairs)
+    env, first = np.divmod(pairs[:, 0], n_agents)
+    second = pairs[:, 1] % n_agents
+    pairs = np.stack([env, np.minimum(first, second), np.maximum(first, second)], axis=1)
+    return pairs[np.lexsort(pairs.T[::-1])]
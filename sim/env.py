@@ -1,17 +1,17 @@
-from typing import List
+from typing import TYPE_CHECKING, List
 
-import matplotlib.pyplot as plt
-from mpl_toolkits.mplot3d import Axes3D
-from mpl_toolkits.mplot3d.art3d import Poly3DCollection, Line3DCollection
-import mpl_toolkits.mplot3d.art3d as art3d
 import numpy as np
-from sim.rewards import reward_full
-from sim.agents.agents import Agent
-import random
+from sim.collisions import get_collisions
+from sim.grid import Grid
+from sim.rewards import get_rewards
+from sim.state import StateEncoder
+
+if TYPE_CHECKING:  # torch is not imported with the environment
+    from sim.agents.agents import Agent
 
 
 class Env:
-    agents: List[Agent]
+    agents: List["Agent"]
 
     def __init__(self, env_config, config):
         self.reward_type = env_config.reward_type
@@ -29,19 +29,20 @@ class Env:
         self.config = config
 
         self.obstacles = env_config.obstacles
+        self.grid = Grid(self.board_size, self.obstacles, self.infinite_world, config.env.world_3D)
+        self.obstacle_grid = self.grid.obstacle_grid
 
-        self.magic_switch = None
+        self.magic_switch = None  # (x_index, y_index) of the switch
         self.initial_types = []
 
-        self.obstacle_positions = []
-        for (x, y) in self.obstacles:
-            self.obstacle_positions.append(self.possible_location_values[x])
-            self.obstacle_positions.append(self.possible_location_values[y])
-
         self.agents = []
         self.initial_positions = []
+        # Positions of the agents as cell indices, size (number_agents, 3)
+        self.positions = np.zeros((0, 3), dtype=np.int64)
+        self.collided_pairs = np.zeros((0, 2), dtype=np.int64)
+        self.encoder = StateEncoder(self.board_size, self.obstacles, 0, config.env.magic_switch)
 
-    def add_agent(self, agent: Agent, position=None):
+    def add_agent(self, agent: "Agent", position=None):
         """
         Args:
             agent:
@@ -51,174 +52,95 @@ class Env:
         if self.config.env.world_3D:
             assert position is None or len(position) == 3, "Please provide 3D positions if use 3D world."
         if position is not None:
-            assert position not in self.obstacles, "Initial position in an obstacle"
-        if position is not None:
-            x, y = self.possible_location_values[-1], self.possible_location_values[-1]
-            z = position[2] if len(position) == 3 else 0
-            for k in range(self.board_size):
-                if position[0] <= self.possible_location_values[k]:
-                    x = self.possible_location_values[k]
-                if position[1] <= self.possible_location_values[k]:
-                    y = self.possible_location_values[k]
-                if len(position) == 2 and position[2] <= self.possible_location_values[k]:
-                    z = self.possible_location_values[k]
-            position = x, y, z
+            # Snap to the closest cell
+            position = [min(int(round(p * self.board_size)), self.board_size - 1) for p in position]
+            if len(position) == 2:
+                position.append(0)
+            assert not self.obstacle_grid[position[0], position[1]], "Initial position in an obstacle"
+            position = tuple(position)
         self.agents.append(agent)
         self.initial_types.append(agent.type)
         self.initial_positions.append(position)
+        self.encoder = StateEncoder(self.board_size, self.obstacles, len(self.agents), self.config.env.magic_switch)
 
     def _get_random_position(self):
-        possible_values = [(x, y) for x in range(self.board_size)
-                           for y in range(self.board_size) if (x, y) not in self.obstacles]
-        x, y = random.sample(possible_values, 1)[0]
-        x, y = self.possible_location_values[x], self.possible_location_values[y]
-        z = self.possible_location_values[0]
-        if self.config.env.world_3D:
-            z = random.sample(self.possible_location_values, 1)[0]
-        return x, y, z
+        """
+        Returns: (x_index, y_index, z_index) of a random cell which is not an obstacle
+        """
+        return tuple(self.grid.random_positions(()))
 
     def _get_position_from_action(self, current_position, action):
         """
         From an action number, returns the new position.
         If position is not correct, then the position stays the same.
         Args:
-            current_position: (x_cur, y_cur)
-            action: in {0, 1, 2, 3, 4}
-        Returns: (x_new, y_new)
+            current_position: (x_index, y_index, z_index)
+            action: in {0, 1, 2, 3, 4} (and {5, 6} in 3D)
+        Returns: (x_index, y_index, z_index)
         """
-        index_x = self.possible_location_values.index(current_position[0])
-        index_y = self.possible_location_values.index(current_position[1])
-        index_z = 0
-        if self.config.env.world_3D:
-            index_z = self.possible_location_values.index(current_position[2])
-
-        if action == 1:  # Front
-            position = index_x, index_y + 1, index_z
-        elif action == 2:  # Left
-            position = index_x - 1, index_y, index_z
-        elif action == 3:  # Back
-            position = index_x, index_y - 1, index_z
-        elif action == 4:  # Right
-            position = index_x + 1, index_y, index_z
-        elif self.config.env.world_3D and action == 5:  # Top
-            position = index_x, index_y, index_z + 1
-        elif self.config.env.world_3D and action == 6:  # Bottom
-            position = index_x, index_y, index_z - 1
-        else:  # None (=0)
-            position = index_x, index_y, index_z
-        if not self.infinite_world:
-            if position[0] < 0 or position[0] >= len(self.possible_location_values):
-                position = index_x, position[1], position[2]
-            if position[1] < 0 or position[1] >= len(self.possible_location_values):
-                position = position[0], index_y, position[2]
-            if position[2] < 0 or position[2] >= len(self.possible_location_values):
-                position = position[0], position[1], index_z
-        else:
-            # If infinite world, goes back to the other side
-            position = (position[0] % len(self.possible_location_values),
-                        position[1] % len(self.possible_location_values),
-                        position[2] % len(self.possible_location_values))
-        if [position[0], position[1]] in self.obstacles:
-            position = index_x, index_y, index_z
-
-        position = (self.possible_location_values[position[0]], self.possible_location_values[position[1]],
-                    self.possible_location_values[position[2]])
-
+        position = tuple(self.grid.move(np.asarray(current_position), action))
         if self.config.env.magic_switch and position[0] == self.magic_switch[0] and position[1] == self.magic_switch[1]:
-            for agent in self.agents:
-                if agent.type == "predator":
-                    agent.type = "prey"
-                else:
-                    agent.type = "predator"
+            self._switch_types()
         return position
 
+    def _switch_types(self):
+        for agent in self.agents:
+            if agent.type == "predator":
+                agent.type = "prey"
+            else:
+                agent.type = "predator"
+
+    def get_compact_state(self):
+        """
+        Returns: the compact observation of the board (see `sim.state.StateEncoder`), int16 of size compact_dim
+        """
+        is_predator = [agent.type == "predator" for agent in self.agents]
+        return self.encoder.compact(self.positions, is_predator, self.magic_switch)
+
     def _get_state_from_positions(self, positions):
-        # return positions
-        states = []
-        for k in range(len(self.agents)):
-            # relative_positions = []
-            # x = positions[3 * k]  # Position of the current agent
-            # y = positions[3 * k + 1]  # Position of the current agent
-            # z = positions[3 * k + 2]  # Position of the current agent
-            # # Compute relative positions
-            # for i in range(len(self.agents)):
-            #     x_other = positions[3 * i]  # Position of the current agent
-            #     y_other = positions[3 * i + 1]  # Position of the current agent
-            #     z_other = positions[3 * i + 2]  # Position of the current agent
-            #     relative_positions.append(x - x_other)
-            #     relative_positions.append(y - y_other)
-            #     relative_positions.append(z - z_other)
-            state = positions[:]
-            # state.extend(relative_positions)
-            state.extend(self.obstacle_positions)
-            if self.config.env.magic_switch:
-                state.extend([self.magic_switch[0], self.magic_switch[1]])
-                types = [int(agent.type == "predator") for agent in self.agents]
-                state.extend(types)
-            states.append(state)
-        return states
+        """
+        Args:
+            positions: cell indices of the agents, size (number_agents, 3)
+        Returns: the normalized state of each agent, size (number_agents, state_dim)
+        """
+        is_predator = [agent.type == "predator" for agent in self.agents]
+        return self.encoder.decode_agents(self.encoder.compact(positions, is_predator, self.magic_switch))
 
     def _get_possible_positions(self, current_position):
         """
         Return possible positions from the given one
         Args:
-            current_position:
-        Returns: x_index, y_index of the possible new positions
+            current_position: (x_index, y_index, z_index)
+        Returns: x_index, y_index, z_index of the possible new positions
         """
-        index_x = self.possible_location_values.index(current_position[0])
-        index_y = self.possible_location_values.index(current_position[1])
-        index_z = self.possible_location_values.index(current_position[2])
-        max_len = len(self.possible_location_values)
-        indexes = [(index_x, index_y, index_z)]
-        if (self.infinite_world or index_x > 0) and ((index_x - 1) % max_len, index_y) not in self.obstacles:
-            indexes.append(((index_x - 1) % max_len, index_y, index_z))  # Left
-        if (self.infinite_world or index_x < len(self.possible_location_values) - 1) and (
-                ((index_x + 1) % max_len, index_y) not in self.obstacles):  # Right
-            indexes.append(((index_x + 1) % max_len, index_y, index_z))
-        if (self.infinite_world or index_y > 0) and (
-                (index_x, (index_y - 1) % max_len) not in self.obstacles):  # Back
-            indexes.append((index_x, (index_y - 1) % max_len, index_z))
-        if (self.infinite_world or index_y < len(self.possible_location_values) - 1) and (
-                (index_x, (index_y + 1) % max_len) not in self.obstacles):  # Front
-            indexes.append((index_x, (index_y + 1) % max_len, index_z))
-        if self.config.env.world_3D:
-            if (self.infinite_world or index_z < len(self.possible_location_values) - 1) and (
-                    (index_x, index_y) not in self.obstacles):  # Top
-                indexes.append((index_x, index_y, (index_z + 1) % max_len))
-            if (self.infinite_world or index_z > 0) and (
-                    (index_x, index_y) not in self.obstacles):  # Bottom
-                indexes.append((index_x, index_y, (index_z - 1) % max_len))
-        return indexes
+        return self.grid.possible_positions(current_position)
 
     def _get_collisions(self, positions):
-        n_collisions = 0
-        for i, agent in enumerate(self.agents):
-            x, y, z = positions[3 * i], positions[3 * i + 1], positions[3 * i + 2]
-            for j, other_agent in enumerate(self.agents):
-                x_2, y_2, z_2 = positions[3 * j], positions[3 * j + 1], positions[3 * j + 2]
-                distance = np.linalg.norm([x_2 - x, y_2 - y, z_2 - z])
-                if agent.type != other_agent.type and distance < self.possible_location_values[1]:
-                    n_collisions += 1
-        return n_collisions // 2
+        """
+        Two agents of different types collide when they are on the same cell.
+        The colliding pairs (i, j) are kept in `self.collided_pairs`.
+        Args:
+            positions: cell indices of the agents, size (number_agents, 3)
+        Returns: number of collisions
+        """
+        is_predator = np.array([agent.type == "predator" for agent in self.agents])
+        n_collisions, self.collided_pairs = get_collisions(positions, is_predator, self.board_size)
+        return n_collisions
 
     def reset(self, test=False):
         """
-        Returns: State for each agent. Size is (number_agents, 4 * number_agents)
-            for each agent, the state is the positions [x_1, y_1, x_2, y_2, ..., x_n, y_n]
-            concatenated with the relative position with each other agent:
-            [x_i-x_1, y_i - y_1, ..., x_i - x_n, y_i - y_n].
+        Returns: State for each agent. Size is (number_agents, 3 * number_agents + 2 * number_obstacles)
+            for each agent, the state is the normalized positions [x_1, y_1, z_1, ..., x_n, y_n, z_n]
+            concatenated with the obstacle positions (and the magic switch position and agent types if used).
         """
         self.current_iteration = 0
         # Get all positions
-        absolute_positions = []
+        self.positions = np.zeros((len(self.agents), 3), dtype=np.int64)
         for k in range(len(self.initial_positions)):
             position = self.initial_positions[k]
             if position is None:  # If random position
                 position = self._get_random_position()
-            # Absolute positions for the state. List of size num_agents * 2.
-            absolute_positions.append(position[0])
-            absolute_positions.append(position[1])
-            absolute_positions.append(position[2])
+            self.positions[k] = position
         # Define the initial states
         types = [agent.type for agent in self.agents]
         if self.config.env.magic_switch:
@@ -229,40 +151,46 @@ class Env:
                 else:
                     self.agents[k].type = self.initial_types[k]
                 types[k] = self.agents[k].type
-        return self._get_state_from_positions(absolute_positions), types
+        return self._get_state_from_positions(self.positions), types
 
     def step(self, prev_states, actions):
         """
         Args:
-            prev_states: states for each agent. Size (num_agents, 4 * num_agents)
+            prev_states: states for each agent. Only kept for compatibility,
+                the positions are tracked internally as cell indices.
             actions: actions for each agent
         """
-        positions = []
-        for k in range(len(self.agents)):
-            # Retrieve absolute positions
-            position = prev_states[0][3 * k], prev_states[0][3 * k + 1], prev_states[0][3 * k + 2]
-            new_position = self._get_position_from_action(position, actions[k])
-            if random.random() < self.noise:
-                index_x, index_y, index_z = random.sample(self._get_possible_positions(position), 1)[0]
-                new_position = (self.possible_location_values[index_x], self.possible_location_values[index_y],
-                                self.possible_location_values[index_z])
-            positions.append(new_position[0])
-            positions.append(new_position[1])
-            positions.append(new_position[2])
+        positions = self.grid.move(self.positions, np.asarray(actions))
+        if self.config.env.magic_switch:
+            # Every agent landing on the switch swaps the types
+            on_switch = (positions[:, 0] == self.magic_switch[0]) & (positions[:, 1] == self.magic_switch[1])
+            if on_switch.sum() % 2:
+                self._switch_types()
+        noisy = np.random.random(len(self.agents)) < self.noise
+        if noisy.any():
+            positions[noisy] = self.grid.random_neighbours(self.positions[noisy])
+        self.positions = positions
         n_colisions = self._get_collisions(positions)
         next_state = self._get_state_from_positions(positions)
         # Determine rewards
-        border_positions = [self.possible_location_values[0], self.possible_location_values[-1]]
-        rewards = reward_full(positions, self.agents, border_positions, self.obstacles, self.current_iteration)
         types = [agent.type for agent in self.agents]
+        is_predator = np.array([agent_type == "predator" for agent_type in types])
+        rewards, _, _ = get_rewards(positions, is_predator, self.grid.near_obstacle_grid, self.config)
+        rewards = rewards.tolist()
         self.current_iteration += 1
         terminal = False
         if self.current_iteration == self.max_iterations:
             terminal = True
         return next_state, rewards, terminal, n_colisions, types
 
-    def plot(self, state, types, rewards, ax):
-        # Add obstacles
+    def plot_background(self, ax):
+        """
+        Plots what does not change during an episode: ticks, grid and obstacles.
+        """
+        # matplotlib is only imported to plot
+        import matplotlib.pyplot as plt
+        from mpl_toolkits.mplot3d.art3d import Poly3DCollection
+
         tick_labels = np.arange(0, self.board_size)
         ax.set_xticks(self.possible_location_values)
         ax.set_yticks(self.possible_location_values)
@@ -297,8 +225,14 @@ class Env:
             else:
                 block = plt.Rectangle((x - side / 2, y - side / 2), width=side, height=side, linewidth=0, color="black")
                 ax.add_patch(block)
+
+    def plot(self, state, types, rewards, ax):
+        import matplotlib.pyplot as plt
+
+        self.plot_background(ax)
         if self.config.env.magic_switch:
-            x, y = self.magic_switch
+            x = self.possible_location_values[self.magic_switch[0]]
+            y = self.possible_location_values[self.magic_switch[1]]
             side = self.possible_location_values[1]
             block = plt.Rectangle((x - side / 2, y - side / 2), width=side, height=side, linewidth=0, color="purple")
             ax.add_patch(block)
@@ -0,0 +1,144 @@
+import queue
+import random
+
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+
+from sim.vec_env import VecEnv
+from sim.agents.policy import BatchedPolicy
+
+
+def evaluate(agents, config, n_episodes):
+    """
+    Plays n_episodes test episodes (no exploration) at once on a `VecEnv`.
+    The steps of the agents are not counted for their exploration.
+    Returns: (returns, collisions)
+        returns: discounted return of each agent in each episode, size (n_episodes, n_agents)
+        collisions: number of collisions at each step of each episode, size (n_episodes, n_steps)
+    """
+    env = VecEnv(config.env, config, n_episodes)
+    for agent in agents:
+        env.add_agent(agent)
+    policy = BatchedPolicy(agents)
+    steps_done = [agent.steps_done for agent in agents]
+
+    states, _ = env.reset(test=True)
+    returns = np.zeros((n_episodes, len(agents)))
+    collisions = []
+    discount = 1
+    terminal = False
+    while not terminal:
+        actions = policy.draw_actions(states, no_exploration=True)
+        states, rewards, terminals, n_collisions, _ = env.step(actions)
+        returns += discount * rewards
+        discount *= config.agents.gamma
+        collisions.append(n_collisions)
+        terminal = terminals.all()
+
+    for agent, steps in zip(agents, steps_done):
+        agent.steps_done = steps
+    return returns, np.stack(collisions, axis=1)
+
+
+def _run_evaluation(agent_specs, weights, config, n_episodes, seed, results):
+    torch.set_num_threads(1)
+    random.seed(seed)
+    np.random.seed(seed)
+    # CPU copies of the agents: CUDA cannot be used in a forked process
+    agents = [agent_class(agent_type, agent_id, "cpu", config.agents, config) for agent_class, agent_type, agent_id in
+              agent_specs]
+    for agent, state_dict in zip(agents, weights):
+        agent.get_policy_network().load_state_dict(state_dict)
+    results.put(evaluate(agents, config, n_episodes))
+
+
+class Evaluator:
+    """
+    Plays the test episodes of the training. The episodes are played at once on a `VecEnv`, in the training
+    process or shared among forked processes. The processes play on the CPU with a copy of the policy weights at
+    the time of `run`, so the evaluation can go on in the background while the training continues (asynchronous).
+    """
+
+    def __init__(self, agents, config, n_episodes, n_processes=0, asynchronous=False):
+        """
+        Args:
+            agents: agents to evaluate
+            n_episodes: number of test episodes of an evaluation
+            n_processes: number of processes playing the episodes. If 0, they are played in this process.
+            asynchronous: For n_processes > 0. If True, `run` does not wait for the results,
+                they are added to the metrics by `collect`.
+        """
+        self.agents = agents
+        self.config = config
+        self.n_episodes = n_episodes
+        self.n_processes = n_processes
+        self.asynchronous = asynchronous and n_processes > 0
+        self.context = mp.get_context("fork")
+        self.results = self.context.Queue()
+        self.processes = []
+        self._received = []
+
+    @staticmethod
+    def _add_to_metrics(results, metrics, collision_metric):
+        for returns, collisions in results:
+            for k in range(returns.shape[1]):
+                for discounted_return in returns[:, k]:
+                    metrics[k].add_return(discounted_return)
+            for n_collisions in collisions.flatten():
+                collision_metric.add_collision_count(n_collisions)
+
+    def run(self, metrics, collision_metric):
+        """
+        Plays an evaluation and adds the discounted returns and the collision counts to the metrics.
+        If asynchronous, only starts it: the results are added by a later `collect`.
+        """
+        if self.n_processes == 0:
+            self._add_to_metrics([evaluate(self.agents, self.config, self.n_episodes)], metrics, collision_metric)
+            return
+        # Only one evaluation at a time
+        self.collect(metrics, collision_metric, block=True)
+        seeds = np.random.randint(2 ** 31, size=self.n_processes)
+        agent_specs = [(type(agent), agent.initial_type, agent.id) for agent in self.agents]
+        weights = [{name: value.detach().cpu().clone()
+                    for name, value in agent.get_policy_network().state_dict().items()} for agent in self.agents]
+        for n_episodes, seed in zip(np.array_split(np.arange(self.n_episodes), self.n_processes), seeds):
+            if len(n_episodes):
+                process = self.context.Process(target=_run_evaluation, daemon=True,
+                                               args=(agent_specs, weights, self.config, len(n_episodes), int(seed),
+                                                     self.results))
+                process.start()
+                self.processes.append(process)
+        if not self.asynchronous:
+            self.collect(metrics, collision_metric, block=True)
+
+    def collect(self, metrics, collision_metric, block=False):
+        """
+        Adds the results of the running evaluation to the metrics once all its processes have finished.
+        Args:
+            block: If True, waits for the end of the evaluation.
+        Returns: True if results were added
+        """
+        while len(self._received) < len(self.processes):
+            try:
+                self._received.append(self.results.get(block=block, timeout=1 if block else None))
+            except queue.Empty:
+                if any(process.exitcode for process in self.processes):
+                    self.close()
+                    raise RuntimeError("An evaluation process failed.")
+                if not block:
+                    return False
+        if not self.processes:
+            return False
+        for process in self.processes:
+            process.join()
+        self._add_to_metrics(self._received, metrics, collision_metric)
+        self.processes = []
+        self._received = []
+        return True
+
+    def close(self):
+        for process in self.processes:
+            process.terminate()
+        self.processes = []
+        self._received = []
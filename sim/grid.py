@@ -0,0 +1,97 @@
+import numpy as np
+
+# Displacement of each action: None, Front, Left, Back, Right, Top, Bottom
+MOVES = np.array([[0, 0, 0], [0, 1, 0], [-1, 0, 0], [0, -1, 0], [1, 0, 0], [0, 0, 1], [0, 0, -1]])
+
+
+class Grid:
+    """
+    Precomputed board: obstacle bitmap and (cell, action) -> next cell transition table.
+    A cell is the flat index of (x, y, z) with z in [0, depth), depth being 1 for a 2D world.
+    """
+
+    def __init__(self, board_size, obstacles, infinite_world=False, world_3D=False):
+        self.board_size = board_size
+        self.infinite_world = infinite_world
+        self.depth = board_size if world_3D else 1
+        self.number_actions = 7 if world_3D else 5
+        self.shape = (board_size, board_size, self.depth)
+
+        obstacles = np.array(obstacles, dtype=np.int64).reshape(-1, 2)
+        self.obstacle_grid = np.zeros((board_size, board_size), dtype=bool)
+        self.obstacle_grid[obstacles[:, 0], obstacles[:, 1]] = True
+        self.free_cells = np.flatnonzero(~self.obstacle_grid)  # Flat (x, y) indices
+
+        # Cells next to an obstacle (used by the hot walls)
+        padded = np.pad(self.obstacle_grid, 1)
+        self.near_obstacle_grid = padded[2:, 1:-1] | padded[:-2, 1:-1] | padded[1:-1, 2:] | padded[1:-1, :-2]
+
+        self.cell_positions = np.stack(np.unravel_index(np.arange(np.prod(self.shape)), self.shape), axis=1)
+        self.transitions, self.possible_moves = self._get_transition_table()
+
+    def _get_transition_table(self):
+        """
+        Returns: (transitions, possible_moves) both of size (number_cells, number_actions).
+            transitions[cell, action] is the cell reached from cell with action.
+            possible_moves[cell, action] is False if the move is cancelled by a wall or an obstacle (always True for 0).
+        """
+        positions = self.cell_positions[:, None]
+        new_positions = positions + MOVES[None, :self.number_actions]
+        if self.infinite_world:
+            new_positions %= self.shape
+        else:
+            # Moving against a wall cancels the move on this axis
+            in_bounds = (new_positions >= 0) & (new_positions < self.shape)
+            new_positions = np.where(in_bounds, new_positions, positions)
+        blocked = self.obstacle_grid[new_positions[..., 0], new_positions[..., 1]]
+        new_positions = np.where(blocked[..., None], positions, new_positions)
+        transitions = self.get_cells(new_positions)
+        possible_moves = transitions != np.arange(len(transitions))[:, None]
+        possible_moves[:, 0] = True
+        return transitions, possible_moves
+
+    def get_cells(self, positions):
+        """
+        Args:
+            positions: (..., 3) cell indices
+        Returns: (...) flat cell indices
+        """
+        return np.ravel_multi_index(tuple(np.moveaxis(positions, -1, 0)), self.shape)
+
+    def move(self, positions, actions):
+        """
+        Args:
+            positions: (..., 3)
+            actions: (...)
+        Returns: the new positions (..., 3)
+        """
+        return self.cell_positions[self.transitions[self.get_cells(positions), actions]]
+
+    def random_positions(self, shape):
+        """
+        Returns: random positions which are not in an obstacle, size (*shape, 3)
+        """
+        positions = np.zeros(shape + (3,), dtype=np.int64)
+        cells = self.free_cells[np.random.randint(len(self.free_cells), size=shape)]
+        positions[..., 0], positions[..., 1] = np.divmod(cells, self.board_size)
+        positions[..., 2] = np.random.randint(self.depth, size=shape)
+        return positions
+
+    def possible_positions(self, position):
+        """
+        Returns: list of the positions reachable from position (including itself)
+        """
+        cell = self.get_cells(np.asarray(position))
+        return [tuple(self.cell_positions[next_cell])
+                for next_cell in self.transitions[cell][self.possible_moves[cell]]]
+
+    def random_neighbours(self, positions):
+        """
+        Draws uniformly among the current position and the reachable neighbours.
+        Args:
+            positions: (n, 3)
+        Returns: (n, 3)
+        """
+        cells = self.get_cells(positions)
+        scores = np.where(self.possible_moves[cells], np.random.random((len(cells), self.number_actions)), -1)
+        return self.cell_positions[self.transitions[cells, np.argmax(scores, axis=1)]]
@@ -1,18 +1,42 @@
+import json
+import os
+
 import numpy as np
 
 
 class ReplayMemory:
-    def __init__(self, size):
+    """
+    Ring buffer of transitions backed by preallocated arrays.
+    The arrays are allocated on the first insertion, with the shapes of the first transition.
+    If an encoder is given (see `sim.state.StateEncoder`), the states are added as compact observations
+    and decoded when a batch is sampled.
+    """
+    keys = ["states", "next_states", "actions", "rewards"]
+
+    def __init__(self, size, encoder=None):
         self.size = size
-        self.internal_memory = {
-            "states": [],
-            "next_states": [],
-            "actions": [],
-            "rewards": []
-        }
+        self.encoder = encoder
+        self.internal_memory = None
+        self.position = 0  # Next index to write
+        self.length = 0
 
     def __len__(self):
-        return len(self.internal_memory["states"])
+        return self.length
+
+    def _allocate(self, name, shape, dtype):
+        """
+        Returns: array of size (self.size, *shape) to store the entries of name
+        """
+        return np.zeros((self.size,) + shape, dtype=dtype)
+
+    def _init_memory(self, transition):
+        self.internal_memory = {}
+        for name, value in zip(self.keys, transition):
+            # Float values are stored in float32 (one-hot actions of MADDPG are floats)
+            dtype = np.float32 if name != "actions" or value.dtype.kind == "f" else np.int64
+            if self.encoder is not None and name in ["states", "next_states"]:
+                dtype = np.int16
+            self.internal_memory[name] = self._allocate(name, value.shape[1:], dtype)
 
     def add(self, state, next_state, action, reward):
         """
@@ -23,16 +47,77 @@ class ReplayMemory:
             action:
             reward:
         """
-        # If too large, we remove the first entries
-        if len(self) == self.size:
-            self.internal_memory["states"].pop(0)
-            self.internal_memory["next_states"].pop(0)
-            self.internal_memory["actions"].pop(0)
-            self.internal_memory["rewards"].pop(0)
-        self.internal_memory["states"].append(state)
-        self.internal_memory["next_states"].append(next_state)
-        self.internal_memory["actions"].append(action)
-        self.internal_memory["rewards"].append(reward)
+        self.add_batch([state], [next_state], [action], [reward])
+
+    def add_batch(self, states, next_states, actions, rewards):
+        """
+        Add several entries at once (e.g. the transitions of all the boards of a `VecEnv`).
+        If the memory is full, the oldest entries are overwritten.
+        Args:
+            states: (n, ...)
+            next_states: (n, ...)
+            actions: (n, ...)
+            rewards: (n, ...)
+        """
+        transition = [np.asarray(value) for value in (states, next_states, actions, rewards)]
+        if self.internal_memory is None:
+            self._init_memory(transition)
+        n = len(transition[0])
+        indices = (self.position + np.arange(n)) % self.size
+        for name, value in zip(self.keys, transition):
+            self.internal_memory[name][indices] = value
+        self.position = (self.position + n) % self.size
+        self.length = min(self.length + n, self.size)
+
+    def _gather(self, indices):
+        """
+        Returns: the entries at indices, for each of self.keys
+        """
+        return tuple(np.take(self.internal_memory[name], indices, axis=0) for name in self.keys)
+
+    def _decode(self, batch):
+        """
+        Returns: the batch with the compact observations replaced by the states of the agents
+        """
+        if self.encoder is None:
+            return batch
+        state_batch, next_state_batch, action_batch, reward_batch = batch
+        return (self.encoder.decode_agents(state_batch), self.encoder.decode_agents(next_state_batch),
+                action_batch, reward_batch)
+
+    def flush(self):
+        """
+        Writes the memory to its storage. Nothing to do for a memory in RAM.
+        """
+        pass
+
+    def state_dict(self):
+        """
+        Returns: position and length of the memory and its arrays (None if the memory is empty),
+            to resume a training (see `sim.checkpoint`). The arrays are views of the filled entries.
+        """
+        arrays = None
+        if self.internal_memory is not None:
+            # Until the memory is full, the entries are the first ones
+            arrays = {name: array[:self.length] for name, array in self.internal_memory.items()}
+        return {"position": self.position, "length": self.length, "arrays": arrays}
+
+    def load_state_dict(self, state_dict):
+        arrays = state_dict.get("arrays")
+        if arrays is not None:
+            assert len(arrays["states"]) <= self.size, "The saved memory is larger than this one."
+            self.internal_memory = {}
+            for name in self.keys:
+                self.internal_memory[name] = self._allocate(name, arrays[name].shape[1:], arrays[name].dtype)
+                self.internal_memory[name][:len(arrays[name])] = arrays[name]
+        self.position = state_dict["position"]
+        self.length = state_dict["length"]
+
+    def _sample_indices(self, batch_size, shuffle):
+        if shuffle:
+            return np.random.randint(len(self), size=batch_size)
+        # Last entries, from the oldest to the newest
+        return (self.position - batch_size + np.arange(batch_size)) % self.size
 
     def get_batch(self, batch_size, shuffle=True):
         """
@@ -40,18 +125,241 @@ class ReplayMemory:
             batch_size:
             shuffle: If true, returns a random batch in the memory. Defaults to True.
 
-        Returns: (state_batch, next_state_batch, action_batch, reward_batch)
+        Returns: (state_batch, next_state_batch, action_batch, reward_batch). None if the memory holds less
+            than batch_size entries (see `utils.LearningScheduler` for the warm-up).
         """
-        if len(self) < 10 * batch_size:
+        if len(self) < batch_size:
             return None
-        permutation = np.arange(0, len(self))
-        if shuffle:
-            np.random.shuffle(permutation)
-        batch_mask = permutation[-batch_size:]
+        indices = self._sample_indices(batch_size, shuffle)
+        return self._decode(self._gather(indices))
+
+
+class SumTree:
+    """
+    Binary tree where each node is the sum of its children. The leaves are the priorities of the entries.
+    Updates and proportional sampling are O(log n) and vectorized over a batch of indices.
+    """
+
+    def __init__(self, size):
+        self.capacity = 1
+        while self.capacity < size:
+            self.capacity *= 2
+        # Node k has children 2k and 2k + 1, the root is 1 and the leaves are [capacity, 2 * capacity)
+        self.tree = np.zeros(2 * self.capacity)
+
+    @property
+    def total(self):
+        return self.tree[1]
+
+    def __getitem__(self, indices):
+        return self.tree[np.asarray(indices) + self.capacity]
+
+    def update(self, indices, priorities):
+        nodes = np.asarray(indices) + self.capacity
+        self.tree[nodes] = priorities
+        nodes = np.unique(nodes // 2)
+        while nodes[0] >= 1:
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+            nodes = np.unique(nodes // 2)
+
+    def find(self, values):
+        """
+        Args:
+            values: in [0, total)
+        Returns: indices of the leaves where the cumulative sum of the priorities reaches values
+        """
+        values = np.array(values, dtype=np.float64)
+        nodes = np.ones(len(values), dtype=np.int64)
+        while nodes[0] < self.capacity:
+            left = self.tree[2 * nodes]
+            go_right = values >= left
+            values -= np.where(go_right, left, 0)
+            nodes = 2 * nodes + go_right
+        return nodes - self.capacity
+
+
+class PrioritizedReplayMemory(ReplayMemory):
+    """
+    Samples the transitions proportionally to their priority (Schaul et al., Prioritized Experience Replay, 2015).
+    """
+
+    def __init__(self, size, alpha=0.6, beta=0.4, eps=1e-3, encoder=None):
+        super(PrioritizedReplayMemory, self).__init__(size, encoder)
+        self.alpha = alpha
+        self.beta = beta
+        self.eps = eps
+        self.priorities = SumTree(size)
+        self.max_priority = 1.
+
+    def add_batch(self, states, next_states, actions, rewards):
+        # New entries get the max priority to be sampled at least once
+        indices = (self.position + np.arange(len(states))) % self.size
+        super(PrioritizedReplayMemory, self).add_batch(states, next_states, actions, rewards)
+        self.priorities.update(indices, self.max_priority ** self.alpha)
+
+    def _sample_indices(self, batch_size, shuffle):
+        if not shuffle:
+            return super(PrioritizedReplayMemory, self)._sample_indices(batch_size, shuffle)
+        # One sample in each of batch_size segments of the same total priority
+        segment = self.priorities.total / batch_size
+        values = (np.arange(batch_size) + np.random.random(batch_size)) * segment
+        return np.minimum(self.priorities.find(values), len(self) - 1)
+
+    def get_batch(self, batch_size, shuffle=True):
+        """
+        Args:
+            batch_size:
+            shuffle: If true, returns a prioritized batch. Else the last entries.
+
+        Returns: (state_batch, next_state_batch, action_batch, reward_batch, weights, indices)
+            weights are the importance-sampling weights of the samples and indices their index in the memory
+            to update their priority with `update_priorities`.
+        """
+        if len(self) < batch_size:
+            return None
+        indices = self._sample_indices(batch_size, shuffle)
+        batch = self._decode(self._gather(indices))
+        probabilities = self.priorities[indices] / self.priorities.total
+        weights = (len(self) * probabilities) ** (-self.beta)
+        weights = (weights / weights.max()).astype(np.float32)
+        return batch + (weights, indices)
+
+    def state_dict(self):
+        state_dict = super(PrioritizedReplayMemory, self).state_dict()
+        state_dict["max_priority"] = self.max_priority
+        if state_dict["arrays"] is not None:
+            # The leaves of the filled entries, the sums are rebuilt when loading
+            capacity = self.priorities.capacity
+            state_dict["arrays"]["priorities"] = self.priorities.tree[capacity:capacity + self.length]
+        return state_dict
+
+    def load_state_dict(self, state_dict):
+        super(PrioritizedReplayMemory, self).load_state_dict(state_dict)
+        self.max_priority = state_dict.get("max_priority", self.max_priority)
+        arrays = state_dict.get("arrays")
+        if arrays is not None and "priorities" in arrays:
+            self.priorities = SumTree(self.size)
+            self.priorities.update(np.arange(len(arrays["priorities"])), arrays["priorities"])
+
+    def update_priorities(self, indices, td_errors):
+        """
+        Args:
+            indices: indices returned by `get_batch`
+            td_errors: absolute TD errors of the samples
+        """
+        priorities = np.abs(td_errors) + self.eps
+        # Python float: saved in the metadata of the memmap memories
+        self.max_priority = max(self.max_priority, float(priorities.max()))
+        self.priorities.update(indices, priorities ** self.alpha)
+
+
+class MemmapReplayMemory(ReplayMemory):
+    """
+    Replay memory whose arrays are memory-mapped .npy files in path. Only the indices stay in RAM.
+    If path already contains a memory, it is reopened to resume or warm-start a run.
+    """
+
+    def __init__(self, size, path, **kwargs):
+        """
+        Args:
+            size:
+            path: folder of the memory files
+            **kwargs: other parameters of the parent memory (see `PrioritizedMemmapReplayMemory`)
+        """
+        super(MemmapReplayMemory, self).__init__(size, **kwargs)
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        if os.path.exists(os.path.join(path, "metadata.json")):
+            self.load()
+
+    def _allocate(self, name, shape, dtype):
+        return np.lib.format.open_memmap(os.path.join(self.path, name + ".npy"), mode="w+", dtype=dtype,
+                                         shape=(self.size,) + shape)
+
+    def _sample_indices(self, batch_size, shuffle):
+        indices = super(MemmapReplayMemory, self)._sample_indices(batch_size, shuffle)
+        # Sorted indices read the files sequentially. The last entries are kept in the order of insertion.
+        return np.sort(indices) if shuffle else indices
+
+    def state_dict(self):
+        """
+        The arrays are in the files of the memory, written by `flush`: only the position is returned.
+        """
+        state_dict = super(MemmapReplayMemory, self).state_dict()
+        state_dict["arrays"] = None
+        return state_dict
+
+    def _metadata(self):
+        return {"size": self.size, "position": self.position, "length": self.length,
+                "keys": list(self.internal_memory.keys()) if self.internal_memory is not None else []}
+
+    def flush(self):
+        """
+        Writes the arrays and the position of the memory to the disk.
+        """
+        if self.internal_memory is None:
+            return
+        for array in self.internal_memory.values():
+            array.flush()
+        path = os.path.join(self.path, "metadata.json")
+        with open(path + ".tmp", "w") as file:
+            json.dump(self._metadata(), file)
+        os.replace(path + ".tmp", path)
+
+    def load(self):
+        with open(os.path.join(self.path, "metadata.json")) as file:
+            metadata = json.load(file)
+        assert metadata["size"] == self.size, "The memory in {} has a different size.".format(self.path)
+        self.position = metadata["position"]
+        self.length = metadata["length"]
+        if metadata["keys"]:
+            self.internal_memory = {name: np.lib.format.open_memmap(os.path.join(self.path, name + ".npy"), mode="r+")
+                                    for name in metadata["keys"]}
+        return metadata
+
+
+class PrioritizedMemmapReplayMemory(MemmapReplayMemory, PrioritizedReplayMemory):
+    """
+    Prioritized replay memory with memory-mapped arrays. The priorities are kept in RAM and saved with `flush`.
+    """
+
+    def _metadata(self):
+        metadata = super(PrioritizedMemmapReplayMemory, self)._metadata()
+        metadata["max_priority"] = self.max_priority
+        return metadata
+
+    def flush(self):
+        if self.internal_memory is None:
+            return
+        np.save(os.path.join(self.path, "priorities.npy"), self.priorities.tree)
+        super(PrioritizedMemmapReplayMemory, self).flush()
+
+    def load(self):
+        metadata = super(PrioritizedMemmapReplayMemory, self).load()
+        self.max_priority = metadata.get("max_priority", self.max_priority)
+        if os.path.exists(os.path.join(self.path, "priorities.npy")):
+            self.priorities.tree = np.load(os.path.join(self.path, "priorities.npy"))
+        return metadata
 
-        state_batch = np.array([self.internal_memory["states"][k] for k in batch_mask])
-        next_state_batch = np.array([self.internal_memory["next_states"][k] for k in batch_mask])
-        action_batch = np.array([self.internal_memory["actions"][k] for k in batch_mask])
-        reward_batch = np.array([self.internal_memory["rewards"][k] for k in batch_mask])
-        return state_batch, next_state_batch, action_batch, reward_batch
 
+def get_replay_memory(memory_config, path=None, encoder=None):
+    """
+    Args:
+        memory_config: replay_memory section of the config
+        path: folder of the memory for the memmap backend, if replay_memory.path is not set.
+        encoder: `sim.state.StateEncoder` of the environment. Used if replay_memory.compact is set.
+    Returns: the replay memory of the type given in the config
+    """
+    assert memory_config.type in ["uniform", "prioritized"], "Replay memory type is not correct."
+    assert memory_config.backend in ["ram", "memmap"], "Replay memory backend is not correct."
+    params = {"encoder": encoder if memory_config.compact else None}
+    if memory_config.type == "prioritized":
+        params.update(alpha=memory_config.alpha, beta=memory_config.beta, eps=memory_config.priority_eps)
+    if memory_config.backend == "memmap":
+        path = memory_config.path if memory_config.path else path
+        assert path is not None, "Please provide replay_memory.path or save the build to use the memmap backend."
+        memory_class = PrioritizedMemmapReplayMemory if memory_config.type == "prioritized" else MemmapReplayMemory
+        return memory_class(memory_config.size, path, **params)
+    if memory_config.type == "prioritized":
+        return PrioritizedReplayMemory(memory_config.size, **params)
+    return ReplayMemory(memory_config.size, **params)
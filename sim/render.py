@@ -0,0 +1,242 @@
+import os
+
+import matplotlib.pyplot as plt
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+import numpy as np
+from PIL import Image
+import torch.multiprocessing as mp
+
+from sim.env import Env
+from sim.agents.agents import Agent
+from sim.trace import load_trace
+from utils.video import get_video_writer
+
+
+class BoardRenderer:
+    """
+    Draws the frames of episodes on an axis without rebuilding the figure at every frame.
+    The background (ticks, grid and obstacles) is plotted once. The agent markers, their labels and the switch
+    are artists created once and moved at every frame. With blit, the background is cached by the canvas and only
+    these artists are redrawn (live monitoring). Without blit, the frames are complete figures, e.g. for savefig.
+    In 3D, the agent artists are replaced at every frame on the cached background.
+    """
+
+    def __init__(self, env, ax, blit=True):
+        self.env = env
+        self.ax = ax
+        self.canvas = ax.figure.canvas
+        self.world_3D = env.config.env.world_3D
+        self.blit = blit and not self.world_3D and self.canvas.supports_blit
+        self.radius = env.config.env.plot_radius_3D if self.world_3D else env.plot_radius
+        self.background = None
+
+        env.plot_background(ax)
+        side = env.possible_location_values[1]
+        self.switch = None
+        if env.config.env.magic_switch:
+            self.switch = plt.Rectangle((0, 0), width=side, height=side, linewidth=0, color="purple",
+                                        animated=self.blit)
+            ax.add_patch(self.switch)
+        self.markers = []
+        self.labels = []
+        self.reward_labels = []
+        if not self.world_3D:
+            for agent in env.agents:
+                marker = plt.Circle((0, 0), radius=self.radius, animated=self.blit)
+                ax.add_artist(marker)
+                self.markers.append(marker)
+                self.labels.append(ax.text(0, 0, agent.id, animated=self.blit))
+                self.reward_labels.append(ax.text(0, 0, "", animated=self.blit))
+        self.artists = ([] if self.switch is None else [self.switch]) + self.markers + self.labels + self.reward_labels
+        self._frame_artists = []  # 3D
+        if self.blit:
+            self.canvas.mpl_connect("draw_event", self._on_draw)
+
+    def _on_draw(self, event):
+        # The figure was fully redrawn (first frame, resize...): cache the new background
+        self.background = self.canvas.copy_from_bbox(self.ax.figure.bbox)
+        self._draw_artists()
+
+    def _draw_artists(self):
+        for artist in self.artists:
+            self.ax.draw_artist(artist)
+
+    def draw(self, state, types, rewards, magic_switch=None):
+        """
+        Draws a frame. Same arguments as `Env.plot`.
+        Args:
+            magic_switch: cell indices of the switch. Defaults to the switch of the env.
+        """
+        if self.switch is not None:
+            magic_switch = self.env.magic_switch if magic_switch is None else magic_switch
+            side = self.env.possible_location_values[1]
+            self.switch.set_xy((self.env.possible_location_values[magic_switch[0]] - side / 2,
+                                self.env.possible_location_values[magic_switch[1]] - side / 2))
+        if self.world_3D:
+            for artist in self._frame_artists:
+                artist.remove()
+            n_artists = len(self.ax.collections) + len(self.ax.texts)
+            for k, agent in enumerate(self.env.agents):
+                position = state[0][3 * k], state[0][3 * k + 1], state[0][3 * k + 2]
+                agent.plot(position, types[k], rewards[k], self.radius, self.ax)
+            self._frame_artists = (list(self.ax.collections) + list(self.ax.texts))[n_artists:]
+        else:
+            for k, agent in enumerate(self.env.agents):
+                x, y = state[0][3 * k], state[0][3 * k + 1]
+                self.markers[k].center = (x, y)
+                self.markers[k].set_color(agent.colors[types[k]])
+                self.labels[k].set_position((x - self.radius / 2, y))
+                self.reward_labels[k].set_position((x - self.radius / 2, y - 0.05))
+                self.reward_labels[k].set_text("Reward: {}".format(round(float(rewards[k]), 3)))
+        if self.blit:
+            if self.background is None:
+                self.canvas.draw()
+            else:
+                self.canvas.restore_region(self.background)
+                self._draw_artists()
+                self.canvas.blit(self.ax.figure.bbox)
+            self.canvas.flush_events()
+
+    def draw_trace_frame(self, trace, k):
+        """
+        Draws the k-th step of an `sim.trace.EpisodeTrace`
+        """
+        observation = trace.observations[k]
+        states = trace.encoder.decode_agents(observation)
+        types = ["predator" if predator else "prey" for predator in observation[3 * trace.n_agents:4 * trace.n_agents]]
+        magic_switch = observation[4 * trace.n_agents:] if trace.magic_switch else None
+        self.draw(states, types, trace.rewards[k], magic_switch)
+
+
+class RasterRenderer:
+    """
+    Draws boards as RGB arrays with NumPy only, for GIF/video export. The board is seen from the top
+    (the z coordinate is ignored) and there are no labels.
+    """
+    colors = {"prey": (161, 190, 237), "predator": (255, 210, 160)}
+
+    def __init__(self, board_size, obstacles, cell_size=24):
+        self.board_size = board_size
+        self.cell_size = cell_size
+        size = board_size * cell_size
+        background = np.full((size, size, 3), 255, dtype=np.uint8)
+        background[::cell_size] = 220
+        background[:, ::cell_size] = 220
+        for x, y in obstacles:
+            background[self._cell(x, y)] = 0
+        self.background = background
+        # Pixel offsets of the agent discs in a cell
+        center = (cell_size - 1) / 2
+        rows, columns = np.nonzero((np.arange(cell_size)[:, None] - center) ** 2 +
+                                   (np.arange(cell_size)[None, :] - center) ** 2 <= (0.4 * cell_size) ** 2)
+        self.disc_rows, self.disc_columns = rows, columns
+
+    def _cell(self, x, y):
+        """
+        Returns: slices of the pixels of a cell (the y axis goes up)
+        """
+        row = (self.board_size - 1 - y) * self.cell_size
+        column = x * self.cell_size
+        return slice(row, row + self.cell_size), slice(column, column + self.cell_size)
+
+    def render(self, positions, is_predator, magic_switch=None):
+        """
+        Args:
+            positions: cell indices of the agents, size (n_agents, 3)
+            is_predator: (n_agents,)
+            magic_switch: cell indices of the switch. None if there is no switch.
+        Returns: RGB image of size (board_size * cell_size, board_size * cell_size, 3)
+        """
+        frame = self.background.copy()
+        if magic_switch is not None:
+            frame[self._cell(*magic_switch)] = (128, 0, 128)
+        positions = np.asarray(positions)
+        rows = (self.board_size - 1 - positions[:, 1, None]) * self.cell_size + self.disc_rows
+        columns = positions[:, 0, None] * self.cell_size + self.disc_columns
+        colors = np.where(np.asarray(is_predator, dtype=bool)[:, None], self.colors["predator"], self.colors["prey"])
+        frame[rows, columns] = colors[:, None]
+        return frame
+
+    def iter_trace(self, trace):
+        """
+        Yields the frames of an `sim.trace.EpisodeTrace` one at a time
+        """
+        n_agents = trace.n_agents
+        for observation in trace.observations:
+            positions = observation[:3 * n_agents].reshape(n_agents, 3)
+            magic_switch = observation[4 * n_agents:] if trace.magic_switch else None
+            yield self.render(positions, observation[3 * n_agents:4 * n_agents], magic_switch)
+
+    def render_trace(self, trace):
+        """
+        Returns: the frames of an `sim.trace.EpisodeTrace`, size (n_steps, height, width, 3)
+        """
+        return np.stack(list(self.iter_trace(trace)))
+
+
+def get_render_env(trace, config):
+    """
+    Returns: an `Env` with the agents of the trace, only used to plot the frames
+    """
+    env = Env(config.env, config)
+    for agent_id in trace.agent_ids:
+        env.add_agent(Agent("predator", agent_id, "cpu", config.agents, config))
+    return env
+
+
+def iter_frames(trace, config, raster=False):
+    """
+    Yields the RGB frames of an `sim.trace.EpisodeTrace` one at a time.
+    Args:
+        raster: If True, draws the frames with `RasterRenderer` instead of matplotlib (faster, without labels).
+    """
+    if raster:
+        yield from RasterRenderer(trace.board_size, trace.obstacles).iter_trace(trace)
+        return
+    env = get_render_env(trace, config)
+    fig = Figure(figsize=(10, 10))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111, projection="3d") if config.env.world_3D else fig.add_subplot(111)
+    renderer = BoardRenderer(env, ax, blit=False)
+    for k in range(len(trace)):
+        renderer.draw_trace_frame(trace, k)
+        fig.canvas.draw()
+        yield np.array(fig.canvas.buffer_rgba())[..., :3]
+
+
+def render_trace(path, output_path, config, raster=False, fps=12, episode=None):
+    """
+    Renders a saved trace, streaming the frames as they are drawn.
+    Args:
+        path: .npz file of the trace, or folder of a `sim.trace.TraceStore`
+        output_path: .gif or .mp4 file (see `utils.video`), or folder where frame-k.jpg is saved for every step.
+        raster: If True, draws the frames with `RasterRenderer` instead of matplotlib (faster, without labels).
+        episode: For a store, index of the episode in the store.
+    """
+    trace = load_trace(path, episode)
+    frames = iter_frames(trace, config, raster)
+    if os.path.splitext(output_path)[1].lower() in [".gif", ".mp4"]:
+        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+        with get_video_writer(output_path, fps) as writer:
+            for frame in frames:
+                writer.write(frame)
+        return
+    os.makedirs(output_path, exist_ok=True)
+    for k, frame in enumerate(frames):
+        Image.fromarray(frame).save(os.path.join(output_path, "frame-{}.jpg".format(k)))
+
+
+def render_traces(paths, output_paths, config, n_processes=None, raster=False, fps=12, episodes=None):
+    """
+    Renders several traces in parallel, one trace per process at a time.
+    Args:
+        paths: paths of the saved traces (see `render_trace`)
+        output_paths: video or folder of the frames of each trace (see `render_trace`)
+        n_processes: size of the pool. Defaults to the number of cores.
+        episodes: For stores, index of each episode in its store.
+    """
+    episodes = [None] * len(paths) if episodes is None else episodes
+    with mp.get_context("fork").Pool(n_processes) as pool:
+        pool.starmap(render_trace, [(path, output_path, config, raster, fps, episode)
+                                    for path, output_path, episode in zip(paths, output_paths, episodes)])
@@ -1,65 +1,102 @@
-from typing import List, Tuple
-from sim.agents.agents import Agent
+from typing import TYPE_CHECKING, List, Tuple
 import numpy as np
-from utils.config import Config
-from utils import get_enemy_positions
+from utils.config import get_default_config
+from utils.utils import get_enemy_positions
 
-config = Config('./config')
+if TYPE_CHECKING:  # torch is not imported with the rewards
+    from sim.agents.agents import Agent
 
 
-def reward_full(observations, agents: List[Agent], border_positions, obstacles, t):
+def reward_full(observations, agents: List["Agent"], border_positions, near_obstacle_grid, t, conf=None):
     """
     give all the rewards
     :param observations: all board
     :param agents: all agents list
-    :param border_positions: all agents list
+    :param border_positions: not used anymore, the borders are known from the board size
+    :param near_obstacle_grid: boolean grid, True for the cells next to an obstacle (see `sim.grid.Grid`).
+        Only used with hot walls and hot obstacles.
     :param t: time
+    :param conf: configuration to use. Defaults to the one in ./config
     :return: liste of all reward
     """
-    all_winners = []
-    all_rewards = []
-    number_winning_predator = 0
-    for idx, agent in enumerate(agents):
-        rw, is_winner, enemies_near = get_reward_agent(observations, idx, agents, t)
-        if agent.type == "predator" and is_winner:
-            number_winning_predator += 1
-
-        all_winners.append(is_winner)
-        all_rewards.append(rw)
-
-    hot_walls = config.reward.hot_walls and not config.env.infinite_world
-    if config.reward.share_wins_among_predators or hot_walls:
-        for idx, agent in enumerate(agents):
-            # if predator_lost:
-            #     if agent.type == "prey":
-            #         if not all_winners[idx]:
-            #             all_rewards[idx] = -1
-            # else:
-            if all_winners[idx] and agent.type == "predator":
-                all_rewards[idx] += 0.8
-            if config.reward.share_wins_among_predators and number_winning_predator > 0:
-                # Give incentive to other predators if one wins
-                if agent.type == "predator":
-                    all_rewards[idx] += config.reward.reward_if_predators_win * number_winning_predator
-            if hot_walls:  # If agent touches the borders, gets a penalty
-                x, y, z = observations[3 * idx], observations[3 * idx + 1], observations[3 * idx + 2]
-                if x in border_positions or y in border_positions or (config.env.world_3D and z in border_positions):
-                    all_rewards[idx] = -1
-                elif (x+1, y) in obstacles or (x-1, y) in obstacles or (x, y+1) in obstacles or (x, y-1) in obstacles:
-                    all_rewards[idx] = -1
-
-    return all_rewards
-
-
-def get_reward_agent(observations, agent_index, agents: List[Agent], t):
+    conf = get_default_config() if conf is None else conf
+    positions = np.rint(np.array(observations).reshape(-1, 3) * conf.env.board_size).astype(np.int64)
+    is_predator = np.array([agent.type == "predator" for agent in agents])
+    rewards, _, _ = get_rewards(positions, is_predator, near_obstacle_grid, conf)
+    return rewards.tolist()
+
+
+def get_rewards(positions, is_predator, near_obstacle_grid=None, conf=None):
+    """
+    Rewards of all the agents from one pairwise distance matrix.
+    Works on one board or on a batch of boards.
+    :param positions: cell indices of the agents, size (..., n_agents, 3)
+    :param is_predator: size (..., n_agents)
+    :param near_obstacle_grid: boolean grid, True for the cells next to an obstacle.
+        Only used with hot walls and hot obstacles.
+    :param conf: configuration to use. Defaults to the one in ./config
+    :return: (rewards, winners, enemies_near)
+        rewards and winners of size (..., n_agents),
+        enemies_near of size (..., n_agents, n_agents): enemies_near[..., i, j] is True if j is an enemy of i
+        close enough (for a predator) or far enough (for a prey).
+    """
+    conf = get_default_config() if conf is None else conf
+    board_size = conf.env.board_size
+
+    distances = get_distances(positions, board_size, conf.env.infinite_world)
+    enemies = is_predator[..., :, None] != is_predator[..., None, :]
+    min_distances = np.where(enemies, distances, np.inf).min(axis=-1)
+
+    predator = is_predator[..., None]
+    enemies_near = enemies & np.where(predator, distances < 1 / board_size, distances >= 1 / board_size)
+    winners = np.where(is_predator, min_distances < 1 / board_size, min_distances >= 1 / board_size)
+
+    coefs = np.where(is_predator, conf.reward.coef_distance_reward_predator, conf.reward.coef_distance_reward_prey)
+    exp_distances = np.exp(-coefs * min_distances * min_distances)
+    rewards = np.where(is_predator, exp_distances, 1 - 2 * exp_distances)
+
+    hot_walls = conf.reward.hot_walls and not conf.env.infinite_world
+    if conf.reward.share_wins_among_predators or hot_walls:
+        winning_predators = winners & is_predator
+        rewards = rewards + 0.8 * winning_predators
+        if conf.reward.share_wins_among_predators:
+            # Give incentive to other predators if one wins
+            number_winning_predators = winning_predators.sum(axis=-1, keepdims=True)
+            rewards = rewards + np.where(is_predator, conf.reward.reward_if_predators_win * number_winning_predators, 0)
+        if hot_walls:  # If agent touches the borders (or an obstacle with hot obstacles), gets a penalty
+            coordinates = positions[..., :3 if conf.env.world_3D else 2]
+            penalty = ((coordinates == 0) | (coordinates == board_size - 1)).any(axis=-1)
+            if conf.reward.hot_obstacles and near_obstacle_grid is not None:
+                penalty |= near_obstacle_grid[positions[..., 0], positions[..., 1]]
+            rewards = np.where(penalty, -1, rewards)
+    return rewards, winners, enemies_near
+
+
+def get_distances(positions, board_size, infinite_world=False):
+    """
+    Pairwise normalized distances between the agents.
+    :param positions: cell indices, size (..., n_agents, 3)
+    :param board_size:
+    :param infinite_world: if True, the distance goes through the borders when shorter
+    :return: distances of size (..., n_agents, n_agents)
+    """
+    deltas = np.abs(positions[..., :, None, :] - positions[..., None, :, :])
+    if infinite_world:
+        deltas = np.minimum(deltas, board_size - deltas)
+    return np.sqrt((deltas * deltas).sum(axis=-1)) / board_size
+
+
+def get_reward_agent(observations, agent_index, agents: List["Agent"], t, conf=None):
     """
     Reward for 1 action and 1 agent at time t
     :param observations:
     :param agent_index:
     :param agents:
     :param t:
+    :param conf: configuration to use. Defaults to the one in ./config
     :return: reward value
     """
+    conf = get_default_config() if conf is None else conf
     x = observations[3 * agent_index]
     y = observations[3 * agent_index + 1]
     z = observations[3 * agent_index + 2]
@@ -71,24 +108,24 @@ def get_reward_agent(observations, agent_index, agents: List[Agent], t):
 
     # For all enemies, we compute the distance between actual agent and enemy agents
     for x_1, y_1, z_1, k in get_enemy_positions(agent_index, agents, observations):
-        reward, distance = distance_reward(agent_type, x, y, z, x_1, y_1, z_1)
+        reward, distance = distance_reward(agent_type, x, y, z, x_1, y_1, z_1, conf)
         # If distance is smaller...
         if min_distance is None or distance < min_distance:
             min_distance, agent_reward = distance, reward
 
-        if ((agent_type == "predator" and distance < 1 / config.env.board_size) or
-                (agent_type == "prey" and distance >= 1 / config.env.board_size)):
+        if ((agent_type == "predator" and distance < 1 / conf.env.board_size) or
+                (agent_type == "prey" and distance >= 1 / conf.env.board_size)):
             enemies_near.append(k)
 
     # Determine if it's a winner
-    if ((agent_type == "predator" and min_distance < 1 / config.env.board_size) or
-            (agent_type == "prey" and min_distance >= 1 / config.env.board_size)):
+    if ((agent_type == "predator" and min_distance < 1 / conf.env.board_size) or
+            (agent_type == "prey" and min_distance >= 1 / conf.env.board_size)):
         winner = True
 
     return agent_reward, winner, enemies_near
 
 
-def distance_reward(agent_type, x, y, z, x1, y1, z1) -> Tuple:
+def distance_reward(agent_type, x, y, z, x1, y1, z1, conf=None) -> Tuple:
     """
     Returns the reward obtained according to the type and the position of two agents
     Args:
@@ -99,33 +136,37 @@ def distance_reward(agent_type, x, y, z, x1, y1, z1) -> Tuple:
         x1: position secondary agent
         y1: position secondary agent
         z1: position secondary agent
+        conf: configuration to use. Defaults to the one in ./config
 
     Returns: (reward, distance_between_agents)
     """
+    conf = get_default_config() if conf is None else conf
     assert agent_type in ['prey', 'predator'], "Agent type is not correct."
     dx = x - x1
     dy = y - y1
     dz = z - z1
-    if config.env.infinite_world:
+    if conf.env.infinite_world:
         dx = min(abs(dx), abs(x - x1 - 1), abs(x - x1 + 1))
         dy = min(abs(dy), abs(y - y1 - 1), abs(y - y1 + 1))
         dz = min(abs(dz), abs(z - z1 - 1), abs(z - z1 + 1))
-    return distance_reward_prey(dx, dy, dz) if agent_type == "prey" else distance_reward_predator(dx, dy, dz)
+    if agent_type == "prey":
+        return distance_reward_prey(dx, dy, dz, conf.reward.coef_distance_reward_prey)
+    return distance_reward_predator(dx, dy, dz, conf.reward.coef_distance_reward_predator)
 
 
-def distance_reward_prey(dx, dy, dz):
+def distance_reward_prey(dx, dy, dz, coef):
     """
     Returns: Reward = $1 - \exp(-c \cdot d^2)$
     """
     distance = np.linalg.norm([dx, dy, dz])
-    rw = 1 - 2 * np.exp(-config.reward.coef_distance_reward_prey * distance * distance)
+    rw = 1 - 2 * np.exp(-coef * distance * distance)
     return rw, distance
 
 
-def distance_reward_predator(dx, dy, dz):
+def distance_reward_predator(dx, dy, dz, coef):
     """
     Returns: Reward = $\exp(-c \cdot d^2)$
     """
     distance = np.linalg.norm([dx, dy, dz])
-    rw = np.exp(-config.reward.coef_distance_reward_predator * distance * distance)
+    rw = np.exp(-coef * distance * distance)
     return rw, distance
@@ -0,0 +1,57 @@
+import numpy as np
+
+
+class StateEncoder:
+    """
+    Converts the compact observations of a board into the states given to the networks.
+    The compact observation only holds what changes during an episode, as int16:
+        [x_1, y_1, z_1, ..., x_n, y_n, z_n, is_predator_1, ..., is_predator_n, x_switch, y_switch]
+    The state is the normalized positions [x_1, y_1, z_1, ..., x_n, y_n, z_n], followed by the obstacle positions
+    and, if the magic switch is used, by the switch position and the agent types.
+    The obstacle positions are constant, they are computed once and re-attached when decoding.
+    """
+
+    def __init__(self, board_size, obstacles, n_agents, magic_switch=False):
+        self.board_size = board_size
+        self.n_agents = n_agents
+        self.magic_switch = magic_switch
+        self.obstacle_positions = np.array(obstacles, dtype=np.float32).flatten() / board_size
+        self.compact_dim = 4 * n_agents + 2
+        self.state_dim = 3 * n_agents + len(self.obstacle_positions) + int(magic_switch) * (2 + n_agents)
+
+    def compact(self, positions, is_predator, magic_switch=None):
+        """
+        Args:
+            positions: cell indices of size (..., n_agents, 3)
+            is_predator: (..., n_agents)
+            magic_switch: cell indices of the switch (..., 2). None if there is no switch.
+        Returns: compact observations of size (..., compact_dim)
+        """
+        positions = np.asarray(positions)
+        batch_shape = positions.shape[:-2]
+        compact = np.zeros(batch_shape + (self.compact_dim,), dtype=np.int16)
+        compact[..., :3 * self.n_agents] = positions.reshape(batch_shape + (-1,))
+        compact[..., 3 * self.n_agents:4 * self.n_agents] = is_predator
+        if magic_switch is not None:
+            compact[..., 4 * self.n_agents:] = magic_switch
+        return compact
+
+    def decode(self, compact):
+        """
+        Args:
+            compact: compact observations of size (..., compact_dim)
+        Returns: states of size (..., state_dim)
+        """
+        batch_shape = compact.shape[:-1]
+        parts = [compact[..., :3 * self.n_agents].astype(np.float32) / self.board_size,
+                 np.broadcast_to(self.obstacle_positions, batch_shape + self.obstacle_positions.shape)]
+        if self.magic_switch:
+            parts.append(compact[..., 4 * self.n_agents:].astype(np.float32) / self.board_size)
+            parts.append(compact[..., 3 * self.n_agents:4 * self.n_agents].astype(np.float32))
+        return np.concatenate(parts, axis=-1)
+
+    def decode_agents(self, compact):
+        """
+        Returns: states of each agent of size (..., n_agents, state_dim). All the agents see the same state.
+        """
+        return np.repeat(self.decode(compact)[..., None, :], self.n_agents, axis=-2)
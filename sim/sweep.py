@@ -0,0 +1,275 @@
+import csv
+import itertools
+import os
+import random
+import time
+import traceback
+
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+import yaml
+
+try:
+    from threadpoolctl import threadpool_limits
+except ImportError:  # Optional, limits the BLAS threads of NumPy in the trial processes
+    threadpool_limits = None
+
+from sim.env import Env
+from sim.evaluation import evaluate
+from sim.memory import get_replay_memory
+from sim.agents.agents import AgentDQN
+from sim.agents.multiagents import AgentMADDPG
+from sim.agents.policy import BatchedPolicy
+from sim.agents.learner import MultiAgentDQNLearner, MultiAgentMADDPGLearner
+from utils import Config, Metrics, train, get_learning_scheduler
+
+
+def expand_grid(parameters):
+    """
+    Args:
+        parameters: list of values of each config key, e.g. {"agents.lr": [0.01, 0.001], "learning.batch_size": [64]}
+    Returns: the overrides of all the combinations, list of {key: value}
+    """
+    keys = list(parameters.keys())
+    return [dict(zip(keys, values)) for values in itertools.product(*[parameters[key] for key in keys])]
+
+
+def sample_random(parameters, n_trials, seed=None):
+    """
+    Args:
+        parameters: space of each config key. Either a list of values (one is drawn)
+            or a range {low: , high: , log: (optional), integer: (optional)}.
+        n_trials: number of overrides to draw
+    Returns: the overrides of n_trials random trials, list of {key: value}
+    """
+    rng = np.random.RandomState(seed)
+    trials = []
+    for _ in range(n_trials):
+        overrides = {}
+        for key, space in parameters.items():
+            if isinstance(space, dict):
+                if space.get("log", False):
+                    value = float(np.exp(rng.uniform(np.log(space["low"]), np.log(space["high"]))))
+                else:
+                    value = float(rng.uniform(space["low"], space["high"]))
+                if space.get("integer", False):
+                    value = int(round(value))
+            else:
+                value = space[rng.randint(len(space))]
+            overrides[key] = value
+        trials.append(overrides)
+    return trials
+
+
+def get_trial_config(config_path, overrides):
+    """
+    Returns: the config in config_path (see `utils.Config`) with the overrides, {"section.key": value}.
+        The keys must exist in the config.
+    """
+    config = Config(config_path)
+    for key, value in overrides.items():
+        *sections, name = key.split(".")
+        section = config
+        for section_name in sections:
+            section = getattr(section, section_name, None)
+            assert isinstance(section, Config), "Unknown config section in the sweep key {}.".format(key)
+        assert name in section.to_dict(), "Unknown config key {} in the sweep.".format(key)
+        section.set(name, value)
+    return config
+
+
+class MedianStopper:
+    """
+    Median stopping rule: a trial stops at an evaluation if its test return is below the quantile of the returns
+    of the other trials at the same episode. The returns are shared by the trial processes in a manager dict.
+    """
+
+    def __init__(self, results, grace_episodes=0, quantile=0.5, min_trials=2):
+        """
+        Args:
+            results: dict shared by the trials, {(trial, episode): test return}
+            grace_episodes: the trials are not stopped before this episode
+            quantile: quantile of the returns of the other trials below which a trial stops
+            min_trials: minimum number of other trials evaluated at the same episode to stop a trial
+        """
+        self.results = results
+        self.grace_episodes = grace_episodes
+        self.quantile = quantile
+        self.min_trials = min_trials
+
+    def should_stop(self, trial, episode, test_return):
+        """
+        Records the test return of the trial at this episode.
+        Returns: True if the trial should stop
+        """
+        self.results[(trial, episode)] = test_return
+        if episode < self.grace_episodes:
+            return False
+        others = [value for (name, other_episode), value in self.results.items()
+                  if other_episode == episode and name != trial]
+        if len(others) < self.min_trials:
+            return False
+        return test_return < np.quantile(others, self.quantile)
+
+
+def get_objective(returns, agents, objective="predator"):
+    """
+    Args:
+        returns: discounted returns of the test episodes, size (n_episodes, n_agents) (see `sim.evaluation.evaluate`)
+        objective: predator or prey to average the returns of this team, all to average the returns of all the agents
+    Returns: the mean test return which is compared between trials
+    """
+    if objective == "all":
+        return float(returns.mean())
+    # The types of the agents change with the magic switch: the teams are the ones of the test episodes
+    team = [k for k, agent in enumerate(agents) if agent.initial_type == objective]
+    return float(returns[:, team].mean())
+
+
+def _train_trial(name, overrides, config_path, sweep_path, agents_type, n_threads, stopper, objective, seed):
+    """
+    Trains the agents of a trial (see `run_trial`).
+    Returns: the test returns, list of (episode, test return), and True if the trial was stopped early
+    """
+    torch.set_num_threads(n_threads)
+    if seed is not None:
+        random.seed(seed)
+        np.random.seed(seed)
+        torch.manual_seed(seed)
+    config = get_trial_config(config_path, overrides)
+    root_path = os.path.join(sweep_path, name)
+    model_path = os.path.join(root_path, "models")
+    os.makedirs(model_path, exist_ok=True)
+    os.makedirs(os.path.join(root_path, "config"), exist_ok=True)
+    with open(os.path.join(root_path, "config", "default.yaml"), "w") as file:
+        yaml.dump(config.to_dict(), file)
+
+    agent_class = AgentMADDPG if agents_type == "maddpg" else AgentDQN
+    agents = [agent_class("predator", "predator-{}".format(k), "cpu", config.agents, config)
+              for k in range(config.agents.number_predators)]
+    agents += [agent_class("prey", "prey-{}".format(k), "cpu", config.agents, config)
+               for k in range(config.agents.number_preys)]
+    env = Env(config.env, config)
+    for k, agent in enumerate(agents):
+        env.add_agent(agent)
+        if agents_type == "maddpg":
+            agent.add_agents(agents, k)
+    memory = get_replay_memory(config.replay_memory, os.path.join(root_path, "replay"), env.encoder)
+    policy = BatchedPolicy(agents)
+    learner = None
+    if config.learning.fused_learner:
+        learner = MultiAgentMADDPGLearner(agents) if agents_type == "maddpg" else MultiAgentDQNLearner(agents)
+    scheduler = get_learning_scheduler(config.learning)
+    metrics = [Metrics() for _ in agents]
+    action_dim = agents[0].number_actions
+
+    test_returns = []  # (episode, test return)
+    stopped = False
+    for episode in range(1, config.learning.n_episodes + 1):
+        train(env, agents, memory, metrics, action_dim, config, agents_type, policy, learner, scheduler)
+        if episode % config.learning.test_every and episode < config.learning.n_episodes:
+            continue
+        returns, _ = evaluate(agents, config, config.learning.n_episode_in_test)
+        test_returns.append((episode, get_objective(returns, agents, objective)))
+        if (stopper is not None and episode < config.learning.n_episodes and
+                stopper.should_stop(name, episode, test_returns[-1][1])):
+            stopped = True
+            break
+
+    for agent in agents:
+        agent.save(os.path.join(model_path, agent.id + ".pth"))
+    with open(os.path.join(root_path, "returns.csv"), "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["episode", "test_return"])
+        writer.writerows(test_returns)
+    return test_returns, stopped
+
+
+def run_trial(name, overrides, config_path, sweep_path, agents_type="dqn", n_threads=1, stopper=None,
+              objective="predator", seed=None):
+    """
+    Trains agents without plots, on the CPU, with the config of config_path and the overrides.
+    The test returns are computed every learning.test_every episodes and at the last episode.
+    The build folder of the trial, sweep_path/name, holds its config, its models and its test returns.
+    A trial which raises does not stop the sweep: its traceback is printed and its summary has the error status.
+    Args:
+        n_threads: number of threads of torch in the trial
+        stopper: `MedianStopper` shared by the trials. If None, the trial is never stopped early.
+        objective: see `get_objective`
+    Returns: summary of the trial, {trial, the overrides, status (completed, stopped or error), episodes,
+        last_return, best_return, time, error (message of the exception)}
+    """
+    start = time.time()
+    summary = {"trial": name}
+    summary.update(overrides)
+    try:
+        test_returns, stopped = _train_trial(name, overrides, config_path, sweep_path, agents_type, n_threads,
+                                             stopper, objective, seed)
+        summary.update(status="stopped" if stopped else "completed", episodes=test_returns[-1][0],
+                       last_return=test_returns[-1][1], best_return=max(value for _, value in test_returns))
+        error = ""
+    except Exception as exception:
+        traceback.print_exc()
+        summary.update(status="error", episodes=None, last_return=None, best_return=None)
+        error = "{}: {}".format(type(exception).__name__, exception)
+    summary.update(time=round(time.time() - start, 1), error=error)
+    return summary
+
+
+def _limit_threads(n_threads):
+    """
+    Initializer of the trial processes: limits the threads of the BLAS and OpenMP libraries of NumPy and torch,
+    so that the trials running at the same time do not oversubscribe the cores.
+    """
+    # Read by the libraries loaded after the fork
+    for name in ["OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"]:
+        os.environ[name] = str(n_threads)
+    # The BLAS of NumPy is already loaded by the parent process
+    if threadpool_limits is not None:
+        threadpool_limits(n_threads)
+
+
+def write_summary(summaries, path):
+    """
+    Writes the summaries of the trials in a csv file, from the best test return to the worst.
+    The failed trials are last.
+    """
+    summaries = sorted(summaries, reverse=True,
+                       key=lambda summary: (summary["best_return"] is not None, summary["best_return"] or 0))
+    keys = []
+    for summary in summaries:
+        keys += [key for key in summary if key not in keys]
+    with open(path, "w", newline="") as file:
+        writer = csv.DictWriter(file, keys)
+        writer.writeheader()
+        writer.writerows(summaries)
+    return summaries
+
+
+def run_sweep(trials, config_path, sweep_path, agents_type="dqn", n_processes=None, n_threads=1,
+              early_stopping=None, objective="predator", seed=None):
+    """
+    Runs the trials in a pool of forked processes, a new process for each trial. The trials run on the CPU.
+    Args:
+        trials: overrides of the config of each trial (see `expand_grid` and `sample_random`)
+        config_path: folder of the config of all the trials (see `utils.Config`)
+        sweep_path: folder of the sweep. Each trial has its build folder in it and the summary is saved in
+            summary.csv.
+        n_processes: number of trials at the same time. Defaults to the number of cores divided by n_threads.
+        n_threads: number of threads of torch, NumPy and their BLAS libraries in each trial
+        early_stopping: parameters of the `MedianStopper` of the trials. If None, all the trials go to the end.
+        objective: see `get_objective`
+        seed: seed of the first trial, the next trials use seed + k
+    Returns: the summaries of the trials (see `run_trial`), from the best test return to the worst
+    """
+    os.makedirs(sweep_path, exist_ok=True)
+    n_processes = max(1, os.cpu_count() // n_threads) if n_processes is None else n_processes
+    context = mp.get_context("fork")
+    with context.Manager() as manager:
+        stopper = MedianStopper(manager.dict(), **early_stopping) if early_stopping is not None else None
+        arguments = [("trial-{}".format(k), overrides, config_path, sweep_path, agents_type, n_threads, stopper,
+                      objective, None if seed is None else seed + k) for k, overrides in enumerate(trials)]
+        with context.Pool(n_processes, _limit_threads, (n_threads,), maxtasksperchild=1) as pool:
+            summaries = pool.starmap(run_trial, arguments, chunksize=1)
+    return write_summary(summaries, os.path.join(sweep_path, "summary.csv"))
@@ -0,0 +1,284 @@
+import json
+import os
+
+import numpy as np
+
+from sim.state import StateEncoder
+
+
+class EpisodeTrace:
+    """
+    Compact record of an episode to render it offline (see `sim.render`).
+    For each step, keeps the compact observation of the board before the step (positions, types and magic switch,
+    see `sim.state.StateEncoder`), the rewards of the step and, if given, the actions of the agents.
+    A whole run is stored in a `TraceStore`.
+    """
+
+    def __init__(self, board_size, obstacles, agent_ids, magic_switch=False, observations=None, rewards=None,
+                 actions=None):
+        self.board_size = board_size
+        self.obstacles = [tuple(obstacle) for obstacle in obstacles]
+        self.agent_ids = list(agent_ids)
+        self.magic_switch = magic_switch
+        self.encoder = StateEncoder(board_size, self.obstacles, len(self.agent_ids), magic_switch)
+        self.observations = [] if observations is None else list(observations)
+        self.rewards = [] if rewards is None else list(rewards)
+        self.actions = [] if actions is None else list(actions)
+
+    def __len__(self):
+        return len(self.observations)
+
+    @property
+    def n_agents(self):
+        return len(self.agent_ids)
+
+    def record(self, observation, rewards, actions=None):
+        """
+        Args:
+            observation: compact observation of the board before the step
+            rewards: rewards of the agents for the step
+            actions: actions of the agents for the step
+        """
+        self.observations.append(np.array(observation, dtype=np.int16))
+        self.rewards.append(np.array(rewards, dtype=np.float32))
+        if actions is not None:
+            self.actions.append(np.array(actions, dtype=np.uint8))
+
+    def get_states(self):
+        """
+        Returns: states of the agents at each step, size (n_steps, n_agents, state_dim)
+        """
+        return self.encoder.decode_agents(np.array(self.observations, dtype=np.int16))
+
+    def get_types(self):
+        """
+        Returns: types of the agents at each step, list of n_steps lists of "predator" or "prey"
+        """
+        is_predator = np.array(self.observations)[:, 3 * self.n_agents:4 * self.n_agents]
+        return [["predator" if predator else "prey" for predator in step] for step in is_predator]
+
+    def get_magic_switch(self):
+        """
+        Returns: cell indices of the switch at each step, size (n_steps, 2)
+        """
+        return np.array(self.observations)[:, 4 * self.n_agents:]
+
+    def save(self, path):
+        """
+        Saves the trace in a (uncompressed) .npz file
+        """
+        np.savez(path, observations=np.array(self.observations, dtype=np.int16).reshape(len(self), -1),
+                 rewards=np.array(self.rewards, dtype=np.float32).reshape(len(self), -1),
+                 board_size=self.board_size, obstacles=np.array(self.obstacles, dtype=np.int64).reshape(-1, 2),
+                 agent_ids=np.array(self.agent_ids), magic_switch=self.magic_switch,
+                 actions=np.array(self.actions, dtype=np.uint8).reshape(len(self.actions), self.n_agents))
+
+
+def get_trace(env):
+    """
+    Returns: an empty `EpisodeTrace` for the board of env
+    """
+    return EpisodeTrace(env.board_size, env.obstacles, [agent.id for agent in env.agents],
+                        env.config.env.magic_switch)
+
+
+class TraceStore:
+    """
+    Columnar store of the episodes of a run in a folder. Each column is an append-only binary file:
+        positions: cell indices of the agents, int16 (n_steps, n_agents, 3)
+        types: is_predator of the agents as bits, uint8 (n_steps, ceil(n_agents / 8))
+        magic_switch: cell indices of the switch, int16 (n_steps, 2)
+        actions: actions of the agents, uint8 (n_steps, n_agents)
+        rewards: rewards of the agents, float32 (n_steps, n_agents)
+    The index holds the offset of the first step of each episode, so an episode or a range of steps is read
+    (memory-mapped) without loading the run. The index and the board are saved in metadata.json by `flush`:
+    the steps added after the last flush are dropped when the store is reopened.
+    """
+
+    def __init__(self, path, board_size=None, obstacles=None, agent_ids=None, magic_switch=False):
+        """
+        Args:
+            path: folder of the store. If it already contains a store, it is reopened and the board is read from it.
+            board_size, obstacles, agent_ids, magic_switch: board of the episodes of a new store
+                (see `get_trace_store`)
+        """
+        self.path = path
+        self.files = {}
+        os.makedirs(path, exist_ok=True)
+        if os.path.exists(os.path.join(path, "metadata.json")):
+            self.load()
+        else:
+            assert board_size is not None and agent_ids is not None, "Please give the board of a new trace store."
+            self.board_size = board_size
+            self.obstacles = [tuple(obstacle) for obstacle in obstacles]
+            self.agent_ids = list(agent_ids)
+            self.magic_switch = magic_switch
+            self.offsets = [0]
+            self.episodes = []  # Number of the episode in the training
+            self.test = []  # True for the test episodes
+        n_agents = len(self.agent_ids)
+        self.columns = {"positions": (np.int16, (n_agents, 3)), "types": (np.uint8, ((n_agents + 7) // 8,)),
+                        "magic_switch": (np.int16, (2,)), "actions": (np.uint8, (n_agents,)),
+                        "rewards": (np.float32, (n_agents,))}
+        self.encoder = StateEncoder(self.board_size, self.obstacles, n_agents, self.magic_switch)
+
+    def __len__(self):
+        return len(self.episodes)
+
+    @property
+    def n_steps(self):
+        return self.offsets[-1]
+
+    @property
+    def n_agents(self):
+        return len(self.agent_ids)
+
+    def _column_path(self, name):
+        return os.path.join(self.path, name + ".bin")
+
+    def _open(self):
+        """
+        Opens the column files to append steps. The steps that were not flushed are dropped.
+        """
+        for name, (dtype, shape) in self.columns.items():
+            file = open(self._column_path(name), "ab")
+            file.truncate(self.n_steps * np.dtype(dtype).itemsize * int(np.prod(shape)))
+            self.files[name] = file
+
+    def add_episode(self, trace, episode=None, test=True):
+        """
+        Appends an `EpisodeTrace` of the board of the store.
+        Args:
+            episode: number of the episode in the training. Defaults to the number of episodes in the store.
+            test: False for a training episode
+        """
+        if not self.files:
+            self._open()
+        n_agents = self.n_agents
+        observations = np.array(trace.observations, dtype=np.int16).reshape(len(trace), -1)
+        actions = (np.array(trace.actions, dtype=np.uint8).reshape(len(trace), n_agents) if len(trace.actions)
+                   else np.zeros((len(trace), n_agents), dtype=np.uint8))
+        values = {"positions": observations[:, :3 * n_agents],
+                  "types": np.packbits(observations[:, 3 * n_agents:4 * n_agents].astype(bool), axis=1),
+                  "magic_switch": observations[:, 4 * n_agents:],
+                  "actions": actions,
+                  "rewards": np.array(trace.rewards, dtype=np.float32).reshape(len(trace), n_agents)}
+        for name, (dtype, _) in self.columns.items():
+            self.files[name].write(np.ascontiguousarray(values[name], dtype=dtype).tobytes())
+        self.offsets.append(self.n_steps + len(trace))
+        self.episodes.append(len(self.episodes) if episode is None else int(episode))
+        self.test.append(bool(test))
+
+    def read(self, name, start=0, stop=None):
+        """
+        Returns: the steps start to stop of a column, memory-mapped (read only)
+        """
+        dtype, shape = self.columns[name]
+        stop = self.n_steps if stop is None else stop
+        if name in self.files:
+            self.files[name].flush()
+        if stop <= start:
+            return np.zeros((0,) + shape, dtype=dtype)
+        return np.memmap(self._column_path(name), dtype=dtype, mode="r", shape=(stop - start,) + shape,
+                         offset=start * np.dtype(dtype).itemsize * int(np.prod(shape)))
+
+    def get_observations(self, start=0, stop=None):
+        """
+        Returns: compact observations of the steps start to stop (see `sim.state.StateEncoder`)
+        """
+        positions = self.read("positions", start, stop)
+        is_predator = np.unpackbits(self.read("types", start, stop), axis=1, count=self.n_agents)
+        magic_switch = self.read("magic_switch", start, stop) if self.magic_switch else None
+        return self.encoder.compact(positions, is_predator, magic_switch)
+
+    def get_episode(self, k):
+        """
+        Returns: the k-th episode of the store as an `EpisodeTrace`
+        """
+        start, stop = self.offsets[k], self.offsets[k + 1]
+        return EpisodeTrace(self.board_size, self.obstacles, self.agent_ids, self.magic_switch,
+                            self.get_observations(start, stop), np.array(self.read("rewards", start, stop)),
+                            np.array(self.read("actions", start, stop)))
+
+    def find_episode(self, episode, test=True):
+        """
+        Returns: index in the store of the episode number episode of the training
+        """
+        for k in range(len(self)):
+            if self.episodes[k] == episode and self.test[k] == test:
+                return k
+        raise KeyError("Episode {} is not in the store.".format(episode))
+
+    def flush(self):
+        """
+        Writes the steps and the index to the disk.
+        """
+        for file in self.files.values():
+            file.flush()
+        path = os.path.join(self.path, "metadata.json")
+        with open(path + ".tmp", "w") as file:
+            json.dump({"board_size": self.board_size, "obstacles": self.obstacles, "agent_ids": self.agent_ids,
+                       "magic_switch": self.magic_switch, "offsets": self.offsets, "episodes": self.episodes,
+                       "test": self.test}, file)
+        os.replace(path + ".tmp", path)
+
+    def state_dict(self):
+        """
+        Returns: number of episodes in the store, to resume a training (see `sim.checkpoint`)
+        """
+        return {"n_episodes": len(self)}
+
+    def load_state_dict(self, state_dict):
+        """
+        Drops the episodes added after the state (e.g. played after the checkpoint of a resumed training).
+        """
+        n_episodes = state_dict["n_episodes"]
+        for file in self.files.values():
+            file.close()
+        self.files = {}
+        # The columns are truncated to the index when they are reopened (see `_open`)
+        del self.offsets[n_episodes + 1:]
+        del self.episodes[n_episodes:]
+        del self.test[n_episodes:]
+        self.flush()
+
+    def close(self):
+        if self.files:
+            self.flush()
+        for file in self.files.values():
+            file.close()
+        self.files = {}
+
+    def load(self):
+        with open(os.path.join(self.path, "metadata.json")) as file:
+            metadata = json.load(file)
+        self.board_size = metadata["board_size"]
+        self.obstacles = [tuple(obstacle) for obstacle in metadata["obstacles"]]
+        self.agent_ids = metadata["agent_ids"]
+        self.magic_switch = metadata["magic_switch"]
+        self.offsets = metadata["offsets"]
+        self.episodes = metadata["episodes"]
+        self.test = metadata["test"]
+
+
+def get_trace_store(env, path):
+    """
+    Returns: the `TraceStore` in path for the board of env (reopened if it exists)
+    """
+    return TraceStore(path, env.board_size, env.obstacles, [agent.id for agent in env.agents],
+                      env.config.env.magic_switch)
+
+
+def load_trace(path, episode=None):
+    """
+    Args:
+        path: .npz file of an `EpisodeTrace`, or folder of a `TraceStore`
+        episode: For a store, index of the episode in the store.
+    Returns: the `EpisodeTrace` saved in path
+    """
+    if os.path.isdir(path):
+        return TraceStore(path).get_episode(episode)
+    with np.load(path) as data:
+        actions = data["actions"] if "actions" in data else None
+        return EpisodeTrace(int(data["board_size"]), data["obstacles"].tolist(), data["agent_ids"].tolist(),
+                            bool(data["magic_switch"]), data["observations"], data["rewards"], actions)
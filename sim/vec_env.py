@@ -0,0 +1,137 @@
+import numpy as np
+
+from sim.collisions import get_collisions
+from sim.grid import Grid
+from sim.rewards import get_rewards
+from sim.state import StateEncoder
+
+
+class VecEnv:
+    """
+    Batched version of `Env`: steps `n_envs` boards at once with NumPy.
+    Positions are kept as integer cell indices in an array of size (n_envs, n_agents, 3)
+    and are only converted to normalized coordinates when the states are emitted.
+    """
+
+    def __init__(self, env_config, config, n_envs):
+        self.n_envs = n_envs
+        self.noise = env_config.noise
+        self.board_size = env_config.board_size
+        self.max_iterations = env_config.max_iterations
+        self.infinite_world = env_config.infinite_world
+        self.world_3D = config.env.world_3D
+        self.use_magic_switch = config.env.magic_switch
+        self.config = config
+
+        self.current_iteration = 0
+
+        self.grid = Grid(self.board_size, env_config.obstacles, self.infinite_world, self.world_3D)
+        self.obstacle_grid = self.grid.obstacle_grid
+        self.obstacles = env_config.obstacles
+        self.number_actions = self.grid.number_actions
+
+        self.agents = []
+        self.initial_types = []
+        self.initial_positions = []
+
+        self.positions = None  # (n_envs, n_agents, 3)
+        self.is_predator = None  # (n_envs, n_agents)
+        self.magic_switch = None  # (n_envs, 2)
+        self.collided_pairs = np.zeros((0, 3), dtype=np.int64)
+        self.encoder = StateEncoder(self.board_size, self.obstacles, 0, self.use_magic_switch)
+
+    @property
+    def n_agents(self):
+        return len(self.agents)
+
+    def add_agent(self, agent, position=None):
+        """
+        Args:
+            agent:
+            position: normalized position as for `Env.add_agent`. If None, random position at each new episode.
+        """
+        assert position is None or (0 <= position[0] < 1 and 0 <= position[1] < 1), "Initial position is incorrect."
+        if self.world_3D:
+            assert position is None or len(position) == 3, "Please provide 3D positions if use 3D world."
+        if position is not None:
+            position = [min(int(round(p * self.board_size)), self.board_size - 1) for p in position]
+            if len(position) == 2:
+                position.append(0)
+            assert not self.obstacle_grid[position[0], position[1]], "Initial position in an obstacle"
+        self.agents.append(agent)
+        self.initial_types.append(agent.initial_type == "predator")
+        self.initial_positions.append(position)
+        self.is_predator = np.tile(np.array(self.initial_types), (self.n_envs, 1))
+        self.encoder = StateEncoder(self.board_size, self.obstacles, self.n_agents, self.use_magic_switch)
+
+    def get_compact_states(self):
+        """
+        Returns: the compact observations of the boards (see `sim.state.StateEncoder`), size (n_envs, compact_dim)
+        """
+        return self.encoder.compact(self.positions, self.is_predator, self.magic_switch)
+
+    def _get_states(self):
+        """
+        Returns: states of size (n_envs, n_agents, state_dim). The state is the same for every agent.
+        """
+        return self.encoder.decode_agents(self.get_compact_states())
+
+    def _get_collisions(self):
+        """
+        The colliding pairs (env, i, j) are kept in `self.collided_pairs`.
+        Returns: number of predator/prey pairs on the same cell, size (n_envs,)
+        """
+        n_collisions, self.collided_pairs = get_collisions(self.positions, self.is_predator, self.board_size)
+        return n_collisions
+
+    def _get_rewards(self):
+        """
+        Returns: rewards of size (n_envs, n_agents)
+        """
+        rewards, _, _ = get_rewards(self.positions, self.is_predator, self.grid.near_obstacle_grid, self.config)
+        return rewards
+
+    def reset(self, test=False):
+        """
+        Returns: (states, types)
+            states of size (n_envs, n_agents, state_dim)
+            types of size (n_envs, n_agents), True for predators.
+        """
+        self.current_iteration = 0
+        self.positions = self.grid.random_positions((self.n_envs, self.n_agents))
+        for k, position in enumerate(self.initial_positions):
+            if position is not None:
+                self.positions[:, k] = position
+        if self.use_magic_switch:
+            self.magic_switch = self.grid.random_positions((self.n_envs,))[:, :2]
+            if not test:
+                self.is_predator = ~self.is_predator
+            else:
+                self.is_predator = np.tile(np.array(self.initial_types), (self.n_envs, 1))
+        return self._get_states(), self.is_predator.copy()
+
+    def step(self, actions):
+        """
+        Args:
+            actions: actions for each agent of each board. Size (n_envs, n_agents)
+        Returns: (next_states, rewards, terminals, n_collisions, types)
+        """
+        actions = np.asarray(actions)
+        positions = self.grid.move(self.positions, actions)
+        if self.use_magic_switch:
+            on_switch = ((positions[..., 0] == self.magic_switch[:, None, 0]) &
+                         (positions[..., 1] == self.magic_switch[:, None, 1]))
+            # Every agent landing on the switch swaps the types
+            swap = on_switch.sum(axis=1) % 2 == 1
+            self.is_predator = self.is_predator ^ swap[:, None]
+        if self.noise > 0:
+            noisy = np.random.random(actions.shape) < self.noise
+            if noisy.any():
+                positions[noisy] = self.grid.random_neighbours(self.positions[noisy])
+        self.positions = positions
+
+        n_collisions = self._get_collisions()
+        rewards = self._get_rewards()
+        self.current_iteration += 1
+        terminals = np.full(self.n_envs, self.current_iteration == self.max_iterations)
+        return self._get_states(), rewards, terminals, n_collisions, self.is_predator.copy()
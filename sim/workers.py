@@ -0,0 +1,176 @@
+import queue
+import random
+
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+
+from sim.env import Env
+from sim.agents.policy import BatchedPolicy
+from utils import np_to_onehot, learn
+
+
+def play_episode(env, agents, policy, action_dim, agents_type="dqn", compact=True):
+    """
+    Plays one training episode without learning.
+    Args:
+        compact: If True, stores the compact observations of the board (see `sim.state.StateEncoder`)
+            instead of the states of the agents.
+    Returns: (states, next_states, actions, rewards) of the episode, each of size (n_steps, ...)
+    """
+    states, types = env.reset()
+    previous = env.get_compact_state() if compact else states
+    episode = []
+    terminal = False
+    while not terminal:
+        actions = policy.draw_actions(states)
+        next_states, rewards, terminal, n_collisions, types = env.step(states, actions)
+        current = env.get_compact_state() if compact else next_states
+        if agents_type == "maddpg":
+            actions = np_to_onehot(actions, action_dim)
+        episode.append((previous, current, actions, rewards))
+        previous = current
+        states = next_states
+    return tuple(np.array(values) for values in zip(*episode))
+
+
+def _run_worker(worker_id, agent_specs, config, agents_type, compact, shared_weights, shared_steps, version, lock,
+                episodes, stop, seed):
+    """
+    Rollout loop of a worker process: plays episodes with CPU copies of the policies of the agents,
+    reloads the weights when the learner broadcasts new ones and puts the transitions in the episodes queue.
+    """
+    torch.set_num_threads(1)
+    # Exit on stop without waiting for the learner to read the last episodes
+    episodes.cancel_join_thread()
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+
+    agents = [agent_class(agent_type, agent_id, "cpu", config.agents, config) for agent_class, agent_type, agent_id in
+              agent_specs]
+    env = Env(config.env, config)
+    for k, agent in enumerate(agents):
+        env.add_agent(agent)
+        if agents_type == "maddpg":
+            agent.add_agents(agents, k)
+    policy = BatchedPolicy(agents)
+    action_dim = agents[0].number_actions
+
+    local_version = -1
+    while not stop.is_set():
+        if version.value != local_version:
+            with lock:
+                local_version = version.value
+                for agent, weights in zip(agents, shared_weights):
+                    agent.get_policy_network().load_state_dict(weights)
+                steps_done = shared_steps.value
+            for agent in agents:  # The exploration follows all the steps played by the workers
+                agent.steps_done = steps_done
+        episode = play_episode(env, agents, policy, action_dim, agents_type, compact)
+        episode = tuple(torch.from_numpy(values) for values in episode)  # Sent through shared memory
+        while not stop.is_set():
+            try:
+                episodes.put((worker_id, episode), timeout=0.1)
+                break
+            except queue.Full:
+                continue
+
+
+class RolloutWorkers:
+    """
+    Pool of worker processes playing training episodes for a central learner (actor/learner split).
+    Each worker runs its own `Env` with CPU copies of the policies of the agents and sends the transitions
+    of its episodes through a shared-memory queue. The learner owns the replay memory, learns, and broadcasts
+    the new weights to the workers with `broadcast`.
+    The workers are forked: the training scripts do not need a `__main__` guard.
+    """
+
+    def __init__(self, agents, config, n_workers, agents_type="dqn", compact=True, queue_size=None, seed=None):
+        """
+        Args:
+            agents: agents of the learner
+            n_workers: number of worker processes
+            compact: If True, the workers send the compact observations of the boards
+            queue_size: maximum number of episodes waiting for the learner. Defaults to 2 per worker.
+        """
+        self.agents = agents
+        self.n_workers = n_workers
+        self.compact = compact
+        self.context = mp.get_context("fork")
+        self.shared_weights = [{name: value.detach().cpu().clone().share_memory_()
+                                for name, value in agent.get_policy_network().state_dict().items()}
+                               for agent in agents]
+        self.shared_steps = self.context.Value("q", agents[0].steps_done)
+        self.version = self.context.Value("q", 0)
+        self.lock = self.context.Lock()
+        self.episodes = self.context.Queue(maxsize=2 * n_workers if queue_size is None else queue_size)
+        self.stop = self.context.Event()
+
+        seed = np.random.randint(2 ** 31) if seed is None else seed
+        agent_specs = [(type(agent), agent.initial_type, agent.id) for agent in agents]
+        self.processes = [self.context.Process(target=_run_worker, daemon=True,
+                                               args=(k, agent_specs, config, agents_type, compact, self.shared_weights,
+                                                     self.shared_steps, self.version, self.lock, self.episodes,
+                                                     self.stop, seed + k))
+                          for k in range(n_workers)]
+        # Goes on with the exploration of the agents (resumed training or loaded model)
+        self.env_steps = agents[0].steps_done
+
+    def start(self):
+        for process in self.processes:
+            process.start()
+
+    def broadcast(self):
+        """
+        Sends the current weights of the policies of the agents to the workers.
+        """
+        with self.lock:
+            with torch.no_grad():
+                for agent, weights in zip(self.agents, self.shared_weights):
+                    for name, value in agent.get_policy_network().state_dict().items():
+                        weights[name].copy_(value)
+            self.shared_steps.value = self.env_steps
+            self.version.value += 1
+
+    def get_episode(self, timeout=None):
+        """
+        Returns: (states, next_states, actions, rewards) of the next episode played by a worker, as numpy arrays
+        """
+        _, episode = self.episodes.get(timeout=timeout)
+        episode = tuple(values.numpy() for values in episode)
+        self.env_steps += len(episode[0])
+        for agent in self.agents:
+            agent.steps_done = self.env_steps
+        return episode
+
+    def close(self):
+        """
+        Stops the workers. The episodes still in the queue are dropped.
+        """
+        self.stop.set()
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+
+
+def train_from_workers(workers, agents, memory, metrics, config, scheduler, agents_type="dqn", learner=None):
+    """
+    Learner side of the actor/learner split: adds the next episode of the workers to the replay memory,
+    learns as the scheduler decides for the steps of the episode and broadcasts the new weights every
+    `config.learning.broadcast_every` updates.
+    Args:
+        scheduler: `utils.LearningScheduler`, the same one for all the episodes
+    Returns: (states, next_states, actions, rewards) of the episode
+    """
+    assert workers.compact == (memory.encoder is not None), \
+        "The workers must send compact observations if and only if the replay memory is compact."
+    episode = workers.get_episode()
+    memory.add_batch(*episode)
+    updates = scheduler.updates
+    for _ in range(scheduler.step(len(memory), n_steps=len(episode[0]))):
+        learn(agents, memory, metrics, config, agents_type, learner)
+    if scheduler.updates // config.learning.broadcast_every != updates // config.learning.broadcast_every:
+        workers.broadcast()
+    return episode
@@ -0,0 +1,40 @@
+import argparse
+import os
+from datetime import datetime
+
+import yaml
+
+parser = argparse.ArgumentParser(description="Trains agents with several configs in parallel "
+                                             "(see sweeps/example.yaml).")
+parser.add_argument("sweep", help="yaml file of the sweep")
+parser.add_argument("--config", default="config/", help="folder of the config of all the trials")
+parser.add_argument("--output", default=None, help="folder of the sweep. Defaults to builds/sweep-<date>")
+parser.add_argument("--processes", type=int, default=None,
+                    help="number of trials at the same time. Defaults to the number of cores divided by --threads")
+parser.add_argument("--threads", type=int, default=1,
+                    help="number of threads of torch, NumPy and their BLAS libraries in each trial")
+parser.add_argument("--seed", type=int, default=None, help="seed of the trials and of the random search")
+args = parser.parse_args()
+
+# Set before NumPy and torch are imported, the trial processes inherit their thread pools
+for name in ["OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"]:
+    os.environ.setdefault(name, str(args.threads))
+from sim.sweep import expand_grid, sample_random, run_sweep
+
+with open(args.sweep) as file:
+    sweep = yaml.load(file, Loader=yaml.FullLoader)
+if sweep.get("search", "grid") == "random":
+    trials = sample_random(sweep["parameters"], sweep["n_trials"], args.seed)
+else:
+    trials = expand_grid(sweep["parameters"])
+output = args.output
+if output is None:
+    output = os.path.join("builds", "sweep-" + datetime.today().strftime('%Y-%m-%d %H:%M:%S'))
+
+print("Running", len(trials), "trials in", output)
+summaries = run_sweep(trials, args.config, output, sweep.get("agents_type", "dqn"), args.processes, args.threads,
+                      sweep.get("early_stopping"), sweep.get("objective", "predator"), args.seed)
+keys = list(summaries[0].keys())
+print(" | ".join(keys))
+for summary in summaries:
+    print(" | ".join(str(summary.get(key, "")) for key in keys))
@@ -0,0 +1,40 @@
+"""
+Helpers shared by the tests. The test folder is on the path when the tests run (pytest, unittest discover),
+so the tests import them with `from helpers import ...`.
+"""
+from sim.agents.agents import AgentDQN
+from utils.config import Config
+
+config = Config('./config')
+
+
+def make_config(base=None, **sections):
+    """
+    Args:
+        base: config to copy. Defaults to the one in ./config
+        **sections: values changed in each section, e.g. make_config(env={"noise": 0})
+    Returns: a new `utils.Config`
+    """
+    data = (config if base is None else base).to_dict()
+    for name, values in sections.items():
+        data[name].update(values)
+    return Config(config=data)
+
+
+def make_agents(agent_class=AgentDQN, n_predators=None, n_preys=None, agents_config=None):
+    """
+    Returns: n_predators predators then n_preys preys of agent_class on the CPU.
+        The numbers default to the ones of the config.
+    """
+    agents_config = config if agents_config is None else agents_config
+    n_predators = agents_config.agents.number_predators if n_predators is None else n_predators
+    n_preys = agents_config.agents.number_preys if n_preys is None else n_preys
+    agents = [agent_class("predator", "predator-{}".format(k), "cpu", agents_config.agents, agents_config)
+              for k in range(n_predators)]
+    return agents + [agent_class("prey", "prey-{}".format(k), "cpu", agents_config.agents, agents_config)
+                     for k in range(n_preys)]
+
+
+def state_dim():
+    n_agents = config.agents.number_predators + config.agents.number_preys
+    return 3 * n_agents + 2 * len(config.env.obstacles) + int(config.env.magic_switch) * (2 + n_agents)
@@ -0,0 +1,106 @@
+import os
+import random
+import tempfile
+import unittest
+
+import numpy as np
+import torch
+
+from sim.agents.learner import MultiAgentDQNLearner
+from sim.checkpoint import CheckpointManager, get_checkpoint, restore_checkpoint, set_rng_states
+from sim.memory import ReplayMemory, PrioritizedReplayMemory
+from utils import LearningScheduler, Metrics
+
+from helpers import make_agents
+
+
+class TestCheckpoint(unittest.TestCase):
+    def test_save_load(self):
+        agents = make_agents(n_predators=2, n_preys=0)
+        learner = MultiAgentDQNLearner(agents)
+        memory = ReplayMemory(10)
+        memory.add_batch(np.zeros((3, 2)), np.zeros((3, 2)), np.zeros((3, 2)), np.zeros((3, 2)))
+        scheduler = LearningScheduler()
+        scheduler.step(len(memory), n_steps=7)
+        agents[0].steps_done = 12
+        with tempfile.TemporaryDirectory() as path:
+            checkpoints = CheckpointManager(path)
+            checkpoints.save(get_checkpoint(4, agents, learner, memory, scheduler))
+            weights = agents[0].policy_net.fc[0].weight.detach().clone()
+            # The checkpoint is a snapshot: the training can go on while it is written
+            with torch.no_grad():
+                agents[0].policy_net.fc[0].weight.add_(1)
+            checkpoints.close()
+            self.assertEqual(sorted(os.listdir(path)), ["checkpoint-4.pth", "checkpoint-4.replay.npz"])
+
+            checkpoint = checkpoints.load()
+            self.assertEqual(checkpoint["episode"], 4)
+            self.assertEqual(checkpoint["agents"]["predator-0"]["steps_done"], 12)
+            self.assertEqual((checkpoint["replay"]["position"], checkpoint["replay"]["length"]), (3, 3))
+            self.assertEqual(checkpoint["replay"]["arrays"]["states"].shape, (3, 2))
+            self.assertEqual(checkpoint["scheduler"]["env_steps"], 7)
+            self.assertEqual(checkpoint["learner"]["n_iter"], 0)
+            torch.testing.assert_close(checkpoint["agents"]["predator-0"]["state"]["policy"]["fc.0.weight"], weights)
+            other = make_agents(n_predators=2, n_preys=0)
+            other[0].load_state_dict(checkpoint["agents"]["predator-0"]["state"])
+            torch.testing.assert_close(other[0].policy_net.fc[0].weight, weights)
+
+    def test_retention(self):
+        agents = make_agents(n_predators=2, n_preys=0)
+        with tempfile.TemporaryDirectory() as path:
+            checkpoints = CheckpointManager(path, every=10, keep_last=2)
+            for episode in range(50):
+                if checkpoints.should_save(episode):
+                    checkpoints.save(get_checkpoint(episode, agents))
+            checkpoints.wait()
+            self.assertEqual(checkpoints.get_paths(), [os.path.join(path, "checkpoint-30.pth"),
+                                                       os.path.join(path, "checkpoint-40.pth")])
+            self.assertFalse([name for name in os.listdir(path) if name.endswith(".tmp")])
+            checkpoints.close()
+
+    def test_resume(self):
+        agents = make_agents(n_predators=2, n_preys=0)
+        learner = MultiAgentDQNLearner(agents)
+        memory = PrioritizedReplayMemory(10)
+        memory.add_batch(np.random.rand(4, 2), np.random.rand(4, 2), np.random.rand(4, 2), np.random.rand(4, 2))
+        memory.update_priorities(np.arange(4), np.arange(4) + 1.)
+        metrics = [Metrics() for _ in agents]
+        metrics[0].add_return(2.)
+        metrics[0].compute_averages()
+        metrics[1].add_loss(0.5)
+        agents[0].steps_done, agents[1].n_iter = 30, 5
+        with tempfile.TemporaryDirectory() as path:
+            checkpoints = CheckpointManager(path, asynchronous=False)
+            checkpoints.save(get_checkpoint(7, agents, learner, memory, metrics=metrics))
+
+            # A new process starts from scratch and goes on with the training
+            other_agents = make_agents(n_predators=2, n_preys=0)
+            other_learner = MultiAgentDQNLearner(other_agents)
+            other_memory = PrioritizedReplayMemory(10)
+            other_metrics = [Metrics() for _ in agents]
+            episode = restore_checkpoint(checkpoints.load(), other_agents, other_learner, other_memory,
+                                         metrics=other_metrics)
+            self.assertEqual(episode, 8)
+            self.assertEqual((other_agents[0].steps_done, other_agents[1].n_iter), (30, 5))
+            self.assertEqual(other_agents[0].get_eps_threshold(), agents[0].get_eps_threshold())
+            self.assertEqual(len(other_memory), 4)
+            for name in memory.keys:
+                np.testing.assert_array_equal(other_memory.internal_memory[name], memory.internal_memory[name])
+            np.testing.assert_array_equal(other_memory.priorities.tree, memory.priorities.tree)
+            self.assertEqual(other_memory.max_priority, memory.max_priority)
+            self.assertEqual(other_metrics[0].data["returns"], [2.])
+            self.assertEqual(other_metrics[1].loss_buffer, [0.5])
+            torch.testing.assert_close(other_agents[1].policy_net.fc[0].weight, agents[1].policy_net.fc[0].weight)
+
+    def test_rng_states(self):
+        agents = make_agents(n_predators=2, n_preys=0)
+        with tempfile.TemporaryDirectory() as path:
+            checkpoints = CheckpointManager(path, asynchronous=False)
+            checkpoints.save(get_checkpoint(0, agents))
+            expected = random.random(), np.random.random(), torch.rand(1).item()
+            set_rng_states(checkpoints.load()["rng"])
+            self.assertEqual((random.random(), np.random.random(), torch.rand(1).item()), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
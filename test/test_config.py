@@ -0,0 +1,60 @@
+import pickle
+import subprocess
+import sys
+import unittest
+from contextlib import ExitStack
+from unittest import mock
+
+from sim.evaluation import evaluate
+from utils.config import Config
+
+from helpers import make_agents, make_config
+
+
+class TestConfig(unittest.TestCase):
+    def test_sections(self):
+        config = Config('./config')
+        self.assertIs(config.env, config.env)
+        self.assertEqual(config.env.board_size, config["env"]["board_size"])
+        config.env.set("board_size", 3)
+        self.assertEqual(config.env.board_size, 3)
+        self.assertEqual(config["env"]["board_size"], 3)
+        with self.assertRaises(AttributeError):
+            config.env.board_size = 4
+        self.assertFalse(hasattr(config.env, "not_a_key"))
+
+    def test_pickle(self):
+        config = Config('./config')
+        loaded = pickle.loads(pickle.dumps(config))
+        self.assertEqual(loaded.env.board_size, config.env.board_size)
+        loaded.env.set("board_size", 3)
+        self.assertEqual(loaded["env"]["board_size"], 3)
+
+    def test_lazy_imports(self):
+        # The environments are imported without torch, matplotlib and without reading the config
+        code = ("import sys; import utils.config; from sim import Env, VecEnv; "
+                "print(sorted(set(sys.modules) & {'torch', 'matplotlib'}), utils.config._default_config)")
+        output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+        self.assertEqual(output.strip(), "[] None")
+
+    def test_several_configs(self):
+        # Two boards with different sizes, obstacles and numbers of agents in one process
+        setups = []
+        for board_size, obstacles, number_predators in [(10, [], 1), (6, [[2, 2], [3, 3]], 3)]:
+            config = make_config(env={"board_size": board_size, "obstacles": obstacles, "world_3D": False,
+                                      "magic_switch": False},
+                                 agents={"number_predators": number_predators, "number_preys": 1})
+            agents = make_agents(agents_config=config)
+            self.assertEqual(agents[0].policy_net.fc[0].in_features, 3 * len(agents) + 2 * len(obstacles))
+            setups.append((agents, config))
+        # The evaluation only reads the given configs
+        with ExitStack() as stack:
+            for module in ["utils.config", "model.dqn", "sim.agents.agents", "sim.agents.learner", "sim.rewards"]:
+                stack.enter_context(mock.patch(module + ".get_default_config", side_effect=AssertionError))
+            for agents, config in setups:
+                returns, _ = evaluate(agents, config, 2)
+                self.assertEqual(returns.shape, (2, len(agents)))
+
+
+if __name__ == '__main__':
+    unittest.main()
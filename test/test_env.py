@@ -0,0 +1,92 @@
+import unittest
+
+import numpy as np
+
+from sim.collisions import get_collisions, _get_dense_collisions, _get_hashed_collisions
+from sim.env import Env
+from sim.grid import Grid
+from sim.agents.agents import Agent
+
+from helpers import make_agents, make_config
+
+
+def make_env(**env):
+    env_config = make_config(env=env)
+    env = Env(env_config.env, env_config)
+    for agent in make_agents(Agent, 1, 1):
+        env.add_agent(agent)
+    return env
+
+
+class TestEnv(unittest.TestCase):
+
+    def test_positions_are_cell_indices(self):
+        env = make_env(noise=0, magic_switch=False)
+        states, _ = env.reset()
+        self.assertEqual(env.positions.dtype, np.int64)
+        np.testing.assert_allclose(states[0][:6], env.positions.flatten() / env.board_size)
+        for x, y, _ in env.positions:
+            self.assertFalse([x, y] in env.obstacles)
+
+    def test_moves(self):
+        env = make_env(noise=0, magic_switch=False, obstacles=[[1, 1]])
+        states, _ = env.reset()
+        env.positions[:] = [[0, 0, 0], [1, 0, 0]]
+        # Left against the wall, Front into the obstacle
+        env.step(states, [2, 1])
+        np.testing.assert_array_equal(env.positions, [[0, 0, 0], [1, 0, 0]])
+        next_states, _, _, n_collisions, _ = env.step(states, [4, 0])
+        np.testing.assert_array_equal(env.positions, [[1, 0, 0], [1, 0, 0]])
+        self.assertEqual(n_collisions, 1)
+        self.assertAlmostEqual(next_states[1][0], 1 / env.board_size)
+
+    def test_noise(self):
+        env = make_env(noise=1, magic_switch=False, obstacles=[[1, 0]])
+        states, _ = env.reset()
+        for _ in range(20):
+            env.positions[:] = [[0, 0, 0], [5, 5, 0]]
+            env.step(states, [0, 0])
+            self.assertIn(tuple(env.positions[0]), [(0, 0, 0), (0, 1, 0)])
+
+
+class TestGrid(unittest.TestCase):
+
+    def test_transition_table(self):
+        grid = Grid(4, [[1, 1]])
+        self.assertEqual(grid.transitions.shape, (16, 5))
+        # Left against the wall, Front into the obstacle, Right
+        np.testing.assert_array_equal(grid.move(np.array([[0, 0, 0], [1, 0, 0], [1, 0, 0]]), np.array([2, 1, 4])),
+                                      [[0, 0, 0], [1, 0, 0], [2, 0, 0]])
+        self.assertEqual(sorted(grid.possible_positions((1, 0, 0))), [(0, 0, 0), (1, 0, 0), (2, 0, 0)])
+        self.assertTrue(grid.near_obstacle_grid[0, 1] and grid.near_obstacle_grid[1, 2])
+        self.assertFalse(grid.near_obstacle_grid[0, 0] or grid.near_obstacle_grid[1, 1])
+
+    def test_infinite_3D(self):
+        grid = Grid(4, [], infinite_world=True, world_3D=True)
+        self.assertEqual(grid.transitions.shape, (64, 7))
+        np.testing.assert_array_equal(grid.move(np.array([[0, 3, 0], [2, 2, 3]]), np.array([3, 5])),
+                                      [[0, 2, 0], [2, 2, 0]])
+        self.assertTrue(grid.possible_moves.all())
+
+
+class TestCollisions(unittest.TestCase):
+
+    def test_pairs(self):
+        positions = np.array([[2, 2, 0], [2, 2, 0], [2, 2, 0], [4, 4, 0]])
+        n_collisions, pairs = get_collisions(positions, np.array([True, True, False, False]), 15)
+        self.assertEqual(n_collisions, 2)
+        np.testing.assert_array_equal(pairs, [[0, 2], [1, 2]])
+
+    def test_hash_same_as_dense(self):
+        np.random.seed(0)
+        positions = np.random.randint(5, size=(10, 100, 3))
+        is_predator = np.random.random((10, 100)) < 0.5
+        np.testing.assert_array_equal(_get_hashed_collisions(positions, is_predator, 5),
+                                      _get_dense_collisions(positions, is_predator))
+        n_collisions, pairs = get_collisions(positions, is_predator, 5)
+        self.assertEqual(n_collisions.shape, (10,))
+        self.assertEqual(n_collisions.sum(), len(pairs))
+
+
+if __name__ == '__main__':
+    unittest.main()
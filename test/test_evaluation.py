@@ -0,0 +1,77 @@
+import random
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from sim.env import Env
+from sim.evaluation import Evaluator, evaluate
+from sim.vec_env import VecEnv
+from utils import Metrics
+
+from helpers import config, make_agents
+
+
+class TestEvaluation(unittest.TestCase):
+
+    def test_evaluate(self):
+        agents = make_agents()
+        returns, collisions = evaluate(agents, config, 6)
+        self.assertEqual(returns.shape, (6, len(agents)))
+        self.assertEqual(collisions.shape, (6, config.env.max_iterations))
+        self.assertEqual(agents[0].steps_done, 0)
+
+    def test_evaluate_initial_types(self):
+        agents = make_agents()
+        env = Env(config.env, config)
+        for agent in agents:
+            env.add_agent(agent)
+        test_types = []
+
+        class RecordingVecEnv(VecEnv):
+            def reset(self, test=False):
+                states, types = super(RecordingVecEnv, self).reset(test)
+                test_types.append(self.is_predator.copy())
+                return states, types
+
+        # With the magic switch, a training episode swaps the types of the agents
+        for _ in range(3):
+            env.reset()
+            with mock.patch("sim.evaluation.VecEnv", RecordingVecEnv):
+                evaluate(agents, config, 2)
+            expected = np.array([agent.type == "predator" for agent in make_agents()])
+            np.testing.assert_array_equal(test_types[-1], np.tile(expected, (2, 1)))
+
+    def test_evaluator_weights(self):
+        agents = make_agents()
+        np.random.seed(0)
+        seed = int(np.random.randint(2 ** 31, size=1)[0])
+        random.seed(seed)
+        np.random.seed(seed)
+        expected, _ = evaluate(agents, config, 3)
+        # The process plays with CPU copies of the agents, from the same seed
+        metrics = [Metrics() for _ in agents]
+        evaluator = Evaluator(agents, config, 3, n_processes=1)
+        np.random.seed(0)
+        evaluator.run(metrics, Metrics())
+        for k, metric in enumerate(metrics):
+            np.testing.assert_allclose(metric.returns_buffer, expected[:, k], rtol=1e-5)
+        evaluator.close()
+
+    def test_evaluator(self):
+        for n_processes, asynchronous in [(0, False), (2, False), (2, True)]:
+            agents = make_agents()
+            metrics = [Metrics() for _ in agents]
+            collision_metric = Metrics()
+            evaluator = Evaluator(agents, config, 5, n_processes, asynchronous)
+            evaluator.run(metrics, collision_metric)
+            if asynchronous:
+                self.assertTrue(evaluator.collect(metrics, collision_metric, block=True))
+            self.assertFalse(evaluator.collect(metrics, collision_metric))
+            self.assertEqual(len(metrics[0].returns_buffer), 5)
+            self.assertEqual(len(collision_metric.collision_count_buffer), 5 * config.env.max_iterations)
+            evaluator.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
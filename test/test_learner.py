@@ -0,0 +1,93 @@
+import copy
+import unittest
+
+import numpy as np
+import torch
+
+from sim.agents.agents import AgentDQN
+from sim.agents.learner import MultiAgentDQNLearner, MultiAgentMADDPGLearner
+from sim.agents.multiagents import AgentMADDPG
+from sim.agents.policy import BatchedPolicy
+
+from helpers import make_agents, state_dim
+
+
+def make_batch(n_agents, batch_size=32):
+    return (np.random.random((batch_size, n_agents, state_dim())).astype(np.float32),
+            np.random.random((batch_size, n_agents, state_dim())).astype(np.float32),
+            np.random.randint(0, 5, (batch_size, n_agents)),
+            np.random.random((batch_size, n_agents)).astype(np.float32))
+
+
+class TestMultiAgentDQNLearner(unittest.TestCase):
+
+    def test_same_as_agents(self):
+        agents = make_agents(AgentDQN)
+        reference = copy.deepcopy(agents)
+        learner = MultiAgentDQNLearner(agents)
+        # The optimizers of the agents are replaced by the one of the learner
+        self.assertNotIn("policy_optimizer", agents[0].state_dict())
+        reference[0].load_state_dict(agents[0].state_dict())
+        for _ in range(3):
+            batch = make_batch(len(agents))
+            weights = np.random.random(32)
+            losses = learner.learn(batch, weights)
+            for k, agent in enumerate(reference):
+                loss = agent.learn((batch[0][:, k], batch[1][:, k], batch[2][:, k], batch[3][:, k]), weights)
+                self.assertAlmostEqual(losses[k], loss, places=4)
+                np.testing.assert_allclose(agents[k].td_errors, agent.td_errors, rtol=1e-4, atol=1e-5)
+        for agent, expected in zip(agents, reference):
+            self.assertEqual(agent.n_iter, expected.n_iter)
+            for param, expected_param in zip(agent.policy_net.parameters(), expected.policy_net.parameters()):
+                torch.testing.assert_close(param, expected_param, rtol=1e-4, atol=1e-4)
+            for param, expected_param in zip(agent.target_net.parameters(), expected.target_net.parameters()):
+                torch.testing.assert_close(param, expected_param, rtol=1e-4, atol=1e-4)
+
+
+class TestMultiAgentMADDPGLearner(unittest.TestCase):
+
+    def make_batch(self, n_agents, batch_size=32):
+        states, next_states, actions, rewards = make_batch(n_agents, batch_size)
+        return states, next_states, np.eye(5, dtype=np.float32)[actions], rewards
+
+    def test_critic_losses(self):
+        agents = make_agents(AgentMADDPG)
+        for k, agent in enumerate(agents):
+            agent.add_agents(agents, k)
+            with torch.no_grad():  # The targets are the rewards
+                agent.target_critic.fc[-1].weight.zero_()
+                agent.target_critic.fc[-1].bias.zero_()
+        reference = copy.deepcopy(agents)
+        learner = MultiAgentMADDPGLearner(agents)
+        batch = self.make_batch(len(agents))
+        critic_losses, actor_losses = learner.learn(batch)
+        self.assertEqual(critic_losses.shape, (len(agents),))
+        self.assertEqual(actor_losses.shape, (len(agents),))
+        self.assertEqual(learner.td_errors.shape, (len(agents), 32))
+        actions = [torch.tensor(batch[2][:, a]) for a in range(len(agents))]
+        for k, agent in enumerate(reference):
+            with torch.no_grad():
+                predicted = agent.policy_critic(torch.tensor(batch[0][:, k]), actions).squeeze(1)
+            expected = ((predicted - torch.tensor(batch[3][:, k])) ** 2).mean().item()
+            self.assertAlmostEqual(critic_losses[k], expected, places=4)
+
+    def test_updates_agents(self):
+        agents = make_agents(AgentMADDPG)
+        for k, agent in enumerate(agents):
+            agent.add_agents(agents, k)
+        policy = BatchedPolicy(agents)
+        reference = copy.deepcopy(agents)
+        learner = MultiAgentMADDPGLearner(agents)
+        for _ in range(2):
+            learner.learn(self.make_batch(len(agents)))
+        for agent, expected in zip(agents, reference):
+            self.assertEqual(agent.n_iter, 4)
+            self.assertFalse(torch.equal(agent.policy_critic.fc[0].weight, expected.policy_critic.fc[0].weight))
+            self.assertFalse(torch.equal(agent.policy_actor.fc[0].weight, expected.policy_actor.fc[0].weight))
+        # The batched policy draws the actions with the updated actors
+        stacked = policy.groups[0][1].params["fc.0.weight"]
+        self.assertEqual(stacked.data_ptr(), agents[0].policy_actor.fc[0].weight.data_ptr())
+
+
+if __name__ == '__main__':
+    unittest.main()
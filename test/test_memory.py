@@ -0,0 +1,149 @@
+import tempfile
+import unittest
+
+import numpy as np
+
+from sim.memory import ReplayMemory, PrioritizedReplayMemory, SumTree, MemmapReplayMemory, PrioritizedMemmapReplayMemory
+from sim.state import StateEncoder
+
+
+def transition(k, n_agents=3, state_dim=4):
+    return (np.full((n_agents, state_dim), k), np.full((n_agents, state_dim), k + 1),
+            [k % 5] * n_agents, [float(k)] * n_agents)
+
+
+class TestReplayMemory(unittest.TestCase):
+
+    def test_ring_buffer(self):
+        memory = ReplayMemory(25)
+        for k in range(30):
+            memory.add(*transition(k))
+        self.assertEqual(len(memory), 25)
+        self.assertEqual(memory.internal_memory["states"].shape, (25, 3, 4))
+        self.assertEqual(memory.internal_memory["states"].dtype, np.float32)
+        self.assertEqual(memory.internal_memory["actions"].dtype, np.int64)
+        # Oldest entries were overwritten
+        self.assertEqual(sorted(memory.internal_memory["rewards"][:, 0]), list(range(5, 30)))
+
+    def test_get_batch(self):
+        memory = ReplayMemory(100)
+        for k in range(20):
+            memory.add(*transition(k))
+        self.assertIsNone(memory.get_batch(21))
+        for k in range(20, 50):
+            memory.add(*transition(k))
+        states, next_states, actions, rewards = memory.get_batch(4)
+        self.assertEqual(states.shape, (4, 3, 4))
+        self.assertTrue(states.flags["C_CONTIGUOUS"])
+        np.testing.assert_array_equal(next_states, states + 1)
+        np.testing.assert_array_equal(rewards[:, 0], states[:, 0, 0])
+        _, _, _, rewards = memory.get_batch(4, shuffle=False)
+        np.testing.assert_array_equal(rewards[:, 0], [46, 47, 48, 49])
+
+    def test_add_batch(self):
+        memory = ReplayMemory(10)
+        states, next_states, actions, rewards = zip(*[transition(k) for k in range(12)])
+        memory.add_batch(states, next_states, actions, rewards)
+        self.assertEqual(len(memory), 10)
+        self.assertEqual(memory.position, 2)
+        self.assertEqual(memory.internal_memory["rewards"][0, 0], 10)
+
+
+class TestPrioritizedReplayMemory(unittest.TestCase):
+
+    def test_sum_tree(self):
+        tree = SumTree(5)
+        tree.update(np.arange(5), [1., 2., 3., 0., 4.])
+        self.assertEqual(tree.total, 10)
+        np.testing.assert_array_equal(tree.find([0, 0.5, 1, 2.9, 3, 5.9, 6, 9.9]), [0, 0, 1, 1, 2, 2, 4, 4])
+        tree.update([1], [0.])
+        self.assertEqual(tree.total, 8)
+
+    def test_sampling(self):
+        np.random.seed(0)
+        memory = PrioritizedReplayMemory(100, alpha=1, beta=1)
+        for k in range(50):
+            memory.add(*transition(k))
+        td_errors = np.zeros(50)
+        td_errors[7] = 1000
+        memory.update_priorities(np.arange(50), td_errors)
+        states, next_states, actions, rewards, weights, indices = memory.get_batch(4)
+        np.testing.assert_array_equal(indices, [7, 7, 7, 7])
+        np.testing.assert_array_equal(rewards[:, 0], [7, 7, 7, 7])
+        self.assertEqual(weights.max(), 1)
+
+
+class TestMemmapReplayMemory(unittest.TestCase):
+
+    def test_reopen(self):
+        with tempfile.TemporaryDirectory() as path:
+            memory = MemmapReplayMemory(60, path)
+            for k in range(70):
+                memory.add(*transition(k))
+            memory.flush()
+            _, _, _, rewards = memory.get_batch(5, shuffle=False)
+            np.testing.assert_array_equal(rewards[:, 0], [65, 66, 67, 68, 69])
+
+            memory = MemmapReplayMemory(60, path)
+            self.assertEqual(len(memory), 60)
+            self.assertEqual(memory.position, 10)
+            memory.add(*transition(70))
+            states, next_states, _, rewards = memory.get_batch(5, shuffle=False)
+            np.testing.assert_array_equal(rewards[:, 0], [66, 67, 68, 69, 70])
+            np.testing.assert_array_equal(next_states, states + 1)
+            # The batches are not overwritten by the next ones
+            memory.get_batch(5)
+            np.testing.assert_array_equal(rewards[:, 0], [66, 67, 68, 69, 70])
+
+    def test_prioritized_reopen(self):
+        with tempfile.TemporaryDirectory() as path:
+            memory = PrioritizedMemmapReplayMemory(100, path, alpha=1, beta=1)
+            for k in range(50):
+                memory.add(*transition(k))
+            memory.update_priorities(np.arange(50), np.arange(50))
+            memory.flush()
+            memory = PrioritizedMemmapReplayMemory(100, path, alpha=1, beta=1)
+            self.assertAlmostEqual(memory.priorities.total, np.arange(50).sum() + 50 * memory.eps)
+            self.assertEqual(memory.max_priority, 49 + memory.eps)
+            self.assertEqual(len(memory.get_batch(5)), 6)
+
+    def test_prioritized_reopen_float32(self):
+        with tempfile.TemporaryDirectory() as path:
+            memory = PrioritizedMemmapReplayMemory(100, path)
+            for k in range(50):
+                memory.add(*transition(k))
+            indices = memory.get_batch(5)[-1]
+            # TD errors computed by the learners are float32
+            memory.update_priorities(indices, np.full(5, 3, dtype=np.float32))
+            memory.flush()
+            memory = PrioritizedMemmapReplayMemory(100, path)
+            self.assertAlmostEqual(memory.max_priority, 3 + memory.eps, places=5)
+
+
+class TestCompactReplayMemory(unittest.TestCase):
+
+    def test_encoder(self):
+        encoder = StateEncoder(10, [[1, 2], [3, 4]], 2, magic_switch=True)
+        compact = encoder.compact([[1, 1, 0], [5, 6, 0]], [True, False], [9, 8])
+        self.assertEqual(compact.dtype, np.int16)
+        np.testing.assert_allclose(encoder.decode(compact),
+                                   [0.1, 0.1, 0, 0.5, 0.6, 0, 0.1, 0.2, 0.3, 0.4, 0.9, 0.8, 1, 0], rtol=1e-6)
+        self.assertEqual(encoder.decode_agents(compact[None]).shape, (1, 2, encoder.state_dim))
+
+    def test_batch(self):
+        encoder = StateEncoder(10, [[1, 2], [3, 4]], 3, magic_switch=False)
+        memory = ReplayMemory(100, encoder)
+        for k in range(50):
+            positions = np.full((3, 3), k % 10)
+            memory.add(encoder.compact(positions, [True, False, False]), encoder.compact(positions + 0, [1, 0, 0]),
+                       [0, 1, 2], [0.] * 3)
+        self.assertEqual(memory.internal_memory["states"].shape, (100, encoder.compact_dim))
+        states, next_states, _, _ = memory.get_batch(4)
+        self.assertEqual(states.shape, (4, 3, encoder.state_dim))
+        self.assertEqual(states.dtype, np.float32)
+        np.testing.assert_array_equal(states, next_states)
+        np.testing.assert_allclose(states[:, :, 9:], np.broadcast_to([0.1, 0.2, 0.3, 0.4], (4, 3, 4)))
+
+
+if __name__ == '__main__':
+    unittest.main()
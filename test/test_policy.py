@@ -0,0 +1,56 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import torch
+
+from sim.agents.agents import AgentDQN
+from sim.agents.multiagents import AgentMADDPG
+from sim.agents.policy import BatchedPolicy
+
+from helpers import make_agents, state_dim
+
+
+class TestBatchedPolicy(unittest.TestCase):
+
+    def test_same_as_agents(self):
+        agents = make_agents(AgentDQN)
+        policy = BatchedPolicy(agents)
+        states = np.random.random((6, len(agents), state_dim())).astype(np.float32)
+        actions = policy.draw_actions(states, no_exploration=True)
+        self.assertEqual(actions.shape, (6, len(agents)))
+        for n in range(6):
+            expected = [agent.draw_action(states[n, k], no_exploration=True) for k, agent in enumerate(agents)]
+            np.testing.assert_array_equal(actions[n], expected)
+        self.assertEqual(policy.draw_actions(states[0]).shape, (len(agents),))
+
+    def test_follows_learning(self):
+        agents = make_agents(AgentDQN)
+        policy = BatchedPolicy(agents)
+        network = agents[1].policy_net
+        with torch.no_grad():
+            network.fc[-1].bias.copy_(torch.tensor([0., 0., 10., 0., 0.]))
+            network.fc[-1].weight.zero_()
+        states = np.random.random((len(agents), state_dim())).astype(np.float32)
+        self.assertEqual(policy.draw_actions(states, no_exploration=True)[1], 2)
+
+    def test_maddpg(self):
+        agents = make_agents(AgentMADDPG)
+        policy = BatchedPolicy(agents)
+        states = np.random.random((3, len(agents), state_dim())).astype(np.float32)
+        actions = policy.draw_actions(states)
+        self.assertTrue(((0 <= actions) & (actions < agents[0].number_actions)).all())
+
+    def test_save_size(self):
+        agents = make_agents(AgentDQN)
+        with tempfile.TemporaryDirectory() as path:
+            agents[0].save(os.path.join(path, "before.pth"))
+            BatchedPolicy(agents)
+            agents[0].save(os.path.join(path, "after.pth"))
+            self.assertAlmostEqual(os.path.getsize(os.path.join(path, "before.pth")),
+                                   os.path.getsize(os.path.join(path, "after.pth")), delta=1000)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+
+import numpy as np
+
+from sim.rewards import get_rewards, get_reward_agent, get_distances
+from sim.agents.agents import Agent
+
+from helpers import config, make_agents
+
+
+class TestRewards(unittest.TestCase):
+
+    def setUp(self):
+        np.random.seed(0)
+        self.board_size = config.env.board_size
+        self.agents = make_agents(Agent, 3, 2)
+        self.is_predator = np.array([agent.type == "predator" for agent in self.agents])
+
+    def test_same_as_agent_rewards(self):
+        for _ in range(20):
+            positions = np.random.randint(self.board_size, size=(len(self.agents), 3))
+            positions[:, 2] = 0
+            distances = get_distances(positions, self.board_size)
+            if np.isclose(distances, 1 / self.board_size).any():  # Float comparisons of the reference are fragile
+                continue
+            rewards, winners, enemies_near = get_rewards(positions, self.is_predator)
+            observations = list(positions.flatten() / self.board_size)
+            for k in range(len(self.agents)):
+                reward, winner, near = get_reward_agent(observations, k, self.agents, 0)
+                self.assertAlmostEqual(rewards[k], reward)
+                self.assertEqual(winners[k], winner)
+                self.assertEqual(list(np.flatnonzero(enemies_near[k])), near)
+
+    def test_batch(self):
+        positions = np.random.randint(self.board_size, size=(8, len(self.agents), 3))
+        rewards, winners, enemies_near = get_rewards(positions, np.tile(self.is_predator, (8, 1)))
+        self.assertEqual(rewards.shape, (8, len(self.agents)))
+        self.assertEqual(enemies_near.shape, (8, len(self.agents), len(self.agents)))
+        for k in range(8):
+            np.testing.assert_allclose(rewards[k], get_rewards(positions[k], self.is_predator)[0])
+
+    def test_capture(self):
+        positions = np.array([[2, 2, 0], [7, 7, 0], [9, 9, 0], [2, 2, 0], [12, 12, 0]])
+        rewards, winners, _ = get_rewards(positions, self.is_predator)
+        self.assertEqual(rewards[0], 1)
+        self.assertEqual(rewards[3], -1)
+        np.testing.assert_array_equal(winners, [True, False, False, False, True])
+
+
+if __name__ == '__main__':
+    unittest.main()
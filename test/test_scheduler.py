@@ -0,0 +1,42 @@
+import unittest
+
+from utils.scheduler import LearningScheduler, get_learning_scheduler
+
+from helpers import make_config
+
+
+class TestLearningScheduler(unittest.TestCase):
+
+    def test_warmup(self):
+        scheduler = LearningScheduler(warmup=10)
+        self.assertEqual(scheduler.step(9), 0)
+        self.assertEqual(scheduler.step(10), 1)
+        self.assertEqual(scheduler.updates, 1)
+
+    def test_config_warmup(self):
+        # Not set: follows the batch size
+        config = make_config(learning={"warmup": False, "batch_size": 32})
+        self.assertEqual(get_learning_scheduler(config.learning).warmup, 320)
+        config = make_config(learning={"warmup": 0, "batch_size": 32})
+        self.assertEqual(get_learning_scheduler(config.learning).warmup, 32)
+
+    def test_cadence(self):
+        scheduler = LearningScheduler(train_every=4, gradient_steps=2)
+        n_updates = [scheduler.step(100) for _ in range(8)]
+        self.assertEqual(n_updates, [0, 0, 0, 2, 0, 0, 0, 2])
+        # Vectorized environments make several steps at once
+        self.assertEqual(scheduler.step(100, n_steps=8), 4)
+        self.assertEqual(scheduler.env_steps, 16)
+        self.assertEqual(scheduler.updates, 8)
+
+    def test_rates(self):
+        scheduler = LearningScheduler(train_every=2)
+        for _ in range(10):
+            scheduler.step(100)
+        env_steps_per_second, updates_per_second = scheduler.get_rates()
+        self.assertAlmostEqual(updates_per_second / env_steps_per_second, 0.5)
+        self.assertEqual(scheduler.get_rates()[1], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import csv
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from sim.sweep import (MedianStopper, expand_grid, get_objective, get_trial_config, run_sweep, run_trial,
+                       sample_random)
+
+from helpers import make_agents
+
+# Small trials
+overrides = {"env.max_iterations": 5, "env.world_3D": False, "agents.number_predators": 1,
+             "learning.n_episodes": 3, "learning.test_every": 2, "learning.n_episode_in_test": 2,
+             "learning.warmup": 8, "learning.batch_size": 8, "replay_memory.size": 100}
+
+
+class TestSweep(unittest.TestCase):
+    def test_expand_grid(self):
+        trials = expand_grid({"agents.lr": [0.1, 0.01], "agents.gamma": [0.9, 0.99], "learning.batch_size": [32]})
+        self.assertEqual(len(trials), 4)
+        self.assertIn({"agents.lr": 0.01, "agents.gamma": 0.9, "learning.batch_size": 32}, trials)
+
+    def test_sample_random(self):
+        trials = sample_random({"agents.lr": {"low": 1e-4, "high": 1e-2, "log": True},
+                                "learning.batch_size": {"low": 16, "high": 256, "integer": True},
+                                "agents.update_type": ["hard", "soft"]}, 20, seed=0)
+        self.assertEqual(len(trials), 20)
+        for trial in trials:
+            self.assertTrue(1e-4 <= trial["agents.lr"] <= 1e-2)
+            self.assertIsInstance(trial["learning.batch_size"], int)
+            self.assertIn(trial["agents.update_type"], ["hard", "soft"])
+        self.assertEqual(trials, sample_random({"agents.lr": {"low": 1e-4, "high": 1e-2, "log": True},
+                                                "learning.batch_size": {"low": 16, "high": 256, "integer": True},
+                                                "agents.update_type": ["hard", "soft"]}, 20, seed=0))
+
+    def test_trial_config(self):
+        config = get_trial_config("./config", {"agents.lr": 0.5, "reward.coef_distance_reward_prey": 2})
+        self.assertEqual(config.agents.lr, 0.5)
+        self.assertEqual(config.reward.coef_distance_reward_prey, 2)
+        for key in ["agents.lrr", "agent.lr"]:
+            with self.assertRaisesRegex(AssertionError, key):
+                get_trial_config("./config", {key: 0.5})
+
+    def test_objective(self):
+        agents = make_agents(n_predators=1, n_preys=1)
+        # Types swapped by the magic switch of the last training episode
+        agents[0].type, agents[1].type = "prey", "predator"
+        returns = np.array([[1., 3.], [2., 4.]])
+        self.assertEqual(get_objective(returns, agents, "predator"), 1.5)
+        self.assertEqual(get_objective(returns, agents, "prey"), 3.5)
+        self.assertEqual(get_objective(returns, agents, "all"), 2.5)
+
+    def test_median_stopper(self):
+        stopper = MedianStopper({}, grace_episodes=10, min_trials=2)
+        self.assertFalse(stopper.should_stop("trial-0", 10, 1.))
+        self.assertFalse(stopper.should_stop("trial-1", 10, 0.))
+        self.assertTrue(stopper.should_stop("trial-2", 10, 0.2))
+        self.assertFalse(stopper.should_stop("trial-3", 10, 0.8))
+        # Grace period
+        stopper.should_stop("trial-0", 5, 1.)
+        stopper.should_stop("trial-1", 5, 1.)
+        self.assertFalse(stopper.should_stop("trial-2", 5, 0.))
+
+    def test_run_sweep(self):
+        trials = [dict(overrides, **{"agents.lr": lr}) for lr in [0.01, 0.001]]
+        with tempfile.TemporaryDirectory() as path:
+            summaries = run_sweep(trials, "./config", path, n_processes=2, seed=0,
+                                  early_stopping={"grace_episodes": 0})
+            self.assertEqual(sorted(summary["trial"] for summary in summaries), ["trial-0", "trial-1"])
+            for summary in summaries:
+                self.assertIn(summary["episodes"], [2, 3])
+                self.assertEqual(summary["status"], "stopped" if summary["episodes"] < 3 else "completed")
+                for name in ["config/default.yaml", "models/predator-0.pth", "returns.csv"]:
+                    self.assertTrue(os.path.exists(os.path.join(path, summary["trial"], name)))
+            with open(os.path.join(path, "summary.csv")) as file:
+                self.assertEqual(len(list(csv.DictReader(file))), 2)
+
+    def test_failed_trial(self):
+        with tempfile.TemporaryDirectory() as path:
+            summary = run_trial("trial-0", dict(overrides, **{"agents.lrr": 0.01}), "./config", path)
+        self.assertEqual(summary["status"], "error")
+        self.assertIn("agents.lrr", summary["error"])
+        self.assertIsNone(summary["best_return"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+import os
+import tempfile
+import unittest
+
+import matplotlib
+import numpy as np
+from PIL import Image
+
+matplotlib.use("agg")
+import matplotlib.pyplot as plt
+
+from sim.env import Env
+from sim.render import BoardRenderer, RasterRenderer, render_trace
+from sim.trace import TraceStore, get_trace, get_trace_store, load_trace
+import utils
+from utils import Metrics
+
+from helpers import config, make_agents
+
+
+def make_env():
+    env = Env(config.env, config)
+    agents = make_agents()
+    for agent in agents:
+        env.add_agent(agent)
+    return env, agents
+
+
+class TestTrace(unittest.TestCase):
+
+    def test_record(self):
+        env, agents = make_env()
+        trace = get_trace(env)
+        all_states, all_rewards, all_types = utils.test(env, agents, Metrics(), [Metrics() for _ in agents], config,
+                                                        trace=trace)
+        self.assertEqual(len(trace), len(all_states))
+        np.testing.assert_allclose(trace.get_states(), np.array(all_states), rtol=1e-6)
+        self.assertEqual(trace.get_types(), all_types)
+        np.testing.assert_allclose(np.array(trace.rewards), np.array(all_rewards), rtol=1e-6)
+        with tempfile.TemporaryDirectory() as path:
+            trace.save(os.path.join(path, "episode.npz"))
+            loaded = load_trace(os.path.join(path, "episode.npz"))
+        self.assertEqual(loaded.agent_ids, [agent.id for agent in agents])
+        np.testing.assert_array_equal(loaded.observations, trace.observations)
+        np.testing.assert_array_equal(loaded.get_magic_switch(), trace.get_magic_switch())
+
+    def test_render(self):
+        env, agents = make_env()
+        trace = get_trace(env)
+        env.reset(test=True)
+        for _ in range(3):
+            trace.record(env.get_compact_state(), np.zeros(len(agents)))
+            env.step(None, np.zeros(len(agents), dtype=int))
+        with tempfile.TemporaryDirectory() as path:
+            trace.save(os.path.join(path, "episode.npz"))
+            render_trace(os.path.join(path, "episode.npz"), os.path.join(path, "frames"), config)
+            self.assertEqual(sorted(os.listdir(os.path.join(path, "frames"))), ["frame-0.jpg", "frame-1.jpg",
+                                                                                "frame-2.jpg"])
+            render_trace(os.path.join(path, "episode.npz"), os.path.join(path, "episode.gif"), config)
+            with Image.open(os.path.join(path, "episode.gif")) as gif:
+                self.assertEqual(gif.n_frames, 3)
+            render_trace(os.path.join(path, "episode.npz"), os.path.join(path, "raster.gif"), config, raster=True)
+            with Image.open(os.path.join(path, "raster.gif")) as gif:
+                self.assertEqual(gif.n_frames, 3)
+
+    def test_store(self):
+        env, agents = make_env()
+        traces = []
+        for _ in range(3):
+            trace = get_trace(env)
+            utils.test(env, agents, Metrics(), [Metrics() for _ in agents], config, trace=trace)
+            traces.append(trace)
+        with tempfile.TemporaryDirectory() as path:
+            store = get_trace_store(env, path)
+            for k, trace in enumerate(traces):
+                store.add_episode(trace, episode=10 * k, test=k != 1)
+            store.flush()
+            # Not flushed: dropped when the store is reopened
+            store.add_episode(traces[0])
+            self.assertEqual(len(store), 4)
+
+            store = TraceStore(path)
+            self.assertEqual(len(store), 3)
+            self.assertEqual(store.n_steps, sum(len(trace) for trace in traces))
+            store.add_episode(traces[0], episode=30)
+            store.close()
+            self.assertEqual(os.path.getsize(os.path.join(path, "rewards.bin")),
+                             4 * len(agents) * store.n_steps)
+            store = TraceStore(path)
+            np.testing.assert_array_equal(store.get_episode(3).observations, traces[0].observations)
+            self.assertEqual(store.find_episode(20), 2)
+            self.assertRaises(KeyError, store.find_episode, 10)
+            for k, trace in enumerate(traces):
+                loaded = load_trace(path, k)
+                np.testing.assert_array_equal(loaded.observations, trace.observations)
+                np.testing.assert_array_equal(loaded.rewards, trace.rewards)
+                np.testing.assert_array_equal(loaded.actions, trace.actions)
+            self.assertEqual(store.read("rewards", 2, 5).shape, (3, len(agents)))
+
+            # Resumed training: the episodes played after the checkpoint are dropped and played again
+            state = store.state_dict()
+            store.add_episode(traces[1], episode=40)
+            store.flush()
+            store = TraceStore(path)
+            store.load_state_dict(state)
+            self.assertEqual(len(store), 4)
+            store.add_episode(traces[2], episode=40)
+            store.close()
+            store = TraceStore(path)
+            self.assertEqual(store.episodes, [0, 10, 20, 30, 40])
+            np.testing.assert_array_equal(store.get_episode(store.find_episode(40)).observations,
+                                          traces[2].observations)
+            self.assertEqual(os.path.getsize(os.path.join(path, "rewards.bin")),
+                             4 * len(agents) * store.n_steps)
+
+    def test_board_renderer(self):
+        env, agents = make_env()
+        states, types = env.reset(test=True)
+        fig = plt.figure()
+        renderer = BoardRenderer(env, fig.add_subplot(111))
+        renderer.draw(states, types, np.zeros(len(agents)))
+        self.assertIsNotNone(renderer.background)
+        n_artists = len(renderer.ax.get_children())
+        states, _, _, _, types = env.step(states, np.ones(len(agents), dtype=int))
+        renderer.draw(states, types, np.ones(len(agents)))
+        self.assertEqual(len(renderer.ax.get_children()), n_artists)
+        self.assertEqual(renderer.markers[0].center, (states[0][0], states[0][1]))
+        plt.close(fig)
+
+    def test_raster(self):
+        renderer = RasterRenderer(4, [(1, 1)], cell_size=10)
+        frame = renderer.render([[0, 0, 0], [3, 2, 0]], [True, False], magic_switch=(2, 3))
+        self.assertEqual(frame.shape, (40, 40, 3))
+        np.testing.assert_array_equal(frame[25, 15], [0, 0, 0])  # Obstacle
+        np.testing.assert_array_equal(frame[5, 25], [128, 0, 128])  # Switch
+        np.testing.assert_array_equal(frame[35, 5], RasterRenderer.colors["predator"])
+        np.testing.assert_array_equal(frame[15, 35], RasterRenderer.colors["prey"])
+
+
+if __name__ == '__main__':
+    unittest.main()
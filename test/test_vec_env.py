@@ -0,0 +1,96 @@
+import unittest
+
+import numpy as np
+
+from sim.env import Env
+from sim.rewards import reward_full
+from sim.vec_env import VecEnv
+from sim.agents.agents import Agent
+
+from helpers import config, make_agents, make_config
+
+
+def make_env(n_envs=4, **env):
+    env_config = make_config(env=env)
+    vec_env = VecEnv(env_config.env, env_config, n_envs)
+    for agent in make_agents(Agent, 2, 1):
+        vec_env.add_agent(agent)
+    return vec_env
+
+
+class TestVecEnv(unittest.TestCase):
+
+    def test_shapes(self):
+        vec_env = make_env()
+        states, types = vec_env.reset()
+        state_dim = 3 * 3 + 2 * len(config.env.obstacles) + 2 + 3
+        self.assertEqual(states.shape, (4, 3, state_dim))
+        self.assertEqual(types.shape, (4, 3))
+        next_states, rewards, terminals, n_collisions, types = vec_env.step(np.zeros((4, 3), dtype=int))
+        self.assertEqual(next_states.shape, (4, 3, state_dim))
+        self.assertEqual(rewards.shape, (4, 3))
+        self.assertEqual(terminals.shape, (4,))
+        self.assertEqual(n_collisions.shape, (4,))
+
+    def test_walls_and_obstacles(self):
+        vec_env = make_env(n_envs=1, noise=0, magic_switch=False, obstacles=[[1, 1]])
+        vec_env.reset()
+        vec_env.positions[0] = [[0, 0, 0], [1, 0, 0], [0, 1, 0]]
+        # Left against the wall, Front into the obstacle, Right into the obstacle
+        vec_env.step(np.array([[2, 1, 4]]))
+        np.testing.assert_array_equal(vec_env.positions[0], [[0, 0, 0], [1, 0, 0], [0, 1, 0]])
+        vec_env.step(np.array([[1, 4, 3]]))
+        np.testing.assert_array_equal(vec_env.positions[0], [[0, 1, 0], [2, 0, 0], [0, 0, 0]])
+
+    def test_infinite_world(self):
+        vec_env = make_env(n_envs=1, noise=0, magic_switch=False, infinite_world=True, obstacles=[])
+        vec_env.reset()
+        vec_env.positions[0] = [[0, 0, 0], [14, 14, 0], [3, 3, 0]]
+        vec_env.step(np.array([[2, 1, 0]]))
+        np.testing.assert_array_equal(vec_env.positions[0], [[14, 0, 0], [14, 0, 0], [3, 3, 0]])
+
+    def test_magic_switch(self):
+        vec_env = make_env(n_envs=2, noise=0, magic_switch=True, obstacles=[])
+        vec_env.reset()
+        types = vec_env.is_predator.copy()
+        vec_env.magic_switch[:] = [5, 5]
+        vec_env.positions[:] = [[4, 5, 0], [0, 0, 0], [9, 9, 0]]
+        vec_env.step(np.array([[4, 0, 0], [0, 0, 0]]))
+        np.testing.assert_array_equal(vec_env.is_predator[0], ~types[0])
+        np.testing.assert_array_equal(vec_env.is_predator[1], types[1])
+
+    def test_collisions(self):
+        vec_env = make_env(n_envs=1, noise=0, magic_switch=False, obstacles=[])
+        vec_env.reset()
+        vec_env.positions[0] = [[2, 2, 0], [2, 2, 0], [2, 2, 0]]
+        _, _, _, n_collisions, _ = vec_env.step(np.zeros((1, 3), dtype=int))
+        self.assertEqual(n_collisions[0], 2)
+
+    def test_compact_states(self):
+        vec_env = make_env()
+        states, _ = vec_env.reset()
+        np.testing.assert_array_equal(vec_env.encoder.decode_agents(vec_env.get_compact_states()), states)
+
+    def test_rewards_match_env(self):
+        # The second predator is next to an obstacle, the first one against the walls
+        for reward in [{}, {"hot_walls": True}, {"hot_walls": True, "hot_obstacles": True}]:
+            env_config = make_config(reward=reward, env={"noise": 0})
+            env = Env(env_config.env, env_config)
+            agents = make_agents(Agent, 2, 1, env_config)
+            for agent in agents:
+                env.add_agent(agent)
+            vec_env = VecEnv(env_config.env, env_config, 1)
+            for agent in agents:
+                vec_env.add_agent(agent)
+            vec_env.reset()
+            vec_env.is_predator[0] = [agent.type == "predator" for agent in agents]
+            vec_env.positions[0] = [[0, 0, 0], [2, 2, 0], [12, 4, 0]]
+            positions = list(vec_env.positions[0].flatten() / env_config.env.board_size)
+            expected = reward_full(positions, agents, None, env.grid.near_obstacle_grid, 0, env_config)
+            np.testing.assert_allclose(vec_env._get_rewards()[0], expected, rtol=1e-6)
+            self.assertEqual(expected[0] == -1, reward.get("hot_walls", False))
+            self.assertEqual(expected[1] == -1, reward.get("hot_obstacles", False))
+
+
+if __name__ == '__main__':
+    unittest.main()
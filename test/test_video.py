@@ -0,0 +1,42 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+from PIL import Image
+
+from utils.video import GifWriter, get_video_writer, imageio_ffmpeg
+
+
+def make_frames(n_frames, size=16):
+    frames = np.zeros((n_frames, size, size, 3), dtype=np.uint8)
+    for k in range(n_frames):
+        frames[k, k % size] = 255
+    return frames
+
+
+class TestVideo(unittest.TestCase):
+    def test_gif(self):
+        frames = make_frames(5)
+        with tempfile.TemporaryDirectory() as path:
+            with GifWriter(os.path.join(path, "episode.gif"), fps=10) as writer:
+                for frame in frames:
+                    writer.write(frame)
+            with Image.open(os.path.join(path, "episode.gif")) as gif:
+                self.assertEqual(gif.n_frames, 5)
+                self.assertEqual(gif.info["duration"], 100)
+                for k in range(5):
+                    gif.seek(k)
+                    np.testing.assert_array_equal(np.array(gif.convert("RGB")), frames[k])
+
+    @unittest.skipIf(imageio_ffmpeg is None, "imageio-ffmpeg is not installed")
+    def test_mp4(self):
+        with tempfile.TemporaryDirectory() as path:
+            with get_video_writer(os.path.join(path, "episode.mp4")) as writer:
+                for frame in make_frames(5):
+                    writer.write(frame)
+            self.assertGreater(os.path.getsize(os.path.join(path, "episode.mp4")), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import tempfile
+import unittest
+
+import numpy as np
+
+from sim.env import Env
+from sim.agents.policy import BatchedPolicy
+from sim.checkpoint import CheckpointManager, get_checkpoint, restore_checkpoint
+from sim.memory import ReplayMemory
+from sim.workers import RolloutWorkers, play_episode, train_from_workers
+from utils import Metrics, LearningScheduler
+
+from helpers import config, make_agents
+
+
+class TestWorkers(unittest.TestCase):
+
+    def test_play_episode(self):
+        agents = make_agents()
+        env = Env(config.env, config)
+        for agent in agents:
+            env.add_agent(agent)
+        states, next_states, actions, rewards = play_episode(env, agents, BatchedPolicy(agents), 5)
+        n_steps = len(states)
+        self.assertLessEqual(n_steps, config.env.max_iterations)
+        self.assertEqual(states.shape, (n_steps, env.encoder.compact_dim))
+        self.assertEqual(states.dtype, np.int16)
+        np.testing.assert_array_equal(states[1:], next_states[:-1])
+        self.assertEqual(actions.shape, (n_steps, len(agents)))
+        self.assertEqual(rewards.shape, (n_steps, len(agents)))
+
+    def test_rollout_workers(self):
+        agents = make_agents()
+        workers = RolloutWorkers(agents, config, 2, seed=0)
+        workers.start()
+        try:
+            # The workers send compact observations
+            memory = ReplayMemory(1000, encoder=Env(config.env, config).encoder)
+            metrics = [Metrics() for _ in agents]
+            scheduler = LearningScheduler(warmup=10 ** 6)
+            self.assertRaises(AssertionError, train_from_workers, workers, agents, ReplayMemory(1000), metrics,
+                              config, scheduler)
+            states, _, _, _ = train_from_workers(workers, agents, memory, metrics, config, scheduler)
+            self.assertEqual(len(memory), len(states))
+            self.assertEqual(scheduler.env_steps, len(states))
+            self.assertEqual(agents[0].steps_done, len(states))
+            workers.broadcast()
+            self.assertEqual(workers.version.value, 1)
+            workers.get_episode(timeout=60)
+        finally:
+            workers.close()
+        self.assertFalse(any(process.is_alive() for process in workers.processes))
+
+    def test_resume(self):
+        agents = make_agents()
+        for agent in agents:
+            agent.steps_done = 100000
+        with tempfile.TemporaryDirectory() as path:
+            checkpoints = CheckpointManager(path, asynchronous=False)
+            checkpoints.save(get_checkpoint(3, agents))
+            agents = make_agents()
+            restore_checkpoint(checkpoints.load(), agents)
+        workers = RolloutWorkers(agents, config, 1, seed=0)
+        workers.start()
+        try:
+            states, _, _, _ = workers.get_episode(timeout=60)
+            # The exploration goes on from the checkpoint
+            self.assertEqual(agents[0].steps_done, 100000 + len(states))
+            workers.broadcast()
+            self.assertEqual(workers.shared_steps.value, 100000 + len(states))
+        finally:
+            workers.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
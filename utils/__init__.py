@@ -1,3 +1,17 @@
-from utils.config import *
-from utils.utils import *
-from utils.metrics import Metrics
+"""
+The names of the submodules are imported on first access (see `sim`).
+"""
+import importlib
+
+_modules = ["utils.config", "utils.metrics", "utils.scheduler", "utils.utils", "utils.video"]
+
+
+def __getattr__(name):
+    if not name.startswith("_"):
+        for module_name in _modules:
+            module = importlib.import_module(module_name)
+            if hasattr(module, name):
+                value = getattr(module, name)
+                globals()[name] = value
+                return value
+    raise AttributeError("module {} has no attribute {}".format(__name__, name))
@@ -1,3 +1,4 @@
+import copy
 import os
 import yaml
 
@@ -12,29 +13,69 @@ def update_config(conf, new_conf):
 
 
 class Config:
+    """
+    Configuration loaded from the yaml files of a folder: default.yaml, then the other files in alphabetical order.
+    The sections are built once, when the config is loaded, and the values are attributes of the instances:
+    config.env.world_3D is a plain attribute lookup. Use `set` to change a value.
+    """
+
     def __init__(self, path=None, config=None):
-        self.__is_none = False
-        self.__data = config if config is not None else {}
-        self.__is_none = False
+        data = config if config is not None else {}
         if path is not None:
             self.__path = os.path.abspath(os.path.join(os.curdir, path))
             with open(os.path.join(self.__path, "default.yaml"), "rb") as default_config:
-                self.__data.update(yaml.load(default_config))
+                data.update(yaml.load(default_config, Loader=yaml.FullLoader))
             for config in sorted(os.listdir(self.__path)):
                 if config != "default.yaml" and config[-4:] in ["yaml", "yml"]:
                     with open(os.path.join(self.__path, config), "rb") as config_file:
-                        self.__data = update_config(self.__data, yaml.load(config_file))
+                        data = update_config(data, yaml.load(config_file, Loader=yaml.FullLoader))
+        object.__setattr__(self, "_Config__data", data)
+        for key, value in data.items():
+            self.__cache(key, value)
+
+    def __cache(self, key, value):
+        # Sections share the dict of their parent: a value set in a section is seen from the parent
+        self.__dict__[key] = Config(config=value) if type(value) == dict else value
+
+    def __getstate__(self):
+        return self.__dict__
+
+    def __setstate__(self, state):
+        # Set before __getattr__ is used (pickling for the worker processes)
+        self.__dict__.update(state)
 
     def set(self, key, value):
         self.__data[key] = value
+        self.__cache(key, value)
 
-    def __dir__(self):
-        return super().__dir__() + self.__data.keys()
+    def __setattr__(self, key, value):
+        if key.startswith("_"):
+            object.__setattr__(self, key, value)
+        else:
+            raise AttributeError("Config values are read only, please use Config.set.")
 
     def __getattr__(self, item):
-        if type(self.__data[item]) == dict:
-            return Config(config=self.__data[item])
-        return self.__data[item]
+        # Only called for the keys that are not in the config
+        raise AttributeError("The config has no key {}.".format(item))
 
     def __getitem__(self, item):
         return self.__data[item]
+
+    def to_dict(self):
+        """
+        Returns: a copy of the values as nested dicts (e.g. to save the config in a yaml file)
+        """
+        return copy.deepcopy(self.__data)
+
+
+_default_config = None
+
+
+def get_default_config():
+    """
+    Returns: the config in ./config, loaded on the first call only
+    """
+    global _default_config
+    if _default_config is None:
+        _default_config = Config('./config')
+    return _default_config
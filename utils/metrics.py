@@ -15,6 +15,21 @@ class Metrics:
         self.loss_actor = []
         self.collision_count_buffer = []
 
+    def state_dict(self):
+        """
+        Returns: copy of the curves and of the values not averaged yet, to resume a training
+        """
+        return {"data": {name: list(values) for name, values in self.data.items()},
+                "loss_buffer": list(self.loss_buffer), "returns_buffer": list(self.returns_buffer),
+                "loss_actor": list(self.loss_actor), "collision_count_buffer": list(self.collision_count_buffer)}
+
+    def load_state_dict(self, state_dict):
+        self.data = {name: list(values) for name, values in state_dict["data"].items()}
+        self.loss_buffer = list(state_dict["loss_buffer"])
+        self.returns_buffer = list(state_dict["returns_buffer"])
+        self.loss_actor = list(state_dict["loss_actor"])
+        self.collision_count_buffer = list(state_dict["collision_count_buffer"])
+
     def add_return(self, value):
         self.returns_buffer.append(value)
 
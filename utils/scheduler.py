@@ -0,0 +1,61 @@
+import time
+
+
+class LearningScheduler:
+    """
+    Decides when the agents learn during the training: once the replay memory holds warmup transitions,
+    gradient_steps updates are done every train_every environment steps.
+    Also measures the environment steps and the updates per second.
+    """
+
+    def __init__(self, train_every=1, gradient_steps=1, warmup=0):
+        assert train_every >= 1, "train_every must be at least 1."
+        self.train_every = train_every
+        self.gradient_steps = gradient_steps
+        self.warmup = warmup
+
+        self.env_steps = 0
+        self.updates = 0
+        self._last_time = time.perf_counter()
+        self._last_env_steps = 0
+        self._last_updates = 0
+
+    def step(self, memory_length, n_steps=1):
+        """
+        Records environment steps.
+        Args:
+            memory_length: number of transitions in the replay memory
+            n_steps: number of environment steps (one per environment for vectorized environments)
+        Returns: number of gradient steps to do now
+        """
+        previous_env_steps = self.env_steps
+        self.env_steps += n_steps
+        if memory_length < self.warmup:
+            return 0
+        n_updates = (self.env_steps // self.train_every - previous_env_steps // self.train_every) * self.gradient_steps
+        self.updates += n_updates
+        return n_updates
+
+    def get_rates(self):
+        """
+        Returns: (environment steps per second, updates per second) since the previous call
+        """
+        now = time.perf_counter()
+        elapsed = max(now - self._last_time, 1e-9)
+        rates = ((self.env_steps - self._last_env_steps) / elapsed, (self.updates - self._last_updates) / elapsed)
+        self._last_time = now
+        self._last_env_steps = self.env_steps
+        self._last_updates = self.updates
+        return rates
+
+
+def get_learning_scheduler(learning_config):
+    """
+    Returns: the `LearningScheduler` of the learning section of the config.
+        The warm-up is at least one batch, and 10 batches if it is not set.
+    """
+    warmup = learning_config.warmup
+    if warmup is None or warmup is False:
+        warmup = 10 * learning_config.batch_size
+    return LearningScheduler(learning_config.train_every, learning_config.gradient_steps,
+                             max(warmup, learning_config.batch_size))
@@ -1,8 +1,7 @@
 import numpy as np
-import torch
 from typing import List, Tuple
-import matplotlib.pyplot as plt
-from matplotlib.animation import FuncAnimation
+
+from utils.scheduler import get_learning_scheduler
 
 
 def compute_discounted_return(gamma, rewards):
@@ -45,6 +44,8 @@ def to_onehot(values, max):
     Returns:
 
     """
+    import torch
+
     return torch.zeros(values.size(0), max).type_as(values).scatter_(1, values, 1).to(torch.float)
 
 
@@ -54,7 +55,67 @@ def np_to_onehot(values, max):
     return onehot
 
 
-def train(env, agents, memory, metrics, action_dim, config, agents_type="dqn"):
+def draw_actions(agents, states, policy=None, no_exploration=False):
+    """
+    Args:
+        agents:
+        states: state of each agent
+        policy: `sim.agents.BatchedPolicy` of the agents. If None, every agent draws its action in turn.
+        no_exploration: If True, use only exploitation policy
+    Returns: list of the actions
+    """
+    if policy is not None:
+        return policy.draw_actions(states, no_exploration).tolist()
+    return [agents[i].draw_action(states[i], no_exploration=no_exploration) for i in range(len(agents))]
+
+
+def learn(agents, memory, metrics, config, agents_type="dqn", learner=None):
+    """
+    One gradient step of all the agents on a batch of the replay memory.
+    Args:
+        learner: `sim.agents.MultiAgentDQNLearner` or `sim.agents.MultiAgentMADDPGLearner` of the agents.
+            If None, every agent learns in turn.
+    """
+    # Get batch for learning (batch_size x n_agents x dim)
+    batch = memory.get_batch(config.learning.batch_size, shuffle=config.replay_memory.shuffle)
+    if batch is None:
+        return
+    weights, indices = None, None
+    if hasattr(memory, "update_priorities"):  # Prioritized replay memory
+        batch, weights, indices = batch[:4], batch[4], batch[5]
+    if learner is not None and agents_type == 'maddpg':  # All the agents learn in one step
+        losses_critic, losses_actor = learner.learn(batch, weights)
+        for k in range(len(agents)):
+            metrics[k].add_loss(losses_critic[k])
+            metrics[k].add_loss_actor(losses_actor[k])
+    elif learner is not None:
+        for k, loss in enumerate(learner.learn(batch, weights)):
+            metrics[k].add_loss(loss)
+    else:
+        for k in range(len(agents)):
+            if agents_type == 'maddpg':
+                loss_critic, loss_actor = agents[k].learn(batch, weights)
+                metrics[k].add_loss(loss_critic)
+                metrics[k].add_loss_actor(loss_actor)
+            else:
+                loss = agents[k].learn((batch[0][:, k], batch[1][:, k], batch[2][:, k], batch[3][:, k]), weights)
+                metrics[k].add_loss(loss)
+    if indices is not None:
+        # The memory is shared by all the agents: use the largest error
+        memory.update_priorities(indices, np.max([agent.td_errors for agent in agents], axis=0))
+
+
+def train(env, agents, memory, metrics, action_dim, config, agents_type="dqn", policy=None, learner=None,
+          scheduler=None, trace=None):
+    """
+    Plays one training episode.
+    Args:
+        scheduler: `utils.LearningScheduler` deciding when the agents learn. Keep the same one for all the episodes.
+            If None, one is made from the config for this episode.
+        trace: `sim.trace.EpisodeTrace` recording the episode (see `sim.trace.TraceStore`).
+    """
+    if scheduler is None:
+        scheduler = get_learning_scheduler(config.learning)
     all_rewards = []
     all_states = []
     all_next_states = []
@@ -62,15 +123,17 @@ def train(env, agents, memory, metrics, action_dim, config, agents_type="dqn"):
     all_types = []
 
     states, types = env.reset()
+    # Compact memories only store what changes on the board
+    compact = memory.encoder is not None
+    compact_states = env.get_compact_state() if compact or trace is not None else None
     terminal = False
     step_k = 0
     while not terminal:
-        actions = []
-        for i in range(len(agents)):
-            action = agents[i].draw_action(states[i])
-            actions.append(action)
+        actions = draw_actions(agents, states, policy)
         all_types.append(types)
         next_states, rewards, terminal, n_collisions, types = env.step(states, actions)
+        if trace is not None:
+            trace.record(compact_states, rewards, actions)
         all_rewards.append(rewards)
         all_states.append(states)
         all_next_states.append(next_states)
@@ -81,40 +144,41 @@ def train(env, agents, memory, metrics, action_dim, config, agents_type="dqn"):
         if agents_type == "maddpg":
             actions = np_to_onehot(actions, action_dim)
 
-        memory.add(states, next_states, actions, rewards)
-
-        # Learning step
-        # Get batch for learning (batch_size x n_agents x dim)
-        batch = memory.get_batch(config.learning.batch_size, shuffle=config.replay_memory.shuffle)
+        if compact_states is not None:
+            compact_next_states = env.get_compact_state()
+            if compact:
+                memory.add(compact_states, compact_next_states, actions, rewards)
+            compact_states = compact_next_states
+        if not compact:
+            memory.add(states, next_states, actions, rewards)
 
-        if batch is not None:
-            for k in range(len(agents)):
-                if agents_type == 'maddpg':
-                    loss_critic, loss_actor = agents[k].learn(batch)
-                    metrics[k].add_loss(loss_critic)
-                    metrics[k].add_loss_actor(loss_actor)
-                else:
-                    loss = agents[k].learn((batch[0][:, k], batch[1][:, k], batch[2][:, k], batch[3][:, k]))
-                    metrics[k].add_loss(loss)
+        # Learning steps
+        for _ in range(scheduler.step(len(memory))):
+            learn(agents, memory, metrics, config, agents_type, learner)
 
         states = next_states
 
     return all_states, all_next_states, all_rewards, all_actions, all_types
 
 
-def test(env, agents, collision_metric, metrics, config):
+def test(env, agents, collision_metric, metrics, config, policy=None, trace=None):
+    """
+    Plays one test episode.
+    Args:
+        trace: `sim.trace.EpisodeTrace` recording the episode to render or analyse it offline.
+    """
     all_states = []
     all_rewards = []
     all_types = []
     states, types = env.reset(test=True)
     terminal = False
     while not terminal:
-        actions = []
-        for i in range(len(agents)):
-            action = agents[i].draw_action(states[i], no_exploration=True)
-            actions.append(action)
+        actions = draw_actions(agents, states, policy, no_exploration=True)
         all_types.append(types)
+        observation = env.get_compact_state() if trace is not None else None
         next_states, rewards, terminal, n_collisions, types = env.step(states, actions)
+        if trace is not None:
+            trace.record(observation, rewards, actions)
         collision_metric.add_collision_count(n_collisions)
         all_rewards.append(rewards)
         all_states.append(states)
@@ -130,6 +194,9 @@ def test(env, agents, collision_metric, metrics, config):
 
 
 def make_gif(env, fig, ax, states, rewards, types):
+    import matplotlib.pyplot as plt
+    from matplotlib.animation import FuncAnimation
+
     def update(k):
         ax.cla()
         env.plot(states[k], types[k], rewards[k], ax)
@@ -0,0 +1,95 @@
+import os
+
+import numpy as np
+from PIL import GifImagePlugin, Image
+
+try:
+    import imageio_ffmpeg
+except ImportError:  # Optional, only needed to write MP4 videos
+    imageio_ffmpeg = None
+
+
+class GifWriter:
+    """
+    Writes a GIF frame by frame: every frame is encoded and written when given, nothing is kept in memory.
+    All the frames use the same web palette so that the color table is written once in the header.
+    """
+
+    def __init__(self, path, fps=12):
+        self.path = path
+        self.duration = int(round(1000 / fps))
+        self.palette = Image.new("RGB", (1, 1)).convert("P", palette=Image.Palette.WEB)
+        self.file = open(path, "wb")
+        self.n_frames = 0
+
+    def write(self, frame):
+        """
+        Args:
+            frame: RGB image of size (height, width, 3), uint8
+        """
+        image = Image.fromarray(np.ascontiguousarray(frame[..., :3])).quantize(palette=self.palette)
+        if not self.n_frames:
+            header, _ = GifImagePlugin.getheader(image, None, {"loop": 0, "duration": self.duration})
+            for chunk in header:
+                self.file.write(chunk)
+        for chunk in GifImagePlugin.getdata(image, duration=self.duration, loop=0):
+            self.file.write(chunk)
+        self.n_frames += 1
+
+    def close(self):
+        if not self.file.closed:
+            self.file.write(b";")  # GIF trailer
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class Mp4Writer:
+    """
+    Writes an H.264 MP4 frame by frame through a pipe to ffmpeg (needs the imageio-ffmpeg package).
+    """
+
+    def __init__(self, path, fps=12):
+        if imageio_ffmpeg is None:
+            raise ImportError("MP4 export needs imageio-ffmpeg: pip install imageio-ffmpeg")
+        self.path = path
+        self.fps = fps
+        self.writer = None
+        self.n_frames = 0
+
+    def write(self, frame):
+        """
+        Args:
+            frame: RGB image of size (height, width, 3), uint8. All the frames must have the same size.
+        """
+        frame = np.ascontiguousarray(frame[..., :3])
+        if self.writer is None:
+            height, width, _ = frame.shape
+            self.writer = imageio_ffmpeg.write_frames(self.path, (width, height), fps=self.fps, macro_block_size=1)
+            self.writer.send(None)
+        self.writer.send(frame)
+        self.n_frames += 1
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def get_video_writer(path, fps=12):
+    """
+    Returns: a `GifWriter` or a `Mp4Writer` depending on the extension of path
+    """
+    extension = os.path.splitext(path)[1].lower()
+    assert extension in [".gif", ".mp4"], "Videos must be .gif or .mp4 files."
+    return GifWriter(path, fps) if extension == ".gif" else Mp4Writer(path, fps)